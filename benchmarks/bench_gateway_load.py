@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import OrderedDict
+
+from fake_bot import (FakeChannel, FakeMarket, FakeMessage, FakeServer, FakeUser,
+                      make_listings, make_workdir, remove_workdir, summarize)
+
+
+CMB_ADMIN = "CMB ADMIN"
+BOT_USER_ID = 1
+CHATTER = ["lol", "gm everyone", "anyone watching the game tonight?",
+           "https://example.com/some/link", "ok", ":thumbsup:", "brb",
+           "what do you think about the new update", "!play some song"]
+CUSTOM_PREFIXES = ["!", "?", "c!", ">"]
+
+
+class LoadGenerator:
+    """
+    Builds messages of a configurable mix from simulated servers and users
+
+    Every message is sent in a channel of its own so the replies can be
+    matched to the message that caused them.
+    """
+
+    def __init__(self, mix, servers, users, admin_share, custom_share, coins, seed=0):
+        self.rng = random.Random(seed)
+        self.mix = list(mix.items())
+        self.servers = [FakeServer(10000 + i) for i in range(servers)]
+        self.prefixes = {}
+        for server in self.servers:
+            if self.rng.random() < custom_share:
+                self.prefixes[server.id] = self.rng.choice(CUSTOM_PREFIXES)
+        self.users = [FakeUser(20000 + i,
+                               [CMB_ADMIN] if self.rng.random() < admin_share else [])
+                      for i in range(users)]
+        self.coins = coins
+        self.channels = {}
+        self.next_channel = 100000
+
+    def _kind(self):
+        pick = self.rng.random() * sum(weight for _, weight in self.mix)
+        for kind, weight in self.mix:
+            pick -= weight
+            if pick < 0:
+                return kind
+        return self.mix[-1][0]
+
+    def _content(self, kind, prefix):
+        rng = self.rng
+        if kind == "chatter":
+            return rng.choice(CHATTER)
+        if kind == "mention":
+            return "<@{}> hello".format(BOT_USER_ID)
+        coin = self.coins[min(int(rng.paretovariate(1.2)) - 1, len(self.coins) - 1)]
+        if kind == "search":
+            return "{}s {}".format(prefix, coin["slug"])
+        if kind == "alert":
+            return "{}adda {} {} {:.2f}".format(prefix, coin["slug"],
+                                                rng.choice(["<", ">"]),
+                                                coin["quote"]["USD"]["price"] * 1.1)
+        return "{}sub {}".format(prefix, rng.choice(["USD", "EUR"]))
+
+    def make_message(self):
+        """
+        @return - (kind of message, message)
+        """
+        server = self.rng.choice(self.servers)
+        channel = FakeChannel(self.next_channel, server)
+        self.next_channel += 1
+        self.channels[channel.id] = channel
+        kind = self._kind()
+        content = self._content(kind, self.prefixes.get(server.id, "$"))
+        return kind, FakeMessage(content, self.rng.choice(self.users), channel)
+
+
+class ReplyRecorder:
+    """Replaces sending to Discord and times replies per channel"""
+
+    def __init__(self):
+        self.sent_at = {}
+        self.kinds = {}
+        self.replied_at = {}
+        self.unexpected = 0
+
+    def expect(self, channel_id, kind, sent_at):
+        self.sent_at[channel_id] = sent_at
+        self.kinds[channel_id] = kind
+
+    async def send_message(self, destination, content=None, *, tts=False, embed=None):
+        channel_id = getattr(destination, "id", None)
+        if self.kinds.get(channel_id, "chatter") == "chatter":
+            self.unexpected += 1
+        elif channel_id not in self.replied_at:
+            self.replied_at[channel_id] = time.perf_counter()
+
+
+def set_up_bot(generator, recorder, coins):
+    """
+    Imports the bot and loads its cogs with Discord and CoinMarketCap
+    replaced by fakes
+    """
+    import bot as bot_module
+    bot = bot_module.bot
+    bot.user = FakeUser(BOT_USER_ID, bot=True)
+    bot_module.message_filter.set_bot_user(bot.user.id)
+    bot.send_message = recorder.send_message
+    bot.get_channel = generator.channels.get
+
+    async def get_user_info(user_id):
+        return FakeUser(user_id)
+
+    async def change_presence(game=None):
+        pass
+    bot.get_user_info = get_user_info
+    bot.change_presence = change_presence
+    bot_module.load_cogs()
+    core = bot.cmd_function
+    core.coin_market.market = FakeMarket(make_listings(coins))
+    return bot, core
+
+
+async def wait_for_market(core):
+    while not core.cmc.market_list:
+        await asyncio.sleep(0.01)
+
+
+async def generate(bot, generator, recorder, rate, duration):
+    """
+    Dispatches messages at the target rate the way the gateway does
+
+    @return - (messages sent, seconds spent behind schedule at most)
+    """
+    count = int(rate * duration)
+    started = time.perf_counter()
+    behind = 0.0
+    for i in range(count):
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            behind = max(behind, -delay)
+        kind, message = generator.make_message()
+        recorder.expect(message.channel.id, kind, time.perf_counter())
+        bot.dispatch('message', message)
+    return count, behind
+
+
+def report(recorder, count, elapsed, behind, deadline):
+    by_kind = OrderedDict()
+    for channel_id, kind in recorder.kinds.items():
+        if kind == "chatter":
+            continue
+        replied_at = recorder.replied_at.get(channel_id)
+        entry = by_kind.setdefault(kind, {"latencies": [], "dropped": 0})
+        if replied_at is None:
+            entry["dropped"] += 1
+        else:
+            entry["latencies"].append(replied_at - recorder.sent_at[channel_id])
+    print("{} messages in {:.2f}s ({:.0f}/s), at most {:.3f}s behind schedule"
+          "".format(count, elapsed, count / elapsed, behind))
+    print("{:<8} {:>7} {:>8} {:>6} {:>9} {:>9} {:>9}"
+          "".format("kind", "replied", "dropped", "late", "p50 ms", "p99 ms", "max ms"))
+    for kind, entry in by_kind.items():
+        summary = summarize(entry["latencies"], elapsed)
+        late = sum(1 for latency in entry["latencies"] if latency > deadline)
+        print("{:<8} {:>7} {:>8} {:>6} {:>9.2f} {:>9.2f} {:>9.2f}"
+              "".format(kind, summary["count"], entry["dropped"], late,
+                        summary["p50"] * 1e3, summary["p99"] * 1e3,
+                        summary["max"] * 1e3))
+    print("{} replies to messages that weren't meant for the bot".format(recorder.unexpected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pushes a mix of chatter and "
+                                     "commands from simulated servers through "
+                                     "on_message at a target rate and reports "
+                                     "reply latency and dropped or late replies. "
+                                     "Rate limited commands count as dropped.")
+    parser.add_argument("--rate", type=float, default=500, help="messages per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--deadline", type=float, default=1.0,
+                        help="seconds after which a reply counts as late")
+    parser.add_argument("--drain", type=float, default=5.0,
+                        help="seconds to wait for replies after the last message")
+    parser.add_argument("--servers", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--admin-share", type=float, default=0.05)
+    parser.add_argument("--custom-share", type=float, default=0.2,
+                        help="share of servers with a custom prefix")
+    parser.add_argument("--coins", type=int, default=5000)
+    parser.add_argument("--chatter", type=float, default=0.9)
+    parser.add_argument("--search", type=float, default=0.07)
+    parser.add_argument("--alert", type=float, default=0.01)
+    parser.add_argument("--sub", type=float, default=0.005)
+    parser.add_argument("--mention", type=float, default=0.015)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    mix = OrderedDict([("chatter", args.chatter), ("search", args.search),
+                       ("alert", args.alert), ("sub", args.sub),
+                       ("mention", args.mention)])
+    generator = LoadGenerator(mix, args.servers, args.users, args.admin_share,
+                              args.custom_share, make_listings(args.coins)["data"],
+                              args.seed)
+    recorder = ReplyRecorder()
+    workdir = make_workdir({"subscriber_capacity": args.servers * 10})
+    with open(os.path.join(workdir, "prefixes.json"), 'w') as outfile:
+        json.dump(generator.prefixes, outfile)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        bot, core = set_up_bot(generator, recorder, args.coins)
+        bot.loop.run_until_complete(wait_for_market(core))
+        started = time.perf_counter()
+        count, behind = bot.loop.run_until_complete(generate(bot, generator, recorder,
+                                                             args.rate, args.duration))
+        elapsed = time.perf_counter() - started
+        bot.loop.run_until_complete(asyncio.sleep(args.drain))
+        core.update_task.cancel()
+        report(recorder, count, elapsed, behind, args.deadline)
+    finally:
+        os.chdir(cwd)
+        remove_workdir(workdir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
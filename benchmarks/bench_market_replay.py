@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit
+
+from fake_bot import (FakeBot, FakeChannel, FakeServer, make_listings,
+                      make_workdir, remove_workdir, summarize)
+
+
+SIMULATION_START = datetime.datetime(2018, 1, 1, 0, 1)
+HOURS_KEPT = 168
+
+
+class MarketSimulator:
+    """
+    Generates hourly listings as a random walk of every price
+
+    Coins are delisted and listed as it goes, and some new coins take the
+    symbol of an existing one.
+    """
+
+    def __init__(self, listings, volatility=0.02, delist_rate=0.001,
+                 new_coin_rate=0.001, duplicate_share=0.2, seed=0):
+        self.rng = random.Random(seed)
+        self.coins = [dict(coin, quote={"USD": dict(coin["quote"]["USD"])})
+                      for coin in listings["data"]]
+        self.volatility = volatility
+        self.delist_rate = delist_rate
+        self.new_coin_rate = new_coin_rate
+        self.duplicate_share = duplicate_share
+        self.prices = {coin["slug"]: deque([coin["quote"]["USD"]["price"]],
+                                           maxlen=HOURS_KEPT)
+                       for coin in self.coins}
+        self.next_id = len(self.coins) + 1
+        self.delisted = 0
+        self.listed = 0
+
+    def step(self):
+        """
+        Moves the market forward an hour
+        """
+        rng = self.rng
+        coins = []
+        for coin in self.coins:
+            if coin["cmc_rank"] > 2 and rng.random() < self.delist_rate:
+                self.delisted += 1
+                del self.prices[coin["slug"]]
+                continue
+            quote = coin["quote"]["USD"]
+            quote["price"] *= math.exp(rng.gauss(0, self.volatility))
+            quote["market_cap"] = quote["price"] * coin["circulating_supply"]
+            prices = self.prices[coin["slug"]]
+            prices.append(quote["price"])
+            for field, hours in (("percent_change_1h", 1),
+                                 ("percent_change_24h", 24),
+                                 ("percent_change_7d", HOURS_KEPT - 1)):
+                before = prices[max(len(prices) - 1 - hours, 0)]
+                quote[field] = (quote["price"] / before - 1) * 100
+            coins.append(coin)
+        new_coins = int(len(coins) * self.new_coin_rate + rng.random())
+        for _ in range(new_coins):
+            coins.append(self._new_coin(coins))
+        coins.sort(key=lambda coin: coin["quote"]["USD"]["market_cap"], reverse=True)
+        for rank, coin in enumerate(coins, 1):
+            coin["cmc_rank"] = rank
+        self.coins = coins
+
+    def _new_coin(self, coins):
+        rng = self.rng
+        coin_id = self.next_id
+        self.next_id += 1
+        self.listed += 1
+        if rng.random() < self.duplicate_share:
+            symbol = rng.choice(coins)["symbol"]
+        else:
+            symbol = "N{}".format(coin_id)
+        price = rng.uniform(0.001, 10)
+        supply = rng.uniform(1e6, 1e9)
+        slug = "new-coin-{}".format(coin_id)
+        self.prices[slug] = deque([price], maxlen=HOURS_KEPT)
+        return {"id": coin_id,
+                "name": "New Coin {}".format(coin_id),
+                "symbol": symbol,
+                "slug": slug,
+                "cmc_rank": len(coins) + 1,
+                "circulating_supply": supply,
+                "max_supply": None,
+                "quote": {"USD": {"price": price,
+                                  "volume_24h": rng.uniform(1e3, 1e6),
+                                  "market_cap": price * supply,
+                                  "percent_change_1h": 0.0,
+                                  "percent_change_24h": 0.0,
+                                  "percent_change_7d": 0.0}}}
+
+    def listings(self):
+        return {"data": self.coins}
+
+
+class ReplaySource:
+    """Serves listings recorded by an earlier run, one per update"""
+
+    def __init__(self, path):
+        with open(path) as infile:
+            self.snapshots = [line for line in infile if line.strip()]
+        self.position = 0
+        self.current = json.loads(self.snapshots[0])
+        self.delisted = 0
+        self.listed = 0
+
+    def step(self):
+        if self.position + 1 < len(self.snapshots):
+            self.position += 1
+            self.current = json.loads(self.snapshots[self.position])
+
+    def listings(self):
+        return self.current
+
+
+class MarketStub:
+    """
+    Local stand-in for the CoinMarketCap listings and stats endpoints
+
+    Every listings request after the first moves the market an hour, so
+    each update of the bot sees the next snapshot.
+    """
+
+    def __init__(self, source, listings_path, stats_path, record=None):
+        self.source = source
+        self.listings_path = listings_path
+        self.stats_path = stats_path
+        self.record = record
+        self.requests = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, request):
+        path = urlsplit(request.path).path
+        with self.lock:
+            if path == self.listings_path:
+                if self.requests:
+                    self.source.step()
+                self.requests += 1
+                body = json.dumps(self.source.listings())
+                if self.record is not None:
+                    self.record.write(body + "\n")
+            elif path == self.stats_path:
+                body = json.dumps(make_stats(self.source.listings()))
+            else:
+                request.send_error(404)
+                return
+        data = body.encode()
+        request.send_response(200)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+
+def make_stats(listings):
+    """
+    Builds the global metrics response that goes with some listings
+    """
+    quotes = [coin["quote"]["USD"] for coin in listings["data"]]
+    total_cap = sum(quote["market_cap"] for quote in quotes) or 1.0
+    caps = {coin["symbol"]: coin["quote"]["USD"]["market_cap"]
+            for coin in listings["data"][:2]}
+    return {"data": {"btc_dominance": caps.get("BTC", 0) / total_cap * 100,
+                     "eth_dominance": caps.get("ETH", 0) / total_cap * 100,
+                     "active_exchanges": 512,
+                     "active_cryptocurrencies": len(quotes),
+                     "quote": {"USD": {"total_market_cap": total_cap,
+                                       "total_volume_24h": sum(quote["volume_24h"]
+                                                               for quote in quotes)}}}}
+
+
+class SimulatedClock:
+    """
+    Clock for the update loop that runs faster than real time
+
+    @param speedup - simulated seconds per real second, 0 to never wait
+    """
+
+    def __init__(self, start=SIMULATION_START, speedup=0):
+        self.current = start
+        self.speedup = speedup
+
+    def now(self):
+        return self.current
+
+    async def sleep(self, seconds):
+        self.current += datetime.timedelta(seconds=seconds)
+        await asyncio.sleep(seconds / self.speedup if self.speedup else 0)
+
+
+def make_alerts(listings, count, volatility, capacity, channels, seed=0):
+    """
+    Builds price alerts a few hours of moves away from the current prices
+    """
+    rng = random.Random(seed)
+    coins = listings["data"]
+    alert_data = {}
+    for i in range(count):
+        coin = rng.choice(coins)
+        price = coin["quote"]["USD"]["price"]
+        target = price * math.exp(rng.gauss(0, volatility * 5))
+        user_alerts = alert_data.setdefault(str(100000 + i // capacity), {})
+        user_alerts[str(len(user_alerts) + 1)] = {"currency": coin["slug"],
+                                                  "channel": rng.choice(channels),
+                                                  "operation": ">" if target > price else "<",
+                                                  "price": "{:.6f}".format(target),
+                                                  "fiat": "USD"}
+    return alert_data
+
+
+def make_subscribers(listings, channels, seed=0):
+    """
+    Subscribes channels to a few of the top coins at various intervals
+    """
+    rng = random.Random(seed)
+    slugs = [coin["slug"] for coin in listings["data"][:300]]
+    return {channel: {"interval": rng.choice(["60", "120", "360"]),
+                      "purge": False,
+                      "fiat": rng.choice(["USD", "EUR"]),
+                      "currencies": rng.sample(slugs, 5)}
+            for channel in channels}
+
+
+async def wait_for_updates(core, updates):
+    while len(core.traces.traces) < updates:
+        await asyncio.sleep(0.01)
+
+
+def print_report(core, bot, source, simulated, elapsed):
+    traces = list(core.traces.traces)
+    print("{} updates, {} simulated in {:.2f}s"
+          "".format(len(traces), simulated, elapsed))
+    print("{} coins listed, {} delisted, {} messages sent"
+          "".format(source.listed, source.delisted, len(bot.sent)))
+    phases = {}
+    totals = {}
+    for trace in traces[1:]:
+        for span in trace.spans:
+            phases.setdefault(span.name, []).append(span.duration)
+            for key, value in span.counts.items():
+                totals[key] = totals.get(key, 0) + value
+        phases.setdefault("total", []).append(trace.duration)
+    print("{:<10} {:>10} {:>10} {:>10}".format("phase", "p50 ms", "p90 ms", "max ms"))
+    for name, durations in phases.items():
+        summary = summarize(durations, sum(durations))
+        print("{:<10} {:>10.2f} {:>10.2f} {:>10.2f}"
+              "".format(name, summary["p50"] * 1e3, summary["p90"] * 1e3,
+                        summary["max"] * 1e3))
+    print(", ".join("{}={}".format(key, value) for key, value in sorted(totals.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the full update loop "
+                                     "against a local stub of the CoinMarketCap "
+                                     "API serving a simulated or recorded "
+                                     "market, on simulated time, and reports "
+                                     "how long each phase of the updates took.")
+    parser.add_argument("--hours", type=int, default=48,
+                        help="simulated hours, one market update each")
+    parser.add_argument("--coins", type=int, default=5000)
+    parser.add_argument("--volatility", type=float, default=0.02,
+                        help="standard deviation of hourly log returns")
+    parser.add_argument("--delist-rate", type=float, default=0.001,
+                        help="chance of a coin being delisted each hour")
+    parser.add_argument("--new-coin-rate", type=float, default=0.001,
+                        help="new coins each hour relative to listed coins")
+    parser.add_argument("--duplicate-share", type=float, default=0.2,
+                        help="share of new coins reusing an existing symbol")
+    parser.add_argument("--alerts", type=int, default=20000)
+    parser.add_argument("--channels", type=int, default=300)
+    parser.add_argument("--speedup", type=float, default=0,
+                        help="simulated seconds per real second, 0 for as fast "
+                             "as possible")
+    parser.add_argument("--record", help="file to save the served listings to")
+    parser.add_argument("--replay", help="listings saved with --record to serve "
+                                         "instead of simulating")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.replay:
+        source = ReplaySource(args.replay)
+    else:
+        source = MarketSimulator(make_listings(args.coins, args.seed),
+                                 args.volatility, args.delist_rate,
+                                 args.new_coin_rate, args.duplicate_share,
+                                 args.seed)
+    record = open(args.record, 'w') if args.record else None
+    workdir = make_workdir({"alert_capacity": 10,
+                            "subscriber_capacity": args.channels,
+                            "update_trace_count": args.hours + 1})
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    stub = None
+    try:
+        # the bot's modules open error.log on import, so only import them
+        # once inside the scratch directory
+        from cogs.modules.coin_market import LISTINGS_ENDPOINT, STATS_ENDPOINT
+        import cogs.cog_manager
+        stub = MarketStub(source, LISTINGS_ENDPOINT, STATS_ENDPOINT, record)
+        stub.start()
+        with open("config.json") as config:
+            config_data = json.load(config)
+        config_data["cmc_api_url"] = stub.url
+        with open("config.json", 'w') as outfile:
+            json.dump(config_data, outfile, indent=4)
+        bot = FakeBot()
+        channel_ids = []
+        for i in range(args.channels):
+            channel = FakeChannel(5000 + i, FakeServer(i))
+            bot.channels[channel.id] = channel
+            channel_ids.append(channel.id)
+        clock = SimulatedClock(speedup=args.speedup)
+        cogs.cog_manager.setup(bot)
+        core = bot.cmd_function
+        core.clock = clock.now
+        core.sleep = clock.sleep
+        initial = source.listings()
+        core.alert.alert_data = make_alerts(initial, args.alerts, args.volatility,
+                                            10, channel_ids, args.seed)
+        core.subscriber.subscriber_data = make_subscribers(initial, channel_ids,
+                                                           args.seed)
+        started = time.perf_counter()
+        bot.loop.run_until_complete(wait_for_updates(core, args.hours + 1))
+        elapsed = time.perf_counter() - started
+        core.update_task.cancel()
+        print_report(core, bot, source, clock.current - SIMULATION_START, elapsed)
+    finally:
+        os.chdir(cwd)
+        remove_workdir(workdir)
+        if stub is not None:
+            stub.stop()
+        if record is not None:
+            record.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+from fake_bot import (FakeChannel, FakeMessage, FakeServer, FakeUser,
+                      make_workdir, remove_workdir)
+
+
+CHATTER = ["lol", "gm everyone", "anyone watching the game tonight?",
+           "https://example.com/some/link", "<@123456789> look at this",
+           "!play some song", "ok", "what do you think about the new update",
+           ":thumbsup:", "brb"]
+
+
+def make_stream(count, servers, custom_share, command_share, seed=0):
+    """
+    Builds a synthetic stream of messages across many servers
+
+    @param count - number of messages
+    @param servers - number of servers the messages come from
+    @param custom_share - share of servers with a custom prefix
+    @param command_share - share of messages that are bot commands
+    @return - (list of messages, dict of server id to custom prefix)
+    """
+    rng = random.Random(seed)
+    prefixes = {}
+    server_list = []
+    for server_id in range(servers):
+        server = FakeServer(server_id)
+        if rng.random() < custom_share:
+            prefixes[server.id] = rng.choice(["!", "?", "c!", ">"])
+        server_list.append(server)
+    channels = [FakeChannel(i, server) for i, server in enumerate(server_list)]
+    users = [FakeUser(i) for i in range(1000)]
+    messages = []
+    for _ in range(count):
+        channel = rng.choice(channels)
+        if rng.random() < command_share:
+            prefix = prefixes.get(channel.server.id, "$")
+            content = prefix + rng.choice(["s btc", "s eth eur", "topfive g", "geta"])
+        else:
+            content = rng.choice(CHATTER)
+        messages.append(FakeMessage(content, rng.choice(users), channel))
+    return messages, prefixes
+
+
+def legacy_on_message(bot_module):
+    """
+    The handler as it was before the prefilter, kept for comparison
+    """
+    bot = bot_module.bot
+    config_data = bot_module.config_data
+    prefix_list = bot_module.prefix_list
+
+    async def on_message(message):
+        if not message.author.bot:
+            if message.content.startswith("<@" + str(bot.user.id) + ">"):
+                return
+            else:
+                try:
+                    if message.server.id in prefix_list:
+                        server_prefix = prefix_list[message.server.id]
+                        if not message.content.startswith(server_prefix):
+                            return
+                        message.content = message.content.replace(server_prefix,
+                                                                  config_data["cmd_prefix"],
+                                                                  1)
+                    await bot_module.process_cmd(message)
+                except AttributeError:
+                    await bot_module.process_cmd(message)
+    return on_message
+
+
+def drive(handler, messages):
+    """
+    Feeds every message through the handler without an event loop
+
+    @return - seconds taken
+    """
+    started = time.perf_counter()
+    for message in messages:
+        coro = handler(message)
+        try:
+            coro.send(None)
+        except StopIteration:
+            pass
+        else:
+            coro.close()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feeds a synthetic message "
+                                     "stream through on_message and reports "
+                                     "the cost per message.")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--servers", type=int, default=5000)
+    parser.add_argument("--custom-share", type=float, default=0.2)
+    parser.add_argument("--command-share", type=float, default=0.02)
+    args = parser.parse_args()
+    workdir = make_workdir()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        messages, prefixes = make_stream(args.messages, args.servers,
+                                         args.custom_share, args.command_share)
+        import bot as bot_module
+        bot_module.bot.user = FakeUser(1, bot=True)
+        for server_id, prefix in prefixes.items():
+            bot_module.message_filter.set_prefix(server_id, prefix)
+        bot_module.message_filter.set_bot_user(bot_module.bot.user.id)
+        dispatched = []
+
+        async def process_cmd(message):
+            dispatched.append(message.content)
+        bot_module.process_cmd = process_cmd
+        originals = [message.content for message in messages]
+        for name, handler in (("legacy", legacy_on_message(bot_module)),
+                              ("filtered", bot_module.bot.on_message)):
+            for message, content in zip(messages, originals):
+                message.content = content
+            dispatched.clear()
+            elapsed = drive(handler, messages)
+            print("{:<9} {:>8.0f} ns/message, {} dispatched"
+                  "".format(name, elapsed / len(messages) * 1e9, len(dispatched)))
+    finally:
+        os.chdir(cwd)
+        remove_workdir(workdir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from fake_bot import FakeBot, make_context, make_listings
+from cogs.modules.coin_market import CoinMarket
+from cogs.modules.coin_market_functionality import CoinMarketFunctionality
+from cogs.modules.price_history import PriceHistory
+
+
+def build_cmc(bot, coins):
+    """
+    Builds the CMC module on a fake market of the given size
+    """
+    coin_market = CoinMarket("benchmark")
+    listings = make_listings(coins)
+    market_list = {coin['slug']: coin for coin in listings['data']}
+    acronym_list = {coin['symbol']: coin['slug'] for coin in listings['data']}
+    coin_market.cross_rates.update(market_list)
+    cmc = CoinMarketFunctionality(bot, coin_market, {}, PriceHistory(2, 1))
+    cmc.update(market_list, acronym_list)
+    return cmc
+
+
+async def burst(cmc, queries):
+    """
+    Runs every query concurrently as if they arrived in the same second
+    """
+    await asyncio.gather(*[cmc.display_search(make_context("$s " + " ".join(query),
+                                                           user_id=i),
+                                              query)
+                           for i, query in enumerate(queries)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fires bursts of searches where "
+                                     "most users ask for the same pumping coin "
+                                     "and reports how many were coalesced.")
+    parser.add_argument("--coins", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--hot-share", type=float, default=0.8)
+    args = parser.parse_args()
+    bot = FakeBot()
+    cmc = build_cmc(bot, args.coins)
+    rng = random.Random(0)
+    hot = [("bitcoin",), ("ethereum", "EUR"), ("coin-3", "coin-4", "coin-5")]
+    started = time.perf_counter()
+    for _ in range(args.bursts):
+        queries = []
+        for _ in range(args.users):
+            if rng.random() < args.hot_share:
+                queries.append(rng.choice(hot))
+            else:
+                queries.append(("coin-{}".format(rng.randint(3, args.coins)),))
+        bot.loop.run_until_complete(burst(cmc, queries))
+        # a market refresh between bursts invalidates every shared result
+        cmc.coin_market.cross_rates.generation += 1
+    elapsed = time.perf_counter() - started
+    stats = cmc.get_search_stats()
+    print("{} searches in {:.3f}s ({:.1f} us each)"
+          "".format(stats["requests"], elapsed, elapsed / stats["requests"] * 1e6))
+    print("computed {} results, coalescing ratio {:.1%}"
+          "".format(stats["computations"], stats["coalescing_ratio"]))
+    print("{} replies sent".format(len(bot.sent)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import sys
+import time
+
+import fake_bot  # noqa: F401 (puts the repo root on sys.path)
+from aiohttp import web
+from server_count_reporter import ServerCountReporter
+
+
+STUB_PATH = "/api/bots/0/stats"
+
+
+class StubListingSite:
+    """Local stand-in for the discordbots.org stats endpoint"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.counts = []
+
+    async def handle(self, request):
+        data = await request.post()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.counts.append(int(data['server_count']))
+        return web.Response(text="ok")
+
+
+async def simulate(loop, joins, join_delay, interval, port, delay):
+    site = StubListingSite(delay)
+    app = web.Application(loop=loop)
+    app.router.add_route('POST', STUB_PATH, site.handle)
+    handler = app.make_handler()
+    server = await loop.create_server(handler, "127.0.0.1", port)
+    reporter = ServerCountReporter(loop,
+                                   "http://127.0.0.1:{}{}".format(port, STUB_PATH),
+                                   "benchmark",
+                                   interval)
+    blocked = []
+    try:
+        started = time.time()
+        for server_count in range(1, joins + 1):
+            # the gateway handler's own time is what blocks the event loop
+            handler_start = time.perf_counter()
+            reporter.update(server_count)
+            blocked.append(time.perf_counter() - handler_start)
+            await asyncio.sleep(join_delay)
+        while reporter.pending != reporter.last_posted:
+            await asyncio.sleep(0.01)
+        elapsed = time.time() - started
+    finally:
+        await reporter.close()
+        server.close()
+        await server.wait_closed()
+    return site.counts, elapsed, blocked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulates a burst of server "
+                                     "joins against a local stub of the "
+                                     "server count endpoint and checks the "
+                                     "reporter coalesces them.")
+    parser.add_argument("--joins", type=int, default=1000)
+    parser.add_argument("--join-delay", type=float, default=0.001)
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--endpoint-delay", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    loop = asyncio.get_event_loop()
+    counts, elapsed, blocked = loop.run_until_complete(simulate(loop,
+                                                                args.joins,
+                                                                args.join_delay,
+                                                                args.interval,
+                                                                args.port,
+                                                                args.endpoint_delay))
+    allowed = int(elapsed / args.interval) + 1
+    print("{} joins in {:.2f}s -> {} posts (at most {} allowed)"
+          "".format(args.joins, elapsed, len(counts), allowed))
+    print("slowest join handler: {:.3f}ms".format(max(blocked) * 1000))
+    print("last reported count: {}".format(counts[-1] if counts else None))
+    ok = (counts and counts[-1] == args.joins and len(counts) <= allowed)
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from fake_bot import make_workdir, remove_workdir
+
+
+TARGET_TIME_TO_FIRST_COMMAND = 1.0
+SNAPSHOT_FILE = "market_snapshot.pickle"
+
+
+def run_child(mode, coins, started):
+    """
+    Starts the bot against a fake Discord client and answers one search
+
+    @param mode - 'cold' to start without a market snapshot, 'warm' to
+                  start from the snapshot of the previous run
+    @param coins - number of coins in the fake market
+    @param started - time the interpreter started, passed by the parent
+    """
+    from startup_profile import profile
+    import asyncio
+    from fake_bot import FakeBot, FakeMarket, make_context
+
+    profile.start_time = started
+    if mode == "cold" and os.path.exists(SNAPSHOT_FILE):
+        os.remove(SNAPSHOT_FILE)
+    bot = FakeBot()
+    with profile.phase("import cog manager"):
+        import cogs.cog_manager
+    with profile.phase("set up cogs"):
+        cogs.cog_manager.setup(bot)
+    core = bot.cmd_function
+    # the fixture is built on the first fetch, standing in for the request
+    core.coin_market.market = FakeMarket(coin_count=coins)
+
+    async def first_command():
+        while core.cmc.market_list is None or core.cmc.market_list == "":
+            await asyncio.sleep(0.001)
+        ctx = make_context("$s bitcoin")
+        await core.cmc.display_search(ctx, ("bitcoin",))
+        return profile.elapsed()
+
+    answered = bot.loop.run_until_complete(first_command())
+    core.update_task.cancel()
+    print(json.dumps({"first_command": answered,
+                      "replies": len(bot.sent),
+                      "phases": profile.phases}))
+
+
+def run_parent(runs, coins):
+    workdir = make_workdir()
+    here = os.path.abspath(__file__)
+    results = {"cold": [], "warm": []}
+    phases = {"cold": {}, "warm": {}}
+    try:
+        for _ in range(runs):
+            for mode in ("cold", "warm"):
+                output = subprocess.check_output([sys.executable, here,
+                                                  "--child", mode,
+                                                  "--coins", str(coins),
+                                                  "--started", repr(time.time())],
+                                                 cwd=workdir)
+                result = json.loads(output.decode().strip().splitlines()[-1])
+                if not result["replies"]:
+                    raise RuntimeError("The bot didn't answer the first command.")
+                results[mode].append(result["first_command"])
+                for name, duration in result["phases"]:
+                    phases[mode].setdefault(name, []).append(duration)
+    finally:
+        remove_workdir(workdir)
+    for mode in ("cold", "warm"):
+        print("{} start ({} coins, {} runs)".format(mode, coins, runs))
+        for name, durations in phases[mode].items():
+            print("  {:<32} {:>8.4f}s".format(name, statistics.median(durations)))
+        median = statistics.median(results[mode])
+        print("  {:<32} {:>8.4f}s (max {:.4f}s)".format("time to first command",
+                                                       median,
+                                                       max(results[mode])))
+    warm = statistics.median(results["warm"])
+    verdict = "PASS" if warm <= TARGET_TIME_TO_FIRST_COMMAND else "FAIL"
+    print("target: warm start answers within {:.2f}s -> {}"
+          "".format(TARGET_TIME_TO_FIRST_COMMAND, verdict))
+    return 0 if verdict == "PASS" else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures how long the bot "
+                                     "takes from process start until it "
+                                     "answers its first command. Cold runs "
+                                     "fetch the market first, warm runs start "
+                                     "from the snapshot left by the cold run.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--coins", type=int, default=5000)
+    parser.add_argument("--child", choices=["cold", "warm"], help=argparse.SUPPRESS)
+    parser.add_argument("--started", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child, args.coins, args.started)
+        return 0
+    return run_parent(args.runs, args.coins)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import time
+from collections import OrderedDict
+
+from fake_bot import (FakeBot, FakeChannel, FakeMarket, FakeServer, make_context,
+                      make_listings, make_workdir, move_market, remove_workdir,
+                      summarize)
+
+
+LIVE_MINUTE = 60
+
+
+def set_up(coins):
+    """
+    Loads the real cogs on a fake bot and a fake market of the given size
+
+    @param coins - number of coins in the fake market
+    @return - (bot, core functionality, listings)
+    """
+    import cogs.cog_manager
+    bot = FakeBot(servers=[FakeServer(i) for i in range(10)])
+    cogs.cog_manager.setup(bot)
+    core = bot.cmd_function
+    core.update_task.cancel()
+    listings = make_listings(coins)
+    core.coin_market.market = FakeMarket(listings)
+    bot.loop.run_until_complete(core._update_data(LIVE_MINUTE))
+    return bot, core, listings
+
+
+def bench_refresh(bot, core, listings, args):
+    """
+    Full update cycles with every price moving between them
+    """
+    async def run():
+        latencies = []
+        for i in range(args.refreshes):
+            core.coin_market.market.current_listings = move_market(listings, i)
+            started = time.perf_counter()
+            await core._update_data(LIVE_MINUTE)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+    return run(), {}
+
+
+def make_alerts(listings, count, fire_share, capacity, seed=0):
+    """
+    Builds price alerts spread over users, a share of which are met
+
+    @return - alert data keyed by user id then alert number
+    """
+    rng = random.Random(seed)
+    coins = listings["data"]
+    alert_data = {}
+    for i in range(count):
+        coin = rng.choice(coins)
+        price = coin["quote"]["USD"]["price"]
+        # a met alert sits far below the price so market moves don't matter
+        target = price * (0.5 if rng.random() < fire_share else 10)
+        user_alerts = alert_data.setdefault(str(100000 + i // capacity), {})
+        user_alerts[str(len(user_alerts) + 1)] = {"currency": coin["slug"],
+                                                  "channel": str(2000 + i % 50),
+                                                  "operation": ">",
+                                                  "price": "{:.6f}".format(target),
+                                                  "fiat": "USD"}
+    return alert_data
+
+
+def bench_alerts(bot, core, listings, args):
+    """
+    Alert sweeps over a large set of alerts, a few of which fire
+    """
+    capacity = core.config_data.get("alert_capacity", 10)
+    template = make_alerts(listings, args.alerts, args.fire_share, capacity)
+    for i in range(50):
+        channel_id = str(2000 + i)
+        bot.channels[channel_id] = FakeChannel(channel_id, FakeServer(i))
+    counts = {"evaluated": 0, "fired": 0}
+
+    async def run():
+        latencies = []
+        for _ in range(args.sweeps):
+            core.alert.alert_data = copy.deepcopy(template)
+            started = time.perf_counter()
+            evaluated, fired = await core.alert.alert_user()
+            latencies.append(time.perf_counter() - started)
+            counts["evaluated"] += evaluated
+            counts["fired"] += fired
+        return latencies
+    return run(), counts
+
+
+def bench_broadcast(bot, core, listings, args):
+    """
+    Live updates to many subscribed channels
+    """
+    rng = random.Random(0)
+    slugs = [coin["slug"] for coin in listings["data"][:200]]
+    subscriber_data = {}
+    for i in range(args.channels):
+        channel_id = str(5000 + i)
+        bot.channels[channel_id] = FakeChannel(channel_id, FakeServer(1000 + i))
+        subscriber_data[channel_id] = {"interval": str(LIVE_MINUTE),
+                                       "purge": False,
+                                       "fiat": rng.choice(["USD", "EUR"]),
+                                       "currencies": rng.sample(slugs, 5)}
+    core.subscriber.subscriber_data = subscriber_data
+    counts = {"channels": 0}
+
+    async def run():
+        latencies = []
+        for _ in range(args.broadcasts):
+            started = time.perf_counter()
+            counts["channels"] += await core.subscriber.display_live_data(LIVE_MINUTE)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+    return run(), counts
+
+
+def _search_queries(listings, args):
+    rng = random.Random(0)
+    coins = listings["data"]
+    queries = []
+    for i in range(args.searches):
+        rank = min(int(rng.paretovariate(1.2)) - 1, len(coins) - 1)
+        queries.append((make_context("$s", user_id=i), (coins[rank]["slug"],)))
+    return queries
+
+
+def bench_search(bot, core, listings, args):
+    """
+    $s lookups of random coins, weighted towards the top of the ranking
+
+    Popular coins repeat, so most lookups are answered from the search
+    cache like they are between two refreshes.
+    """
+    queries = _search_queries(listings, args)
+
+    async def run():
+        latencies = []
+        for ctx, query in queries:
+            started = time.perf_counter()
+            await core.cmc.display_search(ctx, query)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+    return run(), {}
+
+
+def bench_search_cold(bot, core, listings, args):
+    """
+    The same lookups as search with the search cache emptied before each
+    one, so every lookup builds its result
+    """
+    queries = _search_queries(listings, args)
+    cross_rates = core.cmc.coin_market.cross_rates
+
+    async def run():
+        latencies = []
+        for ctx, query in queries:
+            # a new generation invalidates everything the cache holds
+            cross_rates.generation += 1
+            started = time.perf_counter()
+            await core.cmc.display_search(ctx, query)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+    return run(), {}
+
+
+SCENARIOS = OrderedDict([("refresh", bench_refresh),
+                         ("alerts", bench_alerts),
+                         ("broadcast", bench_broadcast),
+                         ("search", bench_search),
+                         ("search_cold", bench_search_cold)])
+
+
+def print_results(results, baseline=None):
+    print("{:<12} {:>7} {:>11} {:>10} {:>10} {:>10} {:>10}"
+          "".format("scenario", "ops", "ops/s", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    for name, result in results.items():
+        print("{:<12} {:>7} {:>11.1f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}"
+              "".format(name, result["count"], result["throughput"],
+                        result["p50"] * 1e3, result["p90"] * 1e3,
+                        result["p99"] * 1e3, result["max"] * 1e3))
+        counts = result.get("counts")
+        if counts:
+            print("{:<12} {}".format("", ", ".join("{}={}".format(key, value)
+                                                   for key, value in sorted(counts.items()))))
+        if baseline and name in baseline and baseline[name]["p50"]:
+            before = baseline[name]
+            print("{:<12} p50 {:+.1%}, throughput {:+.1%} against the baseline"
+                  "".format("", result["p50"] / before["p50"] - 1,
+                            result["throughput"] / before["throughput"] - 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the real modules against "
+                                     "a fake Discord client and a canned market "
+                                     "and reports throughput and latency "
+                                     "percentiles. Save a run with --output and "
+                                     "pass it to --compare on another commit.")
+    parser.add_argument("scenarios", nargs="*",
+                        help="scenarios to run out of {}, all of them by default"
+                             "".format(", ".join(SCENARIOS)))
+    parser.add_argument("--coins", type=int, default=5000)
+    parser.add_argument("--refreshes", type=int, default=10)
+    parser.add_argument("--alerts", type=int, default=100000)
+    parser.add_argument("--fire-share", type=float, default=0.01)
+    parser.add_argument("--sweeps", type=int, default=5)
+    parser.add_argument("--channels", type=int, default=300)
+    parser.add_argument("--broadcasts", type=int, default=10)
+    parser.add_argument("--searches", type=int, default=10000)
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    parser.add_argument("--compare", help="results saved by an earlier run")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario '{}'".format(name))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = make_workdir({"alert_capacity": 10,
+                            "subscriber_capacity": args.channels})
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    results = OrderedDict()
+    try:
+        bot, core, listings = set_up(args.coins)
+        for name in args.scenarios or SCENARIOS:
+            run, counts = SCENARIOS[name](bot, core, listings, args)
+            bot.sent.clear()
+            started = time.perf_counter()
+            latencies = bot.loop.run_until_complete(run)
+            result = summarize(latencies, time.perf_counter() - started)
+            result["counts"] = counts
+            result["sent"] = len(bot.sent)
+            results[name] = result
+    finally:
+        os.chdir(cwd)
+        remove_workdir(workdir)
+    print_results(results, baseline)
+    if output:
+        with open(output, 'w') as outfile:
+            json.dump(results, outfile, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+BENCH_CONFIG = {
+    "cmd_prefix": "$",
+    "token": "benchmark",
+    "cmc_api_key": "benchmark",
+    "coinmarketcal_client_id": "benchmark",
+    "coinmarketcal_client_secret": "benchmark",
+    "alert_capacity": 10,
+    "subscriber_capacity": 300,
+    "portfolio_capacity": 50,
+    "history_retention": 168
+}
+
+
+def make_listings(coin_count=5000, seed=0):
+    """
+    Builds a CoinMarketCap listings response with the given number of
+    coins. Bitcoin and ethereum are always the first two.
+
+    @param coin_count - number of coins in the response
+    @param seed - random seed so runs are repeatable
+    @return - dict shaped like the listings endpoint response
+    """
+    rng = random.Random(seed)
+    data = []
+    for rank in range(1, coin_count + 1):
+        if rank == 1:
+            name, symbol, price = "Bitcoin", "BTC", 60000.0
+        elif rank == 2:
+            name, symbol, price = "Ethereum", "ETH", 3000.0
+        else:
+            name = "Coin {}".format(rank)
+            # a few symbols repeat so the duplicate acronym path is used
+            symbol = "C{}".format(rank if rank % 100 else rank // 100)
+            price = rng.uniform(0.0001, 500.0)
+        supply = rng.uniform(1e6, 1e10)
+        data.append({"id": rank,
+                     "name": name,
+                     "symbol": symbol,
+                     "slug": name.lower().replace(' ', '-'),
+                     "cmc_rank": rank,
+                     "circulating_supply": supply,
+                     "max_supply": None if rank % 3 else supply * 2,
+                     "quote": {"USD": {"price": price,
+                                       "volume_24h": rng.uniform(1e3, 1e9),
+                                       "market_cap": price * supply,
+                                       "percent_change_1h": rng.uniform(-5, 5),
+                                       "percent_change_24h": rng.uniform(-20, 20),
+                                       "percent_change_7d": rng.uniform(-40, 40)}}})
+    return {"data": data}
+
+
+def make_stats():
+    """
+    Builds a CoinMarketCap global metrics response
+    """
+    return {"data": {"btc_dominance": 52.1,
+                     "eth_dominance": 17.3,
+                     "active_exchanges": 512,
+                     "active_cryptocurrencies": 5000,
+                     "quote": {"USD": {"total_market_cap": 2.3e12,
+                                       "total_volume_24h": 9.1e10}}}}
+
+
+def move_market(listings, seed, volatility=0.02):
+    """
+    Returns a copy of the listings with every price moved randomly
+
+    @param listings - listings response to start from
+    @param seed - random seed so runs are repeatable
+    @param volatility - largest relative move of a price
+    """
+    rng = random.Random(seed)
+    data = []
+    for coin in listings["data"]:
+        coin = dict(coin)
+        quote = dict(coin["quote"]["USD"])
+        quote["price"] = quote["price"] * (1 + rng.uniform(-volatility, volatility))
+        coin["quote"] = {"USD": quote}
+        data.append(coin)
+    return {"data": data}
+
+
+class FakeMarket:
+    """Stands in for the CoinMarketCap client"""
+
+    def __init__(self, listings=None, stats=None, coin_count=5000):
+        self.current_listings = listings
+        self.current_stats = stats or make_stats()
+        self.coin_count = coin_count
+        self.calls = 0
+
+    def listings(self, limit=5000, convert="USD"):
+        self.calls += 1
+        if self.current_listings is None:
+            self.current_listings = make_listings(min(limit, self.coin_count))
+        return self.current_listings
+
+    def stats(self, convert="USD"):
+        self.calls += 1
+        return self.current_stats
+
+
+class FakeRole:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeServer:
+    def __init__(self, server_id, member_count=100):
+        self.id = str(server_id)
+        self.name = "Server {}".format(server_id)
+        self.member_count = member_count
+        self.members = []
+        self.channels = []
+
+
+class FakeChannel:
+    def __init__(self, channel_id, server=None):
+        self.id = str(channel_id)
+        self.name = "channel-{}".format(channel_id)
+        self.server = server
+        self.is_private = server is None
+
+
+class FakeUser:
+    def __init__(self, user_id, roles=(), bot=False):
+        self.id = str(user_id)
+        self.name = "user{}".format(user_id)
+        self.mention = "<@{}>".format(self.id)
+        self.roles = [FakeRole(role) for role in roles]
+        self.bot = bot
+
+
+class FakeMessage:
+    def __init__(self, content, author, channel):
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.server = channel.server
+
+
+class FakeContext:
+    def __init__(self, message):
+        self.message = message
+
+
+class FakeBot:
+    """
+    Minimal stand-in for discord.ext.commands.Bot
+
+    Everything the bot would send is recorded in `sent` instead of going
+    to Discord.
+    """
+
+    def __init__(self, loop=None, servers=()):
+        self.loop = loop or asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.servers = list(servers)
+        self.user = FakeUser(1, bot=True)
+        self.cogs = {}
+        self.commands = {}
+        self.extensions = {}
+        self.sent = []
+        self.channels = {}
+
+    def add_cog(self, cog):
+        self.cogs[type(cog).__name__] = cog
+
+    async def say(self, content=None, embed=None):
+        self.sent.append((None, content, embed))
+
+    async def send_message(self, destination, content=None, embed=None):
+        self.sent.append((destination, content, embed))
+
+    async def upload(self, fp, filename=None, content=None):
+        self.sent.append((None, content, filename))
+
+    async def change_presence(self, game=None):
+        pass
+
+    async def get_user_info(self, user_id):
+        return FakeUser(user_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+
+def make_context(content="", user_id=1000, channel_id=2000, server_id=3000,
+                 roles=()):
+    """
+    Builds a command context for a message sent in a server channel
+    """
+    server = FakeServer(server_id)
+    channel = FakeChannel(channel_id, server)
+    author = FakeUser(user_id, roles)
+    return FakeContext(FakeMessage(content, author, channel))
+
+
+def make_workdir(config=None):
+    """
+    Creates a scratch directory with a config.json for the bot to run in
+
+    @param config - overrides for the benchmark config
+    @return - path of the directory
+    """
+    workdir = tempfile.mkdtemp(prefix="cmb-bench-")
+    bench_config = dict(BENCH_CONFIG)
+    bench_config.update(config or {})
+    with open(os.path.join(workdir, "config.json"), 'w') as outfile:
+        json.dump(bench_config, outfile, indent=4)
+    return workdir
+
+
+def remove_workdir(workdir):
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def summarize(latencies, elapsed):
+    """
+    Summarizes the latencies of a run
+
+    @param latencies - seconds taken by each operation
+    @param elapsed - seconds the whole run took
+    @return - dict with the count, throughput and latency percentiles
+    """
+    ordered = sorted(latencies)
+    summary = {"count": len(ordered),
+               "elapsed": elapsed,
+               "throughput": len(ordered) / elapsed if elapsed else 0.0}
+    for name, quantile in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+        summary[name] = (ordered[min(int(quantile * len(ordered)), len(ordered) - 1)]
+                         if ordered else 0.0)
+    summary["max"] = ordered[-1] if ordered else 0.0
+    return summary
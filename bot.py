@@ -1,19 +1,79 @@
-from discord.ext import commands
-from bot_logger import logger
+from startup_profile import profile
+with profile.phase("import discord"):
+    from discord.ext import commands
+from bot_logger import (LOG_BACKUP_COUNT, LOG_FILE, LOG_MAX_BYTES,
+                        LOG_ROTATE_INTERVAL, configure as configure_logging,
+                        logger, set_log_context)
+from bot_metrics import (CACHE_HITS, CACHE_REQUESTS, COMMAND_ERRORS,
+                         COMMAND_SECONDS, METRICS_HOST, METRICS_PORT,
+                         RATE_LIMITED, SEND_FAILURES, SEND_SECONDS, metrics,
+                         start_server)
+from help_cache import HelpCache
+from loop_monitor import HEARTBEAT_INTERVAL, LAG_THRESHOLD, create_monitor
+from message_filter import COMMAND, IGNORE, MessageFilter
+from rate_limiter import (CommandRateLimiter, GUILD_BURST, GUILD_RATE,
+                          USER_BURST, USER_RATE, command_cost)
+from server_count_reporter import DEFAULT_INTERVAL, ServerCountReporter
+from sharding import (SharedFile, configure as configure_sharding,
+                      parse_shard_args, state_path)
 import json
 import logging
-import requests
+import sys
+import time
 
 CMB_ADMIN = "CMB ADMIN"
 PREFIX_DISABLED = "PREFIX_DISABLED"
 DISCORD_BOT_URL = "https://discordbots.org/api/bots/353373501274456065/stats"
 COG_MANAGER = "cogs.cog_manager"
+STARTUP_PROFILE = "--startup-profile"
+PROFILED_IMPORTS = ["aiohttp", "requests", "coinmarketcap", "currency_converter", COG_MANAGER]
+ready_count = 0
+
+
+class MeteredBot(commands.Bot):
+    """Bot that measures how long Discord takes to accept messages"""
+
+    async def send_message(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().send_message(*args, **kwargs)
+        except Exception:
+            SEND_FAILURES.inc()
+            raise
+        finally:
+            SEND_SECONDS.observe(time.perf_counter() - started)
+
+
 with open('config.json') as config:
     config_data = json.load(config)
-bot = commands.Bot(command_prefix=config_data["cmd_prefix"],
-                   description="Displays market data from "
-                               "https://coinmarketcap.com/",
-                   pm_help=True)
+shard_id, shard_count = parse_shard_args(sys.argv)
+configure_sharding(shard_id, shard_count)
+configure_logging(config_data.get("log_max_bytes", LOG_MAX_BYTES),
+                  config_data.get("log_backup_count", LOG_BACKUP_COUNT),
+                  config_data.get("log_rotate_interval", LOG_ROTATE_INTERVAL),
+                  state_path(LOG_FILE))
+bot = MeteredBot(command_prefix=config_data["cmd_prefix"],
+                 description="Displays market data from "
+                             "https://coinmarketcap.com/",
+                 pm_help=True,
+                 shard_id=shard_id,
+                 shard_count=shard_count)
+server_count_reporter = ServerCountReporter(bot.loop,
+                                            config_data.get("server_count_url",
+                                                            DISCORD_BOT_URL),
+                                            config_data.get("auth_token"),
+                                            config_data.get("server_count_interval",
+                                                            DEFAULT_INTERVAL),
+                                            shard_id,
+                                            shard_count)
+help_cache = HelpCache(bot)
+loop_monitor = create_monitor(bot.loop,
+                              config_data.get("loop_lag_interval", HEARTBEAT_INTERVAL),
+                              config_data.get("loop_lag_threshold", LAG_THRESHOLD))
+command_limiter = CommandRateLimiter(config_data.get("rate_limit_user_rate", USER_RATE),
+                                     config_data.get("rate_limit_user_burst", USER_BURST),
+                                     config_data.get("rate_limit_guild_rate", GUILD_RATE),
+                                     config_data.get("rate_limit_guild_burst", GUILD_BURST))
 
 
 class CoinMarketBotException(Exception):
@@ -36,9 +96,25 @@ class CoinMarketBot:
 
     @bot.event
     async def on_ready():
+        global ready_count
         try:
-            bot.load_extension(COG_MANAGER)
+            ready_count += 1
+            message_filter.set_bot_user(bot.user.id)
+            if ready_count > 1:
+                logger.info("Reconnected to Discord (reconnect #{})."
+                            "".format(ready_count - 1))
+            else:
+                logger.info("Connected to Discord in {:.2f} seconds."
+                            "".format(profile.elapsed()))
+            if COG_MANAGER in bot.extensions:
+                return
+            with profile.phase("load cog manager"):
+                load_cogs()
+            logger.info("Cogs loaded {:.2f} seconds after startup."
+                        "".format(profile.elapsed()))
             update_server_count(len(bot.servers))
+            await start_metrics_server()
+            loop_monitor.start()
         except Exception as e:
             error_msg = 'Failed to load cog manager\n{}: {}'.format(type(e).__name__, e)
             print(error_msg)
@@ -46,39 +122,39 @@ class CoinMarketBot:
 
     @bot.event
     async def on_message(message):
-        if not message.author.bot:
-            if message.content.startswith("<@" + str(bot.user.id) + ">"):
-                try:
-                    if message.server.id in prefix_list:
-                        await bot.send_message(message.channel,
-                                               "The prefix for this bot is `{0}`. "
-                                               "Type `{0}help` for a list of commands."
-                                               "".format(prefix_list[message.server.id]))
-                    else:
-                        await bot.send_message(message.channel,
-                                               "The prefix for this bot is `{0}`. "
-                                               "Type `{0}help` for a list of commands."
-                                               "".format(config_data["cmd_prefix"]))
-                except AttributeError:
-                    await bot.send_message(message.channel,
-                                           "The prefix for this bot is `{0}`. "
-                                           "Type `{0}help` for a list of commands."
-                                           "".format(config_data["cmd_prefix"]))
-            else:
-                try:
-                    if message.server.id in prefix_list:
-                        server_prefix = prefix_list[message.server.id]
-                        if not message.content.startswith(server_prefix):
-                            return
-                        message.content = message.content.replace(server_prefix,
-                                                                  config_data["cmd_prefix"],
-                                                                  1)
-                    await process_cmd(message)
-                except AttributeError:
-                    await process_cmd(message)
+        if message.author.bot:
+            return
+        server = message.server
+        server_id = server.id if server is not None else None
+        kind, prefix = message_filter.classify(message.content, server_id)
+        if kind == IGNORE:
+            return
+        if kind == COMMAND:
+            if prefix != config_data["cmd_prefix"]:
+                message.content = (config_data["cmd_prefix"]
+                                   + message.content[len(prefix):])
+            await process_cmd(message)
+            return
+        await bot.send_message(message.channel,
+                               "The prefix for this bot is `{0}`. "
+                               "Type `{0}help` for a list of commands."
+                               "".format(message_filter.get_prefix(server_id)))
+
+    @bot.event
+    async def on_command(command, ctx):
+        ctx.started = time.perf_counter()
+
+    @bot.event
+    async def on_command_completion(command, ctx):
+        started = getattr(ctx, "started", None)
+        if started is not None:
+            COMMAND_SECONDS.observe(time.perf_counter() - started,
+                                    command=command.qualified_name)
 
     @bot.event
     async def on_command_error(error, ctx):
+        if ctx.command is not None:
+            COMMAND_ERRORS.inc(command=ctx.command.qualified_name)
         if isinstance(error, commands.errors.MissingRequiredArgument):
             await send_cmd_help(ctx)
         if isinstance(error, commands.errors.BadArgument):
@@ -91,38 +167,94 @@ async def process_cmd(message):
     """
     if message.content.startswith(config_data["cmd_prefix"]):
         cmd_input = message.content[1:].split(' ')
+        command = cmd_input[0]
+        args = cmd_input[1:]
         if cmd_input[0] not in bot.commands:
             if cmd_input[0] != '':
+                command = "s"
+                args = cmd_input[:]
                 cmd_input.insert(0, "{}s".format(config_data["cmd_prefix"]))
                 message.content = ' '.join(cmd_input)
+        if command in bot.commands:
+            server = getattr(message, "server", None)
+            set_log_context(command=command,
+                            server=server.id if server else None,
+                            user=message.author.id)
+            if not command_limiter.allow(command,
+                                         message.author.id,
+                                         server.id if server else None,
+                                         command_cost(command, args)):
+                return
         await bot.process_commands(message)
 
 
+def load_cogs():
+    """
+    Loads the cog manager and renders the help of its commands
+    """
+    bot.load_extension(COG_MANAGER)
+    help_cache.invalidate()
+    help_cache.build(config_data["cmd_prefix"])
+
+
+async def start_metrics_server():
+    """
+    Serves the metrics over HTTP unless metrics_port is 0
+    """
+    port = config_data.get("metrics_port", METRICS_PORT)
+    if not port:
+        return
+    # shards on the same host each serve on the next port
+    port += shard_id or 0
+    try:
+        await start_server(bot.loop,
+                           config_data.get("metrics_host", METRICS_HOST),
+                           port)
+    except Exception as e:
+        print("Failed to start the metrics server. See error.log.")
+        logger.error("Exception: {}".format(str(e)))
+
+
+def collect_metrics():
+    """
+    Copies the rate limiter and help cache statistics into the metrics
+    """
+    limiter_stats = command_limiter.stats()
+    RATE_LIMITED.set_total(limiter_stats["rejected_user"], scope="user")
+    RATE_LIMITED.set_total(limiter_stats["rejected_guild"], scope="guild")
+    CACHE_REQUESTS.set_total(help_cache.requests, cache="help")
+    CACHE_HITS.set_total(help_cache.hits, cache="help")
+
+
+metrics.add_collector(collect_metrics)
+
+
 async def send_cmd_help(ctx):
     if ctx.invoked_subcommand:
-        pages = bot.formatter.format_help_for(ctx, ctx.invoked_subcommand)
-        for page in pages:
-            await bot.send_message(ctx.message.channel,
-                                   "Please make sure you're entering a valid"
-                                   "command:\n{}".format(page))
+        command = ctx.invoked_subcommand
+        msg = "Please make sure you're entering a valid command:\n{}"
     else:
-        pages = bot.formatter.format_help_for(ctx, ctx.command)
-        for page in pages:
-            await bot.send_message(ctx.message.channel,
-                                   "Command failed. Please make sure you're "
-                                   "entering the correct arguments to the "
-                                   "command:\n{}".format(page))
+        command = ctx.command
+        msg = ("Command failed. Please make sure you're entering the "
+               "correct arguments to the command:\n{}")
+    if config_data.get("full_help_on_error", False):
+        for page in help_cache.get_pages(ctx, command):
+            await bot.send_message(ctx.message.channel, msg.format(page))
+        return
+    server = ctx.message.server
+    prefix = message_filter.get_prefix(server.id if server is not None else None)
+    await bot.send_message(ctx.message.channel,
+                           msg.format(help_cache.get_usage(command, prefix)))
 
 
 def save_prefix_file(prefix_data={}, backup=False):
     """
     Saves prefixes.json file
     """
-    if backup:
-        prefix_filename = "prefixes_backup.json"
-    else:
-        prefix_filename = "prefixes.json"
-    with open(prefix_filename, 'w') as outfile:
+    if not backup:
+        prefix_file.save(prefix_data)
+        return
+    with open(state_path("prefixes_backup.json"), 'w') as outfile:
         json.dump(prefix_data,
                   outfile,
                   indent=4)
@@ -133,8 +265,7 @@ def check_prefix_file():
     Checks to see if there's a valid prefixes.json file
     """
     try:
-        with open('prefixes.json') as prefixes:
-            return json.load(prefixes)
+        return prefix_file.load()
     except FileNotFoundError:
         save_prefix_file()
         return json.loads('{}')
@@ -165,14 +296,13 @@ def _check_permission(ctx):
 
 
 def update_server_count(server_count):
+    """
+    Queues the server count to be reported to discordbots.org
+    """
     try:
-        header = {'Authorization': '{}'.format(config_data["auth_token"])}
-        payload = {'server_count': server_count}
-        requests.post(DISCORD_BOT_URL,
-                      headers=header,
-                      data=payload)
+        server_count_reporter.update(server_count)
     except Exception as e:
-        pass
+        logger.error("Exception: {}".format(str(e)))
 
 
 @bot.command(pass_context=True)
@@ -195,16 +325,36 @@ async def prefix(ctx, prefix: str):
                           "Please make sure this channel is within a "
                           "valid server.")
             return
-        prefix_list[server] = prefix
-        save_prefix_file(prefix_list)
+        async with prefix_file.edit(prefix_list):
+            message_filter.set_prefix(server, prefix)
+            save_prefix_file(prefix_list)
         msg = "`{}` prefix has been set for bot commands.".format(prefix)
         await bot.say(msg)
     except Exception as e:
         print("An error has occured. See error.log.")
         logger.error("Exception: {}".format(str(e)))
 
-prefix_list = check_prefix_file()
-save_prefix_file(prefix_list, backup=True)
+prefix_file = SharedFile('prefixes.json')
+with profile.phase("load prefixes.json + backup"):
+    prefix_list = check_prefix_file()
+    save_prefix_file(prefix_list, backup=True)
+message_filter = MessageFilter(config_data["cmd_prefix"], prefix_list)
+
+
+def run_startup_profile():
+    """
+    Goes through startup without connecting to Discord and prints how
+    long each import and init phase took
+    """
+    for module_name in PROFILED_IMPORTS:
+        profile.time_import(module_name)
+    with profile.phase("load cog manager"):
+        load_cogs()
+    core = bot.cmd_function
+    core.update_task.cancel()
+    with profile.phase("first market fetch"):
+        bot.loop.run_until_complete(core._update_data())
+    print(profile.report())
 
 
 def main():
@@ -218,4 +368,8 @@ def main():
     logger.info("Bot is now offline.")
 
 
-main()
+if __name__ == '__main__':
+    if STARTUP_PROFILE in sys.argv:
+        run_startup_profile()
+    else:
+        main()
@@ -1,10 +1,191 @@
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import asyncio
+import atexit
+import json
 import logging
+import os
+import queue
+import time
+import weakref
+
+LOG_FILE = "error.log"
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_ROTATE_INTERVAL = 24 * 60 * 60
+LOG_TIME_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+REPEAT_WINDOW = 60
+REPEAT_KEYS = 1000
+_get_current_task = getattr(asyncio, "current_task", None) or asyncio.Task.current_task
+_task_context = weakref.WeakKeyDictionary()
+
+
+def set_log_context(**fields):
+    """
+    Attaches fields such as the command or server to every record logged
+    by the current task
+
+    @param fields - fields to add to the records
+    """
+    task = _current_task()
+    if task is not None:
+        _task_context.setdefault(task, {}).update(fields)
+
+
+def _current_task():
+    try:
+        return _get_current_task()
+    except RuntimeError:
+        # no running loop in this thread
+        return None
+
+
+class ContextFilter(logging.Filter):
+    """Copies the current task's log context onto records"""
+
+    def filter(self, record):
+        task = _current_task()
+        record.context = _task_context.get(task) if task is not None else None
+        return True
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Lets through one copy of an identical warning or error per window
+
+    When the window of a message is over, the next copy carries how many
+    were dropped, so an outage that fails every command writes a line a
+    minute instead of one per command.
+    """
+
+    def __init__(self, window=REPEAT_WINDOW, max_keys=REPEAT_KEYS):
+        super().__init__()
+        self.window = window
+        self.max_keys = max_keys
+        self.seen = {}
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.levelno, record.pathname, record.lineno, record.getMessage())
+        now = time.monotonic()
+        entry = self.seen.get(key)
+        if entry is not None and now - entry[0] < self.window:
+            entry[1] += 1
+            return False
+        if entry is not None and entry[1]:
+            record.suppressed = entry[1]
+        if entry is None and len(self.seen) >= self.max_keys:
+            self.seen = {seen_key: seen for seen_key, seen in self.seen.items()
+                         if now - seen[0] < self.window}
+        self.seen[key] = [now, 0]
+        return True
+
+
+class LogQueueHandler(QueueHandler):
+    """Queue handler that leaves formatting to the listener's handlers"""
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line"""
+
+    def format(self, record):
+        data = {"time": self.formatTime(record, LOG_TIME_FORMAT),
+                "level": record.levelname,
+                "file": record.filename,
+                "message": record.getMessage()}
+        context = getattr(record, "context", None)
+        if context:
+            data.update(context)
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            data["suppressed"] = suppressed
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class RollingFileHandler(RotatingFileHandler):
+    """Rotates the log when it gets too big or too old"""
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES,
+                 backup_count=LOG_BACKUP_COUNT, interval=LOG_ROTATE_INTERVAL):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count)
+        self.interval = interval
+        self.rollover_at = self.compute_rollover()
+
+    def compute_rollover(self):
+        """
+        Returns when the current log is due for rotation
+
+        The age of an existing log counts from its first record, or from
+        its last write if that can't be read, so a bot restarted more often
+        than the interval still rotates it.
+        """
+        try:
+            started = os.stat(self.baseFilename).st_mtime
+        except FileNotFoundError:
+            return time.time() + self.interval
+        try:
+            with open(self.baseFilename) as log_file:
+                first_record = json.loads(log_file.readline())
+            started = time.mktime(time.strptime(first_record["time"], LOG_TIME_FORMAT))
+        except Exception:
+            pass
+        return started + self.interval
+
+    def shouldRollover(self, record):
+        if self.interval and time.time() >= self.rollover_at:
+            return 1
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+
+def configure(max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+              interval=LOG_ROTATE_INTERVAL, filename=LOG_FILE):
+    """
+    Changes where the log is written and how it is rotated
+
+    @param max_bytes - size the log is rotated at, 0 for no limit
+    @param backup_count - number of rotated logs kept
+    @param interval - seconds after which the log is rotated, 0 to never
+    @param filename - file to write the log to
+    """
+    path = os.path.abspath(filename)
+    if path != file_handler.baseFilename:
+        file_handler.acquire()
+        try:
+            file_handler.close()
+            file_handler.baseFilename = path
+        finally:
+            file_handler.release()
+    file_handler.maxBytes = max_bytes
+    file_handler.backupCount = backup_count
+    file_handler.interval = interval
+    file_handler.rollover_at = file_handler.compute_rollover()
+
 
 logger = logging.getLogger('bot_logger')
 logger.setLevel(logging.DEBUG)
-ch = logging.FileHandler("error.log")
-ch.setLevel(logging.DEBUG)
-formatter = logging.Formatter('[%(asctime)s](%(filename)s) - %(levelname)s - %(message)s',
-                              '%m/%d/%Y %I:%M:%S %p')
-ch.setFormatter(formatter)
+file_handler = RollingFileHandler(LOG_FILE)
+file_handler.setLevel(logging.DEBUG)
+file_handler.setFormatter(JsonFormatter())
+log_queue = queue.Queue()
+ch = LogQueueHandler(log_queue)
+ch.addFilter(RepeatFilter())
+ch.addFilter(ContextFilter())
 logger.addHandler(ch)
+listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
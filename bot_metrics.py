@@ -0,0 +1,265 @@
+from bot_logger import logger
+from contextlib import contextmanager
+import bisect
+import logging
+import time
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+
+class Metric:
+    """Base class of a metric family with optional labels"""
+
+    metric_type = None
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.children = {}
+
+    def _key(self, labels):
+        if not labels:
+            return ()
+        return tuple(sorted(labels.items()))
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.description),
+                 "# TYPE {} {}".format(self.name, self.metric_type)]
+        for key in sorted(self.children):
+            lines.extend(self._render_child(key, self.children[key]))
+        return lines
+
+    def _render_child(self, key, value):
+        return ["{}{} {}".format(self.name, _format_labels(key), _format_value(value))]
+
+
+class Counter(Metric):
+    """Value that only goes up"""
+
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.children[key] = self.children.get(key, 0) + amount
+
+    def set_total(self, total, **labels):
+        """
+        Copies a running total that is counted elsewhere
+        """
+        self.children[self._key(labels)] = total
+
+    def get(self, **labels):
+        return self.children.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    metric_type = "gauge"
+
+    def set(self, value, **labels):
+        self.children[self._key(labels)] = value
+
+    def get(self, **labels):
+        return self.children.get(self._key(labels))
+
+
+class Histogram(Metric):
+    """Distribution of observed values in fixed buckets"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        child = self.children.get(key)
+        if child is None:
+            # per-bucket counts followed by the overflow bucket, sum, count
+            child = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            self.children[key] = child
+        child[bisect.bisect_left(self.buckets, value)] += 1
+        child[-2] += value
+        child[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes how long the body of the with block took
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def get_count(self, **labels):
+        child = self.children.get(self._key(labels))
+        return child[-1] if child else 0
+
+    def _render_child(self, key, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), child):
+            cumulative += count
+            bucket_key = key + (("le", "+Inf" if bound == float('inf') else repr(bound)),)
+            lines.append("{}_bucket{} {}".format(self.name,
+                                                 _format_labels(bucket_key),
+                                                 cumulative))
+        lines.append("{}_sum{} {}".format(self.name, _format_labels(key),
+                                          _format_value(child[-2])))
+        lines.append("{}_count{} {}".format(self.name, _format_labels(key), child[-1]))
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds every metric of the bot and renders them in the Prometheus
+    text format
+
+    Collectors are functions run right before rendering, for values that
+    are cheaper to read on demand than to keep up to date.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def _register(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, description):
+        return self._register(Counter(name, description))
+
+    def gauge(self, name, description):
+        return self._register(Gauge(name, description))
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, description, buckets))
+
+    def add_collector(self, collector):
+        """
+        Registers a function that refreshes some metrics before rendering
+
+        @param collector - function taking no arguments
+        """
+        self.collectors.append(collector)
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format
+        """
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error("Metrics collector failed: {}".format(str(e)))
+        lines = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+class ErrorCountingHandler(logging.Handler):
+    """Counts errors logged by the bot per source file"""
+
+    def __init__(self, counter):
+        super().__init__(logging.ERROR)
+        self.counter = counter
+
+    def emit(self, record):
+        self.counter.inc(file=record.filename)
+
+
+async def start_server(loop, host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Serves the metrics on http://host:port/metrics
+
+    @param loop - event loop to serve on
+    @param host - address to listen on
+    @param port - port to listen on
+    @return - the asyncio server
+    """
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=metrics.render(),
+                            content_type="text/plain")
+    app = web.Application(loop=loop)
+    app.router.add_route('GET', '/metrics', handle)
+    server = await loop.create_server(app.make_handler(), host, port)
+    logger.info("Serving metrics on http://{}:{}/metrics".format(host, port))
+    return server
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{{{}}}".format(",".join('{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                                                                  .replace('"', '\\"')
+                                                                  .replace('\n', '\\n'))
+                                    for name, value in key))
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+metrics = MetricsRegistry()
+
+FETCH_SECONDS = metrics.histogram("cmb_market_fetch_seconds",
+                                  "Time to fetch the listings and global stats from CoinMarketCap")
+FETCH_RETRIES = metrics.counter("cmb_market_fetch_retries_total",
+                                "Retried CoinMarketCap requests")
+UPDATE_SECONDS = metrics.histogram("cmb_update_seconds",
+                                   "Time of a full update cycle")
+SNAPSHOT_COINS = metrics.gauge("cmb_market_snapshot_coins",
+                               "Coins in the latest market snapshot")
+SNAPSHOT_BYTES = metrics.gauge("cmb_market_snapshot_bytes",
+                               "Size of the persisted market snapshot")
+SHARED_SNAPSHOT_AGE = metrics.gauge("cmb_shared_snapshot_age_seconds",
+                                    "Seconds since the market fetcher published a snapshot")
+ALERT_EVAL_SECONDS = metrics.histogram("cmb_alert_evaluation_seconds",
+                                       "Time to check every alert and notify users")
+ALERTS_FIRED = metrics.counter("cmb_alerts_fired_total",
+                               "Alerts that met their condition")
+BROADCAST_SECONDS = metrics.histogram("cmb_broadcast_seconds",
+                                      "Time to send live updates to every subscriber")
+BROADCASTS = metrics.counter("cmb_broadcasts_total",
+                             "Live updates sent to subscribed channels")
+SEND_SECONDS = metrics.histogram("cmb_send_seconds",
+                                 "Latency of messages sent to Discord")
+SEND_FAILURES = metrics.counter("cmb_send_failures_total",
+                                "Messages Discord refused or failed to deliver")
+COMMAND_SECONDS = metrics.histogram("cmb_command_seconds",
+                                    "Command latency by command")
+LOOP_LAG_SECONDS = metrics.histogram("cmb_loop_lag_seconds",
+                                     "How late the event loop woke up a sleeping task")
+LOOP_LAG_QUANTILES = metrics.gauge("cmb_loop_lag_quantile_seconds",
+                                   "Recent event loop lag percentiles")
+LOOP_STALLS = metrics.counter("cmb_loop_stalls_total",
+                              "Times the event loop was blocked past the threshold")
+COMMAND_ERRORS = metrics.counter("cmb_command_errors_total",
+                                 "Commands that failed by command")
+CACHE_REQUESTS = metrics.counter("cmb_cache_requests_total",
+                                 "Requests served by each cache")
+CACHE_HITS = metrics.counter("cmb_cache_hits_total",
+                             "Requests served from each cache without recomputing")
+RATE_LIMITED = metrics.counter("cmb_rate_limited_commands_total",
+                               "Commands rejected by the rate limiter by scope")
+ERRORS = metrics.counter("cmb_errors_total",
+                         "Errors written to error.log by source file")
+
+logger.addHandler(ErrorCountingHandler(ERRORS))
@@ -9,6 +9,7 @@ ALERT_DISABLED = "ALERT_DISABLED"
 SUBSCRIBER_DISABLED = "SUBSCRIBER_DISABLED"
 MISC_DISABLED = "MISC_DISABLED"
 CAL_DISABLED = "CAL_DISABLED"
+PORTFOLIO_DISABLED = "PORTFOLIO_DISABLED"
 
 
 class AdminCommands:
@@ -88,3 +89,39 @@ class AdminCommands:
         "$togglecal"
         """
         await self.cmd_function.toggle_commands(ctx, CAL_DISABLED)
+
+    @commands.command(name='togglepf', pass_context=True)
+    async def togglepf(self, ctx):
+        """
+        Toggles portfolio command availability
+        An example for this command would be:
+        "$togglepf"
+        """
+        await self.cmd_function.toggle_commands(ctx, PORTFOLIO_DISABLED)
+
+    @commands.command(name='metrics', pass_context=True)
+    async def metrics(self, ctx):
+        """
+        Uploads the bot's metrics
+        An example for this command would be:
+        "$metrics"
+        """
+        await self.cmd_function.display_metrics(ctx)
+
+    @commands.command(name='sampleprofile', pass_context=True)
+    async def sampleprofile(self, ctx, seconds: int=10):
+        """
+        Profiles the bot for a number of seconds
+        An example for this command would be:
+        "$sampleprofile 30"
+        """
+        await self.cmd_function.profile_bot(ctx, seconds)
+
+    @commands.command(name='updatetrace', pass_context=True)
+    async def updatetrace(self, ctx, count: int=3):
+        """
+        Shows how long each phase of the last market updates took
+        An example for this command would be:
+        "$updatetrace 5"
+        """
+        await self.cmd_function.display_update_traces(ctx, count)
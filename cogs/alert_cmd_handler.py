@@ -25,23 +25,39 @@ class AlertCommands:
         """
         await self.cmd_function.alert.add_alert(ctx, currency, operator, price, fiat)
 
-    # @commands.command(name='addab', pass_context=True)
-    # async def addab(self, ctx, currency: str, operator: str, btc_price: float):
-    #     """
-    #     Adds alert for when the btc price of crypto meets the condition given
-    #     An example for this command would be:
-    #     "$addab litecoin > 0.02"
-
-    #     @param currency - cryptocurrency to set an alert of
-    #     @param operator - operator for the given choices
-    #                       <  - less than
-    #                       <= - less than or equal to
-    #                       >  - greater than
-    #                       >= - greater than or equal to
-    #     @param btc_price - btc price for condition to compare
-    #     @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
-    #     """
-    #     await self.cmd_function.alert.add_alert(ctx, currency, operator, btc_price, "USD", btc=True)
+    @commands.command(name='addab', pass_context=True)
+    async def addab(self, ctx, currency: str, operator: str, btc_price: float):
+        """
+        Adds alert for when the btc price of crypto meets the condition given
+        An example for this command would be:
+        "$addab litecoin > 0.02"
+
+        @param currency - cryptocurrency to set an alert of
+        @param operator - operator for the given choices
+                          <  - less than
+                          <= - less than or equal to
+                          >  - greater than
+                          >= - greater than or equal to
+        @param btc_price - btc price for condition to compare
+        """
+        await self.cmd_function.alert.add_alert(ctx, currency, operator, btc_price, "USD", btc=True)
+
+    @commands.command(name='addae', pass_context=True)
+    async def addae(self, ctx, currency: str, operator: str, eth_price: float):
+        """
+        Adds alert for when the eth price of crypto meets the condition given
+        An example for this command would be:
+        "$addae litecoin > 0.2"
+
+        @param currency - cryptocurrency to set an alert of
+        @param operator - operator for the given choices
+                          <  - less than
+                          <= - less than or equal to
+                          >  - greater than
+                          >= - greater than or equal to
+        @param eth_price - eth price for condition to compare
+        """
+        await self.cmd_function.alert.add_alert(ctx, currency, operator, eth_price, "USD", eth=True)
 
     @commands.command(name='addah', pass_context=True)
     async def addahour(self, ctx, currency: str, operator: str, percent: float, fiat='USD'):
@@ -97,6 +113,55 @@ class AlertCommands:
         """
         await self.cmd_function.alert.add_alert(ctx, currency, operator, percent, fiat, week=True)
 
+    @commands.command(name='addam', pass_context=True)
+    async def addamove(self, ctx, currency: str, percent: float, hours: int):
+        """
+        Adds alert for when crypto moves up or down by a percent within
+        the given number of hours
+        An example for this command would be:
+        "$addam bitcoin 3 6"
+
+        @param currency - cryptocurrency to set an alert of
+        @param percent - percent move to watch for
+        @param hours - number of hours the move has to happen within
+        """
+        await self.cmd_function.alert.add_alert(ctx, currency, ">=", percent, "USD", move=hours)
+
+    @commands.command(name='addpa', pass_context=True)
+    async def addpa(self, ctx, operator: str, value: float, fiat='USD'):
+        """
+        Adds alert for when the total value of your portfolio meets the
+        condition given
+        An example for this command would be:
+        "$addpa >= 50000"
+
+        @param operator - operator for the given choices
+                          <  - less than
+                          <= - less than or equal to
+                          >  - greater than
+                          >= - greater than or equal to
+        @param value - portfolio value for condition to compare
+        @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
+        """
+        await self.cmd_function.alert.add_portfolio_alert(ctx, operator, value, fiat, "value")
+
+    @commands.command(name='addpc', pass_context=True)
+    async def addpc(self, ctx, operator: str, percent: float):
+        """
+        Adds alert for when your portfolio changes by a percent from its
+        value at the time the alert is set
+        An example for this command would be:
+        "$addpc <= -10"
+
+        @param operator - operator for the given choices
+                          <  - less than
+                          <= - less than or equal to
+                          >  - greater than
+                          >= - greater than or equal to
+        @param percent - percent change for condition to compare
+        """
+        await self.cmd_function.alert.add_portfolio_alert(ctx, operator, percent, "USD", "change")
+
     @commands.command(name='rema', pass_context=True)
     async def rema(self, ctx, alert_num: str):
         """
@@ -3,15 +3,21 @@ from cogs.alert_cmd_handler import AlertCommands
 # from cogs.cal_cmd_handler import CalCommands
 from cogs.coin_market_cmd_handler import CoinMarketCommands
 from cogs.misc_cmd_handler import MiscCommands
+from cogs.portfolio_cmd_handler import PortfolioCommands
 from cogs.subscriber_cmd_handler import SubscriberCommands
 from cogs.modules.core_functionality import CoreFunctionality
 
 
 def setup(bot):
-    cmd_function = CoreFunctionality(bot)
+    cmd_function = getattr(bot, "cmd_function", None)
+    if cmd_function is None:
+        cmd_function = CoreFunctionality(bot)
+        bot.cmd_function = cmd_function
+    cmd_function.start_updates()
     bot.add_cog(MiscCommands(cmd_function))
     bot.add_cog(AdminCommands(cmd_function))
     bot.add_cog(CoinMarketCommands(cmd_function))
     bot.add_cog(SubscriberCommands(cmd_function))
     bot.add_cog(AlertCommands(cmd_function))
+    bot.add_cog(PortfolioCommands(cmd_function))
     # bot.add_cog(CalCommands(cmd_function))
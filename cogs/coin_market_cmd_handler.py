@@ -60,6 +60,19 @@ class CoinMarketCommands:
         """
         await self.cmd_function.cmc.display_stats(ctx, fiat)
 
+    @commands.command(name='history', pass_context=True)
+    async def history(self, ctx, currency: str, hours: int=3, fiat='USD'):
+        """
+        Displays how a cryptocurrency moved over the last few hours.
+        An example for this command would be:
+        "$history bitcoin 3"
+
+        @param currency - cryptocurrency to look up
+        @param hours - number of hours to look back
+        @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
+        """
+        await self.cmd_function.cmc.display_history(ctx, currency, hours, fiat)
+
     @commands.command(name='profit', pass_context=True)
     async def profit(self, ctx, currency: str, currency_amt: float, cost: float, fiat='USD'):
         """
@@ -94,22 +107,38 @@ class CoinMarketCommands:
                                                      cost,
                                                      fiat)
 
-    # @commands.command(name='cb', pass_context=True)
-    # async def cb(self, ctx, currency1: str, currency2: str, currency_amt: float):
-    #     """
-    #     Displays conversion from one cryptocurrency to another
-    #     An example for this command would be:
-    #     "$cb bitcoin litecoin 500"
-
-    #     @param currency1 - currency to convert from
-    #     @param currency2 - currency to convert to
-    #     @param currency_amt - amount of currency1 to convert
-    #                           to currency2
-    #     """
-    #     await self.cmd_function.cmc.calculate_coin_to_coin(ctx,
-    #                                                        currency1,
-    #                                                        currency2,
-    #                                                        currency_amt)
+    @commands.command(name='cb', pass_context=True)
+    async def cb(self, ctx, currency1: str, currency2: str, currency_amt: float):
+        """
+        Displays conversion from one cryptocurrency to another
+        An example for this command would be:
+        "$cb bitcoin litecoin 500"
+
+        @param currency1 - currency to convert from
+        @param currency2 - currency to convert to
+        @param currency_amt - amount of currency1 to convert
+                              to currency2
+        """
+        await self.cmd_function.cmc.calculate_coin_to_coin(ctx,
+                                                           currency1,
+                                                           currency2,
+                                                           currency_amt)
+
+    @commands.command(name='conv', pass_context=True)
+    async def conv(self, ctx, amount: float, source: str, *targets):
+        """
+        Displays conversion from one coin or fiat to many coins and fiats.
+        An example for this command would be:
+        "$conv 1 btc eth ltc xrp usd eur"
+
+        @param amount - amount of the source to convert
+        @param source - coin or fiat to convert from
+        @param targets - coins and fiats to convert to
+        """
+        await self.cmd_function.cmc.calculate_multi_conversion(ctx,
+                                                               amount,
+                                                               source,
+                                                               targets)
 
     @commands.command(name='cc', pass_context=True)
     async def cc(self, ctx, currency: str, currency_amt: float, fiat='USD'):
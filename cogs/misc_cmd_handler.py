@@ -51,3 +51,24 @@ class MiscCommands:
         "$info"
         """
         await self.cmd_function.misc.display_info(ctx)
+
+    async def on_ready(self):
+        self.cmd_function.stats.rebuild_servers(self.cmd_function.bot.servers)
+
+    async def on_server_join(self, server):
+        self.cmd_function.stats.add_server(server)
+
+    async def on_server_remove(self, server):
+        self.cmd_function.stats.remove_server(server)
+
+    async def on_channel_create(self, channel):
+        self.cmd_function.stats.add_channel(channel)
+
+    async def on_channel_delete(self, channel):
+        self.cmd_function.stats.remove_channel(channel)
+
+    async def on_member_join(self, member):
+        self.cmd_function.stats.add_member()
+
+    async def on_member_remove(self, member):
+        self.cmd_function.stats.remove_member()
@@ -1,29 +1,42 @@
 from bot_logger import logger
+from bot_metrics import ALERT_EVAL_SECONDS, ALERTS_FIRED
 from cogs.modules.coin_market import CurrencyException, FiatException
+from cogs.modules.move_tracker import MoveTracker
 from collections import defaultdict
 from discord.errors import Forbidden
+from sharding import SharedFile, is_primary, owns_server, state_path
 import discord
 import json
+import time
 
 
 CMB_ADMIN = "CMB ADMIN"
 ADMIN_ONLY = "ADMIN_ONLY"
 ALERT_DISABLED = "ALERT_DISABLED"
+COIN_UNITS = ["btc", "eth"]
 
 
 class AlertFunctionality:
     """Handles Alert Command functionality"""
 
-    def __init__(self, bot, coin_market, alert_capacity, server_data):
+    def __init__(self, bot, coin_market, alert_capacity, server_data, history, portfolio, stats):
         self.bot = bot
+        self.stats = stats
         self.server_data = server_data
         self.coin_market = coin_market
+        self.portfolio = portfolio
         self.alert_capacity = alert_capacity
         self.market_list = ""
         self.acronym_list = ""
         self.supported_operators = ["<", ">", "<=", ">="]
+        self.move_tracker = MoveTracker(history)
+        self.alert_file = SharedFile('alerts.json', self._count_alerts)
         self.alert_data = self._check_alert_file()
         self._save_alert_file(self.alert_data, backup=True)
+        self._count_alerts()
+
+    def _count_alerts(self):
+        self.stats.alerts = sum(len(alert_list) for alert_list in self.alert_data.values())
 
     def update(self, market_list=None, acronym_list=None, server_data=None):
         """
@@ -33,9 +46,22 @@ class AlertFunctionality:
             self.server_data = server_data
         if market_list:
             self.market_list = market_list
+            self.move_tracker.update(market_list, self._get_watched_moves())
         if acronym_list:
             self.acronym_list = acronym_list
 
+    def _get_watched_moves(self):
+        """
+        Returns the (currency, window) pairs used by move alerts
+        """
+        watched = set()
+        for user in self.alert_data:
+            for alert_setting in self.alert_data[user].values():
+                if "move" in alert_setting:
+                    window = int(alert_setting["move"]["hours"])*3600
+                    watched.add((alert_setting["currency"], window))
+        return watched
+
     def _check_permission(self, ctx):
         """
         Checks if user contains the correct permissions to use these
@@ -59,8 +85,7 @@ class AlertFunctionality:
         Checks to see if there's a valid alerts.json file
         """
         try:
-            with open('alerts.json') as alerts:
-                return json.load(alerts)
+            return self.alert_file.load()
         except FileNotFoundError:
             self._save_alert_file()
             return json.loads('{}')
@@ -100,12 +125,23 @@ class AlertFunctionality:
         """
         if self.market_list is None:
             return True
+        if kwargs and "portfolio" in kwargs:
+            market_value = self._get_portfolio_metric(kwargs, fiat)
+            if market_value is None:
+                return True
+            return self._compare_values(market_value, operator, user_value)
         if currency in self.market_list:
             if kwargs:
-                if "btc" in kwargs:
-                    # market_value = float(self.market_list[currency]['quote']['BTC']["price"])
-                    return False  # temporarily disabled
-                if "hour" in kwargs:
+                coin_units = [unit for unit in COIN_UNITS if unit in kwargs]
+                if coin_units:
+                    market_value = self.coin_market.cross_rates.price(currency,
+                                                                      coin_units[0].upper())
+                elif "move" in kwargs:
+                    market_value = self.move_tracker.get_move(currency,
+                                                              int(kwargs["move"])*3600)
+                    if market_value is None:
+                        return True
+                elif "hour" in kwargs:
                     market_value = float(self.market_list[currency]['quote']['USD']["percent_change_1h"])
                 elif "day" in kwargs:
                     market_value = float(self.market_list[currency]['quote']['USD']["percent_change_24h"])
@@ -118,25 +154,116 @@ class AlertFunctionality:
                 market_value = float(self.coin_market.format_price(market_value,
                                                                    fiat,
                                                                    False))
-            if operator in self.supported_operators:
-                if operator == "<":
-                    if market_value < float(user_value):
-                        return False
-                elif operator == "<=":
-                    if market_value <= float(user_value):
-                        return False
-                elif operator == ">":
-                    if market_value > float(user_value):
-                        return False
-                elif operator == ">=":
-                    if market_value >= float(user_value):
-                        return False
-                return True
-            else:
-                raise Exception("Operator not supported: {}".format(operator))
+            return self._compare_values(market_value, operator, user_value)
         else:
             return False
 
+    def _compare_values(self, market_value, operator, user_value):
+        """
+        Compares the market value against the alert value
+
+        @param market_value - current value of what the alert watches
+        @param operator - operator condition to notify the channel
+        @param user_value - value for condition to compare
+        @return - True if condition doesn't exist, False if it does
+        """
+        if operator in self.supported_operators:
+            if operator == "<":
+                if market_value < float(user_value):
+                    return False
+            elif operator == "<=":
+                if market_value <= float(user_value):
+                    return False
+            elif operator == ">":
+                if market_value > float(user_value):
+                    return False
+            elif operator == ">=":
+                if market_value >= float(user_value):
+                    return False
+            return True
+        else:
+            raise Exception("Operator not supported: {}".format(operator))
+
+    def _get_portfolio_metric(self, kwargs, fiat):
+        """
+        Reads the precomputed portfolio total a portfolio alert watches
+
+        @param kwargs - portfolio alert settings (user, metric and base)
+        @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
+        @return - portfolio value in fiat or percent change since the
+                  alert was set, None if the user has no portfolio
+        """
+        totals = self.portfolio.get_totals(kwargs["user"])
+        if totals is None:
+            return None
+        value = totals[0]
+        if kwargs["portfolio"] == "value":
+            return float(self.coin_market.format_price(value, fiat, False))
+        base = float(kwargs["base"])
+        if base <= 0:
+            return None
+        return (value - base)/base*100
+
+    def _owns_alert(self, alert_setting):
+        """
+        Checks if this shard fires an alert
+
+        Alerts are fired by the shard serving the server they were set
+        in, and alerts set in direct messages by the first shard.
+
+        @param alert_setting - settings of the alert
+        """
+        server = alert_setting.get("server")
+        if server is None:
+            return is_primary()
+        return owns_server(server)
+
+    def _check_portfolio_alerts(self):
+        """
+        Checks every portfolio alert in one pass over the portfolio totals
+
+        Each user's total is read once and each fiat rate is looked up
+        once, however many portfolio alerts there are.
+
+        @return - set of (user, alert number) whose condition is met
+        """
+        met = set()
+        rates = {}
+        for user, totals in self.portfolio.iter_totals(self.alert_data):
+            value = totals[0]
+            for alert, alert_setting in self.alert_data[user].items():
+                portfolio_setting = alert_setting.get("portfolio")
+                if portfolio_setting is None or not self._owns_alert(alert_setting):
+                    continue
+                if portfolio_setting["metric"] == "value":
+                    fiat = alert_setting["fiat"].upper()
+                    if fiat not in rates:
+                        rates[fiat] = self.coin_market.cross_rates.fiat_rate(fiat)
+                    market_value = value*rates[fiat]
+                else:
+                    base = float(portfolio_setting["base"])
+                    if base <= 0:
+                        continue
+                    market_value = (value - base)/base*100
+                if not self._compare_values(market_value,
+                                            alert_setting["operation"],
+                                            portfolio_setting["value"]):
+                    met.add((user, alert))
+        return met
+
+    def _format_portfolio_alert_value(self, alert_setting):
+        """
+        Formats the value of a portfolio alert for display
+
+        @param alert_setting - settings of the portfolio alert
+        @return - value with fiat or percent change since the alert was set
+        """
+        portfolio_setting = alert_setting["portfolio"]
+        if portfolio_setting["metric"] == "value":
+            return "{} {}".format(portfolio_setting["value"],
+                                  alert_setting["fiat"])
+        return "{}% (since set)".format(portfolio_setting["value"])
+
     async def _say_msg(self, msg=None, channel=None, emb=None):
         """
         Bot will say msg if given correct permissions
@@ -180,6 +307,9 @@ class AlertFunctionality:
                     return
             if currency not in self.market_list:
                 raise CurrencyException("Currency is invalid: ``{}``".format(currency))
+            if "move" in kwargs and int(kwargs["move"]) <= 0:
+                await self._say_msg("Number of hours must be greater than 0.")
+                return
             try:
                 if not self._check_alert(currency, operator, user_value, ucase_fiat, kwargs):
                     await self._say_msg("Failed to create alert. Current price "
@@ -190,51 +320,130 @@ class AlertFunctionality:
                 await self._say_msg("Invalid operator: **{}**".format(operator))
                 return
             user_id = ctx.message.author.id
-            if user_id not in self.alert_data:
-                self.alert_data[user_id] = {}
-            for i in range(1, len(self.alert_data[user_id]) + 2):
-                if str(i) not in self.alert_data[user_id]:
-                    alert_num = str(i)
-            if alert_num is None:
-                raise Exception("Something went wrong with adding alert.")
-            alert_cap = int(self.alert_capacity)
-            if int(alert_num) > alert_cap:
-                await self.bot.say("Unable to add alert, user alert capacity of"
-                                   " **{}** has been reached.".format(alert_cap))
+            async with self.alert_file.edit(self.alert_data):
+                if user_id not in self.alert_data:
+                    self.alert_data[user_id] = {}
+                for i in range(1, len(self.alert_data[user_id]) + 2):
+                    if str(i) not in self.alert_data[user_id]:
+                        alert_num = str(i)
+                if alert_num is None:
+                    raise Exception("Something went wrong with adding alert.")
+                alert_cap = int(self.alert_capacity)
+                if int(alert_num) > alert_cap:
+                    await self.bot.say("Unable to add alert, user alert capacity of"
+                                       " **{}** has been reached.".format(alert_cap))
+                    return
+                alert_list = self.alert_data[user_id]
+                alert_list[alert_num] = {}
+                channel_alert = alert_list[alert_num]
+                channel_alert["currency"] = currency
+                channel_alert["channel"] = ctx.message.channel.id
+                if ctx.message.server is not None:
+                    channel_alert["server"] = ctx.message.server.id
+                if operator in self.supported_operators:
+                    channel_alert["operation"] = operator
+                else:
+                    await self._say_msg("Invalid operator: {}. Your choices are **<*"
+                                        "*, **<=**, **>**, or **>=**"
+                                        "".format(operator))
+                    return
+                if kwargs:
+                    coin_units = [unit for unit in COIN_UNITS if unit in kwargs]
+                    if coin_units:
+                        user_value = "{:.8f}".format(user_value).rstrip('0')
+                        if user_value.endswith('.'):
+                            user_value = user_value.replace('.', '')
+                        channel_alert["unit"] = {coin_units[0]: "{}".format(user_value)}
+                    elif "move" in kwargs:
+                        move_percent = ("{:.6f}".format(user_value)).rstrip('0')
+                        if move_percent.endswith('.'):
+                            move_percent = move_percent.replace('.', '')
+                        channel_alert["move"] = {"percent": move_percent,
+                                                 "hours": str(kwargs["move"])}
+                    else:
+                        channel_alert["percent"] = ("{}".format(user_value)).rstrip('0')
+                        for arg in kwargs:
+                            channel_alert["percent_change"] = arg
+                else:
+                    channel_alert["price"] = ("{:.6f}".format(user_value)).rstrip('0')
+                    if channel_alert["price"].endswith('.'):
+                        channel_alert["price"] = channel_alert["price"].replace('.', '')
+                channel_alert["fiat"] = ucase_fiat
+                self._save_alert_file(self.alert_data)
+                self.stats.alerts += 1
+                await self._say_msg("Alert has been set. This bot will post the "
+                                    "alert in this specific channel.")
+        except CurrencyException as e:
+            logger.error("CurrencyException: {}".format(str(e)))
+            await self._say_msg(str(e))
+        except FiatException as e:
+            logger.error("FiatException: {}".format(str(e)))
+            await self._say_msg(str(e))
+        except Exception as e:
+            print("Failed to add alert. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
+
+    async def add_portfolio_alert(self, ctx, operator, user_value, fiat, metric):
+        """
+        Adds an alert on the user's whole portfolio to alerts.json
+
+        @param operator - operator condition to notify the channel
+        @param user_value - portfolio value or percent change to compare
+        @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
+        @param metric - 'value' for total value, 'change' for percent
+                        change since the alert was set
+        """
+        try:
+            if not self._check_permission(ctx):
                 return
-            alert_list = self.alert_data[user_id]
-            alert_list[alert_num] = {}
-            channel_alert = alert_list[alert_num]
-            channel_alert["currency"] = currency
-            channel_alert["channel"] = ctx.message.channel.id
-            if operator in self.supported_operators:
-                channel_alert["operation"] = operator
-            else:
+            ucase_fiat = self.coin_market.fiat_check(fiat)
+            if operator not in self.supported_operators:
                 await self._say_msg("Invalid operator: {}. Your choices are **<*"
                                     "*, **<=**, **>**, or **>=**"
                                     "".format(operator))
                 return
-            if kwargs:
-                if "btc" in kwargs:
-                    user_value = "{:.8f}".format(user_value).rstrip('0')
-                    if user_value.endswith('.'):
-                        user_value = user_value.replace('.', '')
-                    channel_alert["unit"] = {"btc": "{}".format(user_value)}
-                else:
-                    channel_alert["percent"] = ("{}".format(user_value)).rstrip('0')
-                    for arg in kwargs:
-                        channel_alert["percent_change"] = arg
-            else:
-                channel_alert["price"] = ("{:.6f}".format(user_value)).rstrip('0')
-                if channel_alert["price"].endswith('.'):
-                    channel_alert["price"] = channel_alert["price"].replace('.', '')
-            channel_alert["fiat"] = ucase_fiat
-            self._save_alert_file(self.alert_data)
-            await self._say_msg("Alert has been set. This bot will post the "
-                                "alert in this specific channel.")
-        except CurrencyException as e:
-            logger.error("CurrencyException: {}".format(str(e)))
-            await self._say_msg(str(e))
+            user_id = ctx.message.author.id
+            self.portfolio.refresh()
+            totals = self.portfolio.get_totals(user_id)
+            if totals is None:
+                await self._say_msg("You don't have a portfolio yet. Add some "
+                                    "lots with `$padd` first.")
+                return
+            kwargs = {"portfolio": metric, "user": user_id, "base": totals[0]}
+            if not self._check_alert("portfolio", operator, user_value, ucase_fiat, kwargs):
+                await self._say_msg("Failed to create alert. Your portfolio "
+                                    "already meets the condition.")
+                return
+            async with self.alert_file.edit(self.alert_data):
+                if user_id not in self.alert_data:
+                    self.alert_data[user_id] = {}
+                alert_list = self.alert_data[user_id]
+                alert_num = None
+                for i in range(1, len(alert_list) + 2):
+                    if str(i) not in alert_list:
+                        alert_num = str(i)
+                        break
+                alert_cap = int(self.alert_capacity)
+                if int(alert_num) > alert_cap:
+                    await self._say_msg("Unable to add alert, user alert capacity of"
+                                        " **{}** has been reached.".format(alert_cap))
+                    return
+                formatted_value = ("{:.6f}".format(user_value)).rstrip('0')
+                if formatted_value.endswith('.'):
+                    formatted_value = formatted_value.replace('.', '')
+                alert_list[alert_num] = {"currency": "portfolio",
+                                         "channel": ctx.message.channel.id,
+                                         "operation": operator,
+                                         "portfolio": {"metric": metric,
+                                                       "value": formatted_value,
+                                                       "base": "{}".format(totals[0])},
+                                         "fiat": ucase_fiat}
+                if ctx.message.server is not None:
+                    alert_list[alert_num]["server"] = ctx.message.server.id
+                self._save_alert_file(self.alert_data)
+                self.stats.alerts += 1
+                await self._say_msg("Alert has been set. This bot will post the "
+                                    "alert in this specific channel.")
         except FiatException as e:
             logger.error("FiatException: {}".format(str(e)))
             await self._say_msg(str(e))
@@ -246,11 +455,10 @@ class AlertFunctionality:
         """
         Saves alerts.json file
         """
-        if backup:
-            alert_filename = "alerts_backup.json"
-        else:
-            alert_filename = "alerts.json"
-        with open(alert_filename, 'w') as outfile:
+        if not backup:
+            self.alert_file.save(alert_data)
+            return
+        with open(state_path("alerts_backup.json"), 'w') as outfile:
             json.dump(alert_data,
                       outfile,
                       indent=4)
@@ -266,49 +474,56 @@ class AlertFunctionality:
             if not self._check_permission(ctx):
                 return
             user_id = ctx.message.author.id
-            user_list = self.alert_data
-            alert_list = user_list[user_id]
-            if alert_num in alert_list:
-                removed_alert = alert_num
-                alert_setting = alert_list[alert_num]
-                alert_currency = alert_setting["currency"]
-                alert_operation = self._translate_operation(alert_setting["operation"])
-                if "unit" in alert_setting:
-                    if "btc" in alert_setting["unit"]:
-                        alert_btc = alert_setting["unit"]["btc"]
-                        if alert_btc.endswith('.'):
-                            alert_btc = alert_btc.replace('.', '')
-                            alert_btc = alert_btc.replace(',', '')
-                        alert_value = "{} BTC".format(alert_btc)
-                elif "percent" in alert_setting:
-                    alert_percent = alert_setting["percent"]
-                    if alert_percent.endswith('.'):
-                        alert_percent = alert_percent.replace('.', '')
-                    alert_value = "{}%".format(alert_percent)
-                    if "hour" == alert_setting["percent_change"]:
-                        alert_value += " (1H)"
-                    elif "day" == alert_setting["percent_change"]:
-                        alert_value += " (24H)"
-                    elif "week" == alert_setting["percent_change"]:
-                        alert_value += " (7D)"
+            async with self.alert_file.edit(self.alert_data):
+                user_list = self.alert_data
+                alert_list = user_list[user_id]
+                if alert_num in alert_list:
+                    removed_alert = alert_num
+                    alert_setting = alert_list[alert_num]
+                    alert_currency = alert_setting["currency"]
+                    alert_operation = self._translate_operation(alert_setting["operation"])
+                    if "unit" in alert_setting:
+                        for unit, alert_unit_value in alert_setting["unit"].items():
+                            if alert_unit_value.endswith('.'):
+                                alert_unit_value = alert_unit_value.replace('.', '')
+                                alert_unit_value = alert_unit_value.replace(',', '')
+                            alert_value = "{} {}".format(alert_unit_value, unit.upper())
+                    elif "move" in alert_setting:
+                        alert_operation = "moving"
+                        alert_value = "{}% within {}H".format(alert_setting["move"]["percent"],
+                                                              alert_setting["move"]["hours"])
+                    elif "portfolio" in alert_setting:
+                        alert_value = self._format_portfolio_alert_value(alert_setting)
+                    elif "percent" in alert_setting:
+                        alert_percent = alert_setting["percent"]
+                        if alert_percent.endswith('.'):
+                            alert_percent = alert_percent.replace('.', '')
+                        alert_value = "{}%".format(alert_percent)
+                        if "hour" == alert_setting["percent_change"]:
+                            alert_value += " (1H)"
+                        elif "day" == alert_setting["percent_change"]:
+                            alert_value += " (24H)"
+                        elif "week" == alert_setting["percent_change"]:
+                            alert_value += " (7D)"
+                    else:
+                        alert_value = alert_setting["price"]
+                    alert_fiat = alert_setting["fiat"]
+                    alert_list.pop(str(alert_num))
+                    self._save_alert_file(self.alert_data)
+                    self.stats.alerts -= 1
+                    msg = ("Alert **{}** where **{}** is **{}** **{}** "
+                           "".format(removed_alert,
+                                     alert_currency.title(),
+                                     alert_operation,
+                                     alert_value))
+                    if "price" in alert_setting:
+                        msg += "**{}** ".format(alert_fiat)
+                    msg += "was successfully removed."
+                    await self._say_msg(msg)
                 else:
-                    alert_value = alert_setting["price"]
-                alert_fiat = alert_setting["fiat"]
-                alert_list.pop(str(alert_num))
-                self._save_alert_file(self.alert_data)
-                msg = ("Alert **{}** where **{}** is **{}** **{}** "
-                       "".format(removed_alert,
-                                 alert_currency.title(),
-                                 alert_operation,
-                                 alert_value))
-                if "price" in alert_setting:
-                    msg += "**{}** ".format(alert_fiat)
-                msg += "was successfully removed."
-                await self._say_msg(msg)
-            else:
-                await self._say_msg("The number you've entered does not exist "
-                                    "in the alert list. Use `$geta` to receive "
-                                    "a list of ongoing alerts.")
+                    await self._say_msg("The number you've entered does not exist "
+                                        "in the alert list. Use `$geta` to receive "
+                                        "a list of ongoing alerts.")
         except Forbidden:
             pass
         except CurrencyException as e:
@@ -327,6 +542,7 @@ class AlertFunctionality:
         try:
             if not self._check_permission(ctx):
                 return
+            self.alert_file.refresh(self.alert_data)
             user_id = ctx.message.author.id
             user_list = self.alert_data
             msg = {}
@@ -338,12 +554,16 @@ class AlertFunctionality:
                         currency = alert_list[alert]["currency"].title()
                         operation = self._translate_operation(alert_list[alert]["operation"])
                         if "unit" in alert_list[alert]:
-                            if "btc" in alert_list[alert]["unit"]:
-                                alert_btc = alert_list[alert]["unit"]["btc"]
-                                if alert_btc.endswith('.'):
-                                    alert_btc = alert_btc.replace('.', '')
-                                    alert_btc = alert_btc.replace(',', '')
-                                alert_value = "{}".format(alert_btc)
+                            for unit, alert_unit_value in alert_list[alert]["unit"].items():
+                                if alert_unit_value.endswith('.'):
+                                    alert_unit_value = alert_unit_value.replace('.', '')
+                                    alert_unit_value = alert_unit_value.replace(',', '')
+                                alert_value = "{}".format(alert_unit_value)
+                        elif "move" in alert_list[alert]:
+                            operation = "moving"
+                            alert_value = "{}%".format(alert_list[alert]["move"]["percent"])
+                        elif "portfolio" in alert_list[alert]:
+                            alert_value = self._format_portfolio_alert_value(alert_list[alert])
                         elif "percent" in alert_list[alert]:
                             alert_percent = alert_list[alert]["percent"]
                             if alert_percent.endswith('.'):
@@ -358,8 +578,13 @@ class AlertFunctionality:
                                                      operation,
                                                      alert_value))
                         if "unit" in alert_list[alert]:
-                            if "btc" in alert_list[alert]["unit"]:
-                                msg[int(alert)] += "**BTC**\n"
+                            for unit in alert_list[alert]["unit"]:
+                                msg[int(alert)] += "**{}**\n".format(unit.upper())
+                        elif "move" in alert_list[alert]:
+                            msg[int(alert)] += ("within **{}H**\n"
+                                                "".format(alert_list[alert]["move"]["hours"]))
+                        elif "portfolio" in alert_list[alert]:
+                            msg[int(alert)] += "\n"
                         elif "percent_change" in alert_list[alert]:
                             if "hour" == alert_list[alert]["percent_change"]:
                                 msg[int(alert)] += "(**1H**)\n"
@@ -396,19 +621,35 @@ class AlertFunctionality:
         """
         Checks and displays alerts that have met the condition of the
         cryptocurrency price
+
+        @return - (number of alerts checked, number of alerts raised)
         """
+        evaluated = 0
+        fired = 0
         try:
+            evaluation_start = time.perf_counter()
             kwargs = {}
             raised_alerts = defaultdict(list)
-            for user in self.alert_data:
-                alert_list = self.alert_data[str(user)]
-                for alert in alert_list:
+            self.alert_file.refresh(self.alert_data)
+            self.portfolio.refresh()
+            portfolio_alerts_met = self._check_portfolio_alerts()
+            # other shards may change the alerts while messages are sent
+            for user, alert_list in list(self.alert_data.items()):
+                for alert in list(alert_list):
+                    if alert not in alert_list or not self._owns_alert(alert_list[alert]):
+                        continue
+                    evaluated += 1
                     alert_currency = alert_list[alert]["currency"]
                     operator_symbol = alert_list[alert]["operation"]
                     if "unit" in alert_list[alert]:
-                        if "btc" in alert_list[alert]["unit"]:
-                            alert_value = alert_list[alert]["unit"]["btc"]
-                            kwargs["btc"] = True
+                        for unit, alert_unit_value in alert_list[alert]["unit"].items():
+                            alert_value = alert_unit_value
+                            kwargs[unit] = True
+                    elif "move" in alert_list[alert]:
+                        alert_value = alert_list[alert]["move"]["percent"]
+                        kwargs["move"] = alert_list[alert]["move"]["hours"]
+                    elif "portfolio" in alert_list[alert]:
+                        alert_value = alert_list[alert]["portfolio"]["value"]
                     elif "percent_change" in alert_list[alert]:
                         alert_value = alert_list[alert]["percent"]
                         if alert_value.endswith('.'):
@@ -417,11 +658,17 @@ class AlertFunctionality:
                     else:
                         alert_value = alert_list[alert]["price"]
                     alert_fiat = alert_list[alert]["fiat"]
-                    if not self._check_alert(alert_currency, operator_symbol,
-                                             alert_value, alert_fiat,
-                                             kwargs):
+                    if "portfolio" in alert_list[alert]:
+                        alert_met = (user, alert) in portfolio_alerts_met
+                    else:
+                        alert_met = not self._check_alert(alert_currency,
+                                                          operator_symbol,
+                                                          alert_value,
+                                                          alert_fiat,
+                                                          kwargs)
+                    if alert_met:
                         alert_operator = self._translate_operation(operator_symbol)
-                        raised_alerts[user].append(alert)
+                        raised_alerts[user].append((alert, alert_list[alert]))
                         if "channel" not in alert_list[alert]:
                             channel_obj = await self.bot.get_user_info(user)
                         else:
@@ -429,14 +676,24 @@ class AlertFunctionality:
                             channel_obj = self.bot.get_channel(channel_obj)
                             if not channel_obj:
                                 channel_obj = await self.bot.get_user_info(user)
-                        if alert_currency in self.market_list:
+                        if "portfolio" in alert_list[alert]:
+                            msg = ("**Portfolio** is **{}** **{}**\n<@{}>"
+                                   "".format(alert_operator,
+                                             self._format_portfolio_alert_value(alert_list[alert]),
+                                             user))
+                        elif alert_currency in self.market_list:
+                            if "move" in alert_list[alert]:
+                                alert_operator = "moving"
                             msg = ("**{}** is **{}** **{}**"
                                    "".format(alert_currency.title(),
                                              alert_operator,
                                              alert_value))
                             if "unit" in alert_list[alert]:
-                                if "btc" in alert_list[alert]["unit"]:
-                                    msg += " **BTC**\n"
+                                for unit in alert_list[alert]["unit"]:
+                                    msg += " **{}**\n".format(unit.upper())
+                            elif "move" in alert_list[alert]:
+                                msg += ("% within **{}H**\n"
+                                        "".format(alert_list[alert]["move"]["hours"]))
                             elif "percent_change" in alert_list[alert]:
                                 if "hour" == alert_list[alert]["percent_change"]:
                                     msg += "% (**1H**)\n"
@@ -458,10 +715,21 @@ class AlertFunctionality:
                         await self._say_msg(channel=channel_obj, emb=em)
                     kwargs.clear()
             if raised_alerts:
-                for user in raised_alerts:
-                    for alert_num in raised_alerts[user]:
-                        self.alert_data[user].pop(str(alert_num))
-                self._save_alert_file(self.alert_data)
+                async with self.alert_file.edit(self.alert_data):
+                    for user in raised_alerts:
+                        alert_list = self.alert_data.get(user, {})
+                        for alert_num, alert_setting in raised_alerts[user]:
+                            # the user may have replaced it in the meantime
+                            if alert_list.get(str(alert_num)) == alert_setting:
+                                alert_list.pop(str(alert_num))
+                                fired += 1
+                    self._save_alert_file(self.alert_data)
+                self.stats.alerts -= fired
+                self.stats.record_alerts_fired(fired)
+                ALERTS_FIRED.inc(fired)
+            ALERT_EVAL_SECONDS.observe(time.perf_counter() - evaluation_start)
         except Exception as e:
             print("Failed to alert user. See error.log.")
             logger.error("Exception: {}".format(str(e)))
+            raise
+        return evaluated, fired
@@ -1,7 +1,6 @@
 from bot_logger import logger
-from coinmarketcap import Market
-from currency_converter import CurrencyConverter
-from requests.exceptions import RequestException
+from bot_metrics import FETCH_RETRIES, FETCH_SECONDS
+from cogs.modules.cross_rates import CrossRateException, CrossRates
 
 fiat_currencies = {
     'AUD': '$', 'BRL': 'R$', 'CAD': '$', 'CHF': 'Fr.',
@@ -20,7 +19,11 @@ fiat_suffix = [
     'SEK'
 ]
 
-ETHEREUM = "ethereum"
+LISTINGS_ENDPOINT = "/v1/cryptocurrency/listings/latest"
+STATS_ENDPOINT = "/v1/global-metrics/quotes/latest"
+REQUEST_TIMEOUT = 30
+MAX_FETCH_RETRIES = 10
+FETCH_RETRY_DELAY = 5
 SMALL_GREEN_TRIANGLE = "<:small_green_triangle:396586561413578752>"
 SMALL_RED_TRIANGLE = ":small_red_triangle_down:"
 
@@ -41,14 +44,98 @@ class MarketStatsException(Exception):
     """Exception class for invalid retrieval of market stats"""
 
 
+class CoinMarketCapClient:
+    """
+    Fetches listings and global stats from a CoinMarketCap compatible API
+    at any address, such as a mirror or a local stub
+    """
+
+    def __init__(self, api_key, api_url, timeout=REQUEST_TIMEOUT):
+        self.api_key = api_key
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+
+    def _get(self, endpoint, params):
+        import requests
+        response = requests.get(self.api_url + endpoint,
+                                params=params,
+                                headers={"X-CMC_PRO_API_KEY": self.api_key},
+                                timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def listings(self, limit=5000, convert="USD"):
+        return self._get(LISTINGS_ENDPOINT, {"limit": limit, "convert": convert})
+
+    def stats(self, convert="USD"):
+        return self._get(STATS_ENDPOINT, {"convert": convert})
+
+
 class CoinMarket:
     """Handles CoinMarketCap API features"""
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, api_url=None):
         """
         Initiates CoinMarket
+
+        @param api_key - CoinMarketCap API key
+        @param api_url - address of another CoinMarketCap compatible API
+                         to use instead of CoinMarketCap
+        """
+        self.api_key = api_key
+        self.api_url = api_url
+        self.market = None
+        self.cross_rates = CrossRates(fiat_currencies)
+
+    def _get_market(self):
+        """
+        Returns the CoinMarketCap client, importing it on first use
+        """
+        if self.market is None:
+            if self.api_url:
+                self.market = CoinMarketCapClient(self.api_key, self.api_url)
+            else:
+                from coinmarketcap import Market
+                self.market = Market(self.api_key)
+        return self.market
+
+    async def fetch_market(self, sleep=None):
+        """
+        Fetches the global stats and the listings, retrying whichever
+        failed
+
+        @param sleep - coroutine function used to wait between retries
+        @return - (market stats, currency data)
         """
-        self.market = Market(api_key)
+        if sleep is None:
+            import asyncio
+            sleep = asyncio.sleep
+        retry_count = 0
+        with FETCH_SECONDS.time(endpoint="stats"):
+            market_stats = self.fetch_coinmarket_stats()
+        with FETCH_SECONDS.time(endpoint="listings"):
+            currency_data = self.fetch_currency_data()
+        while market_stats is None or currency_data is None:
+            if retry_count >= MAX_FETCH_RETRIES:
+                msg = ("Max retry attempts reached. Please make "
+                       "sure you're able to access coinmarketcap "
+                       "through their website, check if the coinmarketapi "
+                       "is down, and check if "
+                       "anything is blocking you from requesting "
+                       "data.")
+                raise CoinMarketException(msg)
+            logger.warning("Retrying to get data..")
+            if market_stats is None:
+                FETCH_RETRIES.inc(endpoint="stats")
+                with FETCH_SECONDS.time(endpoint="stats"):
+                    market_stats = self.fetch_coinmarket_stats()
+            if currency_data is None:
+                FETCH_RETRIES.inc(endpoint="listings")
+                with FETCH_SECONDS.time(endpoint="listings"):
+                    currency_data = self.fetch_currency_data()
+            retry_count += 1
+            await sleep(FETCH_RETRY_DELAY)
+        return market_stats, currency_data
 
     def fiat_check(self, fiat):
         """
@@ -74,9 +161,22 @@ class CoinMarket:
                         if False symbol will not be added
         @return - formatted price under fiat
         """
-        c = CurrencyConverter()
         ucase_fiat = fiat.upper()
-        price = float(c.convert(float(price), "USD", fiat))
+        price = float(price) * self.cross_rates.fiat_rate(ucase_fiat)
+        return self.format_fiat_amount(price, ucase_fiat, symbol)
+
+    def format_fiat_amount(self, amount, fiat, symbol=True):
+        """
+        Formats an amount that is already in the desired fiat
+
+        @param amount - amount to format
+        @param fiat - fiat currency of the amount (i.e. 'EUR', 'USD')
+        @param symbol - if True add currency symbol to fiat
+                        if False symbol will not be added
+        @return - formatted amount
+        """
+        ucase_fiat = fiat.upper()
+        price = amount
         if symbol:
             if ucase_fiat in fiat_suffix:
                 formatted_fiat = "{:,.6f} {}".format(float(price),
@@ -98,8 +198,9 @@ class CoinMarket:
         @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
         @return - currency data
         """
+        from requests.exceptions import RequestException
         try:
-            return self.market.listings(limit=5000, convert=fiat)
+            return self._get_market().listings(limit=5000, convert=fiat)
         except RequestException as e:
             logger.error("Failed to retrieve data - "
                          "Connection error: {}".format(str(e)))
@@ -107,6 +208,22 @@ class CoinMarket:
         except Exception as e:
             raise CurrencyException("Failed to fetch all cryptocurrencies: `{}`".format(str(e)))
 
+    def _format_coin_price(self, currency, unit):
+        """
+        Formats the price of a coin in BTC or ETH
+
+        @param currency - slug of the cryptocurrency
+        @param unit - 'BTC' or 'ETH'
+        @return - formatted price or 'Unknown' if no rate is available
+        """
+        try:
+            coin_price = '{:,.8f}'.format(self.cross_rates.price(currency, unit)).rstrip('0')
+        except CrossRateException:
+            return 'Unknown'
+        if coin_price.endswith('.'):
+            coin_price = coin_price.replace('.', '')
+        return '**{}**'.format(coin_price)
+
     def _format_currency_data(self, data, fiat, single_search=True):
         """
         Formats the data fetched
@@ -118,7 +235,7 @@ class CoinMarket:
         @return - formatted currency data
         """
         try:
-            price = CurrencyConverter()
+            rate = self.cross_rates.fiat_rate(fiat)
             isPositivePercent = True
             formatted_data = ''
             hour_trend = ''
@@ -133,30 +250,22 @@ class CoinMarket:
                                                                                                  data['symbol'],
                                                                                                  hour_trend,
                                                                                                  data['slug'])
-            converted_price = float(price.convert(float(data['quote']['USD']['price']),
-                                                  'USD',
-                                                  fiat))
+            converted_price = float(data['quote']['USD']['price']) * rate
             converted_price = "{:,.6f}".format(converted_price).rstrip('0')
             if converted_price.endswith('.'):
                 converted_price = converted_price.replace('.', '')
-            # formatted_btc = '{:,.8f}'.format(float(data['price_btc'])).rstrip('0')
-            # if formatted_btc.endswith('.'):
-            #     formatted_btc = formatted_btc.replace('.', '')
-            # eth_price = eth_price.rstrip('.')
-            # if single_search:
-            #     eth_price += '\n'
+            formatted_btc = self._format_coin_price(data['slug'], 'BTC')
+            formatted_eth = self._format_coin_price(data['slug'], 'ETH')
+            if single_search:
+                formatted_eth += '\n'
             if data['quote']['USD']['market_cap'] is None:
                 formatted_market_cap = 'Unknown'
             else:
-                converted_market_cap = price.convert(float(data['quote']['USD']['market_cap']),
-                                                     'USD',
-                                                     fiat)
+                converted_market_cap = float(data['quote']['USD']['market_cap']) * rate
             if data['quote']['USD']['volume_24h'] is None:
                 formatted_volume_24h = 'Unknown'
             else:
-                converted_volume_24h = price.convert(float(data['quote']['USD']['volume_24h']),
-                                                     'USD',
-                                                     fiat)
+                converted_volume_24h = float(data['quote']['USD']['volume_24h']) * rate
             if fiat in fiat_suffix:
                 formatted_price = '**{} {}**'.format(converted_price,
                                                      fiat_currencies[fiat])
@@ -191,8 +300,8 @@ class CoinMarket:
             percent_change_7d = '**{}%**'.format(data['quote']['USD']['percent_change_7d'])
             formatted_data = ("{}\n"
                               "Price ({}): {}\n"
-                              # "Price (BTC): **{}**\n"
-                              # "Price (ETH): **{}**\n"
+                              "Price (BTC): {}\n"
+                              "Price (ETH): {}\n"
                               "Market Cap ({}): {}\n"
                               "Volume 24h ({}): {}\n"
                               "Circulating Supply: {}\n"
@@ -203,8 +312,8 @@ class CoinMarket:
                               "".format(header,
                                         fiat,
                                         formatted_price,
-                                        # formatted_btc,
-                                        # eth_price,
+                                        formatted_btc,
+                                        formatted_eth,
                                         fiat,
                                         formatted_market_cap,
                                         fiat,
@@ -240,7 +349,6 @@ class CoinMarket:
             if currency not in market_list:
                 raise CurrencyException("Invalid currency: `{}`".format(currency))
             data = market_list[currency]
-            # eth_price = self.get_converted_coin_amt(market_list, currency, ETHEREUM, 1)
             formatted_data, isPositivePercent = self._format_currency_data(data, fiat)
             id_number = market_list[currency]['id']
             return formatted_data, isPositivePercent, id_number
@@ -258,8 +366,9 @@ class CoinMarket:
         @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
         @return - market stats
         """
+        from requests.exceptions import RequestException
         try:
-            return self.market.stats(convert=fiat)
+            return self._get_market().stats(convert=fiat)
         except RequestException as e:
             logger.error("Failed to retrieve data - "
                          "Connection error: {}".format(str(e)))
@@ -276,12 +385,12 @@ class CoinMarket:
         @return - formatted stats
         """
         try:
-            c = CurrencyConverter()
+            rate = self.cross_rates.fiat_rate(fiat)
             formatted_stats = ''
             if stats['data']['quote']['USD']['total_market_cap'] is None:
                 formatted_stats += "Total Market Cap (USD): Unknown"
             else:
-                converted_price = int(c.convert(float(stats['data']['quote']['USD']['total_market_cap']), 'USD', fiat))
+                converted_price = int(float(stats['data']['quote']['USD']['total_market_cap']) * rate)
                 if fiat in fiat_suffix:
                     formatted_stats += "Total Market Cap ({}): **{:,} {}**\n".format(fiat,
                                                                                      converted_price,
@@ -293,7 +402,7 @@ class CoinMarket:
             if stats['data']['quote']['USD']['total_volume_24h'] is None:
                 formatted_stats += "Total Volume 24h (USD): Unknown"
             else:
-                converted_price = int(c.convert(float(stats['data']['quote']['USD']['total_volume_24h']), 'USD', fiat))
+                converted_price = int(float(stats['data']['quote']['USD']['total_volume_24h']) * rate)
                 if fiat in fiat_suffix:
                     formatted_stats += "Total Volume 24h ({}): **{:,} {}**\n".format(fiat,
                                                                                      converted_price,
@@ -360,13 +469,8 @@ class CoinMarket:
                                             "".format(currency))
             data_list.sort(key=lambda x: int(x['cmc_rank']))
             for data in data_list:
-                # eth_price = self.get_converted_coin_amt(market_list,
-                #                                         data['id'],
-                #                                         ETHEREUM,
-                #                                         1)
                 if cached_data is None:
                     formatted_msg = self._format_currency_data(data,
-                                                               # eth_price,
                                                                fiat,
                                                                False)[0]
                 else:
@@ -375,7 +479,6 @@ class CoinMarket:
                             cached_data[fiat] = {}
                         if data['id'] not in cached_data[fiat]:
                             formatted_msg = self._format_currency_data(data,
-                                                                       # eth_price,
                                                                        fiat,
                                                                        False)[0]
                             cached_data[fiat][data['id']] = formatted_msg
@@ -383,7 +486,6 @@ class CoinMarket:
                             formatted_msg = cached_data[fiat][data['id']]
                     else:
                         formatted_msg = self._format_currency_data(data,
-                                                                   # eth_price,
                                                                    fiat,
                                                                    False)[0]
                         if fiat not in cached_data:
@@ -404,16 +506,16 @@ class CoinMarket:
         except Exception as e:
             raise CoinMarketException(e)
 
-    def get_converted_coin_amt(self, market_list, currency1, currency2, currency_amt):
+    def get_converted_coin_amt(self, currency1, currency2, currency_amt):
         """
-        Converts coin to coin based on btc price
+        Converts coin to coin based on the current cross rates
         """
         try:
-            price_btc1 = float(market_list[currency1]['price_btc'])
-            price_btc2 = float(market_list[currency2]['price_btc'])
-            btc_amt = float("{:.8f}".format(currency_amt * price_btc1))
-            converted_amt = "{:.8f}".format(btc_amt/price_btc2).rstrip('0')
-            return converted_amt
+            converted_amt = self.cross_rates.convert(currency_amt,
+                                                     currency1,
+                                                     currency2)
+            converted_amt = "{:.8f}".format(converted_amt).rstrip('0')
+            return converted_amt.rstrip('.')
         except Exception as e:
             print("Failed to convert coin. See error.log.")
             logger.error("Exception: {}".format(str(e)))
@@ -1,5 +1,6 @@
 from bot_logger import logger
-from cogs.modules.coin_market import CoinMarketException, CurrencyException, FiatException, MarketStatsException
+from cogs.modules.coin_market import CoinMarketException, CurrencyException, FiatException, MarketStatsException, fiat_currencies
+from cogs.modules.single_flight import SingleFlight
 from discord.errors import Forbidden
 import discord
 
@@ -7,14 +8,16 @@ import discord
 CMB_ADMIN = "CMB ADMIN"
 ADMIN_ONLY = "ADMIN_ONLY"
 CMC_DISABLED = "CMC_DISABLED"
+MAX_CONVERSION_TARGETS = 25
 
 
 class CoinMarketFunctionality:
     """Handles CMC command functionality"""
 
-    def __init__(self, bot, coin_market, server_data):
+    def __init__(self, bot, coin_market, server_data, history):
         self.bot = bot
         self.server_data = server_data
+        self.history = history
         self.acronym_list = ""
         self.market_list = ""
         self.market_stats = ""
@@ -22,6 +25,7 @@ class CoinMarketFunctionality:
         self.top_five_gains = []
         self.top_five_losses = []
         self.coin_market = coin_market
+        self.search_flight = SingleFlight()
 
     def update(self, market_list=None, acronym_list=None, market_stats=None, server_data=None, top_five=None, top_five_gains=None, top_five_losses=None):
         """
@@ -161,8 +165,6 @@ class CoinMarketFunctionality:
                 await self._say_msg("No coins were entered.")
                 return
             args = list(args)
-            first_post = True
-            currency = args[0]
             if len(args) == 1:
                 fiat = 'USD'
             else:
@@ -172,35 +174,20 @@ class CoinMarketFunctionality:
                 except FiatException:
                     fiat = 'USD'
                     pass
-                if len(args) > 1:
-                    data = self.coin_market.get_current_multiple_currency(self.market_list,
-                                                                          self.acronym_list,
-                                                                          args,
-                                                                          fiat)[0]
-                    for msg in data:
-                        if first_post:
-                            em = discord.Embed(title="Search results",
-                                               description=msg,
-                                               colour=0xFF9900)
-                            first_post = False
-                        else:
-                            em = discord.Embed(description=msg,
-                                               colour=0xFF9900)
-                        await self._say_msg(emb=em)
-                    return
-            data, isPositivePercent, id = self.coin_market.get_current_currency(self.market_list,
-                                                                                self.acronym_list,
-                                                                                currency,
-                                                                                fiat)
-            if isPositivePercent:
-                em = discord.Embed(title="Search results",
-                                   description=data,
-                                   colour=0x00FF00)
-            else:
-                em = discord.Embed(title="Search results",
-                                   description=data,
-                                   colour=0xD14836)
-            em.set_thumbnail(url='https://s2.coinmarketcap.com/static/img/coins/128x128/{}.png'.format(id))
+            # lowercased here so the result shared under a key is the one
+            # computed for it
+            args = [arg.lower() for arg in args]
+            currency = args[0]
+            if len(args) > 1:
+                embeds = await self.search_flight.run((tuple(args), fiat),
+                                                      self.coin_market.cross_rates.generation,
+                                                      lambda: self._build_multiple_search(args, fiat))
+                for em in embeds:
+                    await self._say_msg(emb=em)
+                return
+            em = await self.search_flight.run(((currency,), fiat),
+                                              self.coin_market.cross_rates.generation,
+                                              lambda: self._build_search(currency, fiat))
             await self.bot.say(embed=em)
         except Forbidden:
             pass
@@ -215,6 +202,61 @@ class CoinMarketFunctionality:
             print("An error has occured. See error.log.")
             logger.error("Exception: {}".format(str(e)))
 
+    def _build_search(self, currency, fiat):
+        """
+        Builds the search result embed of one currency
+
+        @param currency - cryptocurrency to search for
+        @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
+        @return - embed of the search result
+        """
+        data, isPositivePercent, id = self.coin_market.get_current_currency(self.market_list,
+                                                                            self.acronym_list,
+                                                                            currency,
+                                                                            fiat)
+        if isPositivePercent:
+            em = discord.Embed(title="Search results",
+                               description=data,
+                               colour=0x00FF00)
+        else:
+            em = discord.Embed(title="Search results",
+                               description=data,
+                               colour=0xD14836)
+        em.set_thumbnail(url='https://s2.coinmarketcap.com/static/img/coins/128x128/{}.png'.format(id))
+        return em
+
+    def _build_multiple_search(self, currency_list, fiat):
+        """
+        Builds the search result embeds of several currencies
+
+        @param currency_list - cryptocurrencies to search for
+        @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
+        @return - list of embeds of the search results
+        """
+        data = self.coin_market.get_current_multiple_currency(self.market_list,
+                                                              self.acronym_list,
+                                                              currency_list,
+                                                              fiat)[0]
+        embeds = []
+        for msg in data:
+            if not embeds:
+                em = discord.Embed(title="Search results",
+                                   description=msg,
+                                   colour=0xFF9900)
+            else:
+                em = discord.Embed(description=msg,
+                                   colour=0xFF9900)
+            embeds.append(em)
+        return embeds
+
+    def get_search_stats(self):
+        """
+        Returns how often searches shared a result with an identical one
+
+        @return - dict with requests, computations and the coalescing ratio
+        """
+        return self.search_flight.stats()
+
     async def display_stats(self, ctx, fiat):
         """
         Obtains the market stats to display
@@ -265,8 +307,7 @@ class CoinMarketFunctionality:
                 currency2 = self.acronym_list[currency2.upper()]
             else:
                 acronym2 = self.market_list[currency2]["symbol"]
-            converted_amt = self.coin_market.get_converted_coin_amt(self.market_list,
-                                                                    currency1,
+            converted_amt = self.coin_market.get_converted_coin_amt(currency1,
                                                                     currency2,
                                                                     currency_amt)
             currency_amt = "{:.8f}".format(currency_amt).rstrip('0')
@@ -291,6 +332,75 @@ class CoinMarketFunctionality:
             print("An error has occured. See error.log.")
             logger.error("Exception: {}".format(str(e)))
 
+    def _resolve_conversion_unit(self, name):
+        """
+        Resolves a fiat, acronym or slug for conversions
+
+        @param name - fiat currency, coin acronym or coin slug
+        @return - (unit used by the cross rates, display label, is_fiat)
+        """
+        if name.upper() in fiat_currencies:
+            return name.upper(), name.upper(), True
+        if name.upper() in self.acronym_list:
+            currency = self.acronym_list[name.upper()]
+            if "Duplicate" in currency:
+                raise CurrencyException(currency)
+        else:
+            currency = name
+        if currency not in self.market_list:
+            raise CurrencyException("Invalid currency: `{}`".format(name))
+        return currency, self.market_list[currency]['symbol'], False
+
+    async def calculate_multi_conversion(self, ctx, amount, source, targets):
+        """
+        Converts an amount of one coin or fiat into many coins and fiats
+        and displays them in one message
+
+        @param amount - amount of the source to convert
+        @param source - coin or fiat to convert from
+        @param targets - coins and fiats to convert to
+        """
+        try:
+            if not self._check_permission(ctx):
+                return
+            if not targets:
+                await self._say_msg("No currencies to convert to were entered.")
+                return
+            if len(targets) > MAX_CONVERSION_TARGETS:
+                await self._say_msg("Only up to {} currencies can be converted "
+                                    "at once.".format(MAX_CONVERSION_TARGETS))
+                return
+            source_unit, source_label, _ = self._resolve_conversion_unit(source)
+            resolved = [self._resolve_conversion_unit(target) for target in targets]
+            converted = self.coin_market.cross_rates.convert_many(amount,
+                                                                  source_unit,
+                                                                  [unit for unit, _, _ in resolved])
+            msg = ""
+            for (unit, label, is_fiat), converted_amt in zip(resolved, converted):
+                if is_fiat:
+                    formatted_amt = self.coin_market.format_fiat_amount(converted_amt,
+                                                                        unit)
+                    msg += "**{}** ({})\n".format(formatted_amt, label)
+                else:
+                    formatted_amt = "{:,.8f}".format(converted_amt).rstrip('0')
+                    formatted_amt = formatted_amt.rstrip('.')
+                    msg += "**{} {}**\n".format(formatted_amt, label)
+            formatted_source_amt = "{:.8f}".format(amount).rstrip('0').rstrip('.')
+            em = discord.Embed(title="{} {} converts to".format(formatted_source_amt,
+                                                               source_label),
+                               description=msg,
+                               colour=0xFF9900)
+            await self.bot.say(embed=em)
+        except Forbidden:
+            pass
+        except CurrencyException as e:
+            logger.error("CurrencyException: {}".format(str(e)))
+            await self._say_error(e)
+        except Exception as e:
+            await self.bot.say("Command failed. Make sure the arguments are valid.")
+            print("An error has occured. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
+
     async def calculate_coin_to_fiat(self, ctx, currency, currency_amt, fiat):
         """
         Calculates coin to fiat rate and displays it
@@ -424,3 +534,65 @@ class CoinMarketFunctionality:
             await self.bot.say("Command failed. Make sure the arguments are valid.")
             print("An error has occured. See error.log.")
             logger.error("Exception: {}".format(str(e)))
+
+    async def display_history(self, ctx, currency, hours, fiat):
+        """
+        Displays how a cryptocurrency moved over the last few hours using
+        the locally recorded price history
+
+        @param currency - cryptocurrency to look up
+        @param hours - number of hours to look back
+        @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
+        """
+        try:
+            if not self._check_permission(ctx):
+                return
+            ucase_fiat = self.coin_market.fiat_check(fiat)
+            if currency.upper() in self.acronym_list:
+                currency = self.acronym_list[currency.upper()]
+                if "Duplicate" in currency:
+                    await self._say_msg(currency)
+                    return
+            if currency not in self.market_list:
+                raise CurrencyException("Invalid currency: `{}`".format(currency))
+            snapshots = self.history.get_since(currency, hours*3600)
+            if len(snapshots) < 2:
+                await self._say_msg("Not enough history has been recorded for "
+                                    "**{}** yet.".format(currency.title()))
+                return
+            prices = [snapshot[1] for snapshot in snapshots]
+            first_price = prices[0]
+            last_price = prices[-1]
+            percent_change = (last_price - first_price)/first_price*100
+            msg = ("Open: **{}**\n"
+                   "Now: **{}**\n"
+                   "High: **{}**\n"
+                   "Low: **{}**\n"
+                   "Change: **{:.2f}%**\n"
+                   "Snapshots: **{}**".format(self.coin_market.format_price(first_price,
+                                                                           ucase_fiat),
+                                             self.coin_market.format_price(last_price,
+                                                                           ucase_fiat),
+                                             self.coin_market.format_price(max(prices),
+                                                                           ucase_fiat),
+                                             self.coin_market.format_price(min(prices),
+                                                                           ucase_fiat),
+                                             percent_change,
+                                             len(snapshots)))
+            color = 0xD14836 if percent_change < 0 else 0x00FF00
+            em = discord.Embed(title="{} over the last {} hour(s)".format(currency.title(),
+                                                                         hours),
+                               description=msg,
+                               colour=color)
+            await self.bot.say(embed=em)
+        except Forbidden:
+            pass
+        except CurrencyException as e:
+            logger.error("CurrencyException: {}".format(str(e)))
+            await self._say_error(e)
+        except FiatException as e:
+            logger.error("FiatException: {}".format(str(e)))
+            await self._say_error(e)
+        except Exception as e:
+            print("An error has occured. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
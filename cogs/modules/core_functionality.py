@@ -1,19 +1,44 @@
 from bot_logger import logger
+from bot_metrics import (CACHE_HITS, CACHE_REQUESTS, SHARED_SNAPSHOT_AGE,
+                         SNAPSHOT_BYTES, SNAPSHOT_COINS, metrics)
 from cogs.modules.alert_functionality import AlertFunctionality
 # from cogs.modules.cal_functionality import CalFunctionality
 from cogs.modules.coin_market_functionality import CoinMarketFunctionality
 from cogs.modules.coin_market import CoinMarket
+from cogs.modules.market_archive import MarketArchive
 from cogs.modules.misc_functionality import MiscFunctionality
+from cogs.modules.portfolio_functionality import PortfolioFunctionality
+from cogs.modules.price_history import DEFAULT_RETENTION, PriceHistory
+from cogs.modules.stats_registry import StatsRegistry
 from cogs.modules.subscriber_functionality import SubscriberFunctionality
+from cogs.modules.update_trace import DEFAULT_TRACE_COUNT, UpdateTraces
+from sampling_profiler import MAX_DURATION, format_report, profiler
+from shared_snapshot import SHARED_SNAPSHOT_FILE, SharedSnapshotReader
+from sharding import SharedFile, is_primary, is_sharded, state_path
+from startup_profile import profile
 import asyncio
 import datetime
 import discord
+import io
 import json
+import os
+import pickle
+import time
 
 
 CMB_ADMIN = "CMB ADMIN"
 MAX_TOP_CURRENCY_DISPLAY = 5
+MAX_INLINE_REPORT = 1900
 LIMIT_TOP_CURRENCY = 400
+ARCHIVE_DIRECTORY = "archive"
+ARCHIVE_DOWNSAMPLE_AFTER_DAYS = 7
+ARCHIVE_DOWNSAMPLE_HOURS = 6
+PORTFOLIO_CAPACITY = 50
+MARKET_SNAPSHOT_FILE = "market_snapshot.pickle"
+WARM_START_MAX_AGE = 3600
+SHARED_POLL_INTERVAL = 5
+# the fetcher publishes hourly, this leaves room for its retries
+SHARED_MAX_AGE = 3600 + 900
 
 
 class CoreFunctionalityException(Exception):
@@ -24,43 +49,105 @@ class CoreFunctionality:
     """Handles Core functionality"""
 
     def __init__(self, bot):
-        with open('config.json') as config:
-            self.config_data = json.load(config)
+        with profile.phase("load config.json"):
+            with open('config.json') as config:
+                self.config_data = json.load(config)
         self.bot = bot
         self.started = False
+        self.update_task = None
+        # replaced to run the update loop on simulated time
+        self.clock = datetime.datetime.now
+        self.sleep = asyncio.sleep
         self.market_list = None
         self.market_stats = None
         self.acronym_list = None
         self.top_five = []
         self.top_five_gains = []
         self.top_five_losses = []
-        self.coin_market = CoinMarket(self.config_data["cmc_api_key"])
-        self.server_data = self._check_server_file()
+        self.market_time = None
+        self.snapshot_time = None
+        self.shared_market = None
+        self.shared_generation = None
+        self.shared_stale = False
+        if is_sharded():
+            self.shared_market = SharedSnapshotReader(
+                self.config_data.get("shared_snapshot_file", SHARED_SNAPSHOT_FILE))
+        self.coin_market = CoinMarket(self.config_data["cmc_api_key"],
+                                      self.config_data.get("cmc_api_url"))
+        self.stats = StatsRegistry()
+        self.traces = UpdateTraces(self.config_data.get("update_trace_count",
+                                                        DEFAULT_TRACE_COUNT))
+        self.stats.rebuild_servers(bot.servers)
+        with profile.phase("allocate price history"):
+            self.history = PriceHistory(self.config_data.get("history_retention",
+                                                             DEFAULT_RETENTION))
+        logger.info(self.history.memory_report())
+        self.archive = None
+        if is_primary():
+            with profile.phase("open market archive"):
+                self.archive = MarketArchive(self.config_data.get("archive_directory",
+                                                                  ARCHIVE_DIRECTORY))
+        self.server_file = SharedFile('server_settings.json')
+        with profile.phase("load server_settings.json"):
+            self.server_data = self._check_server_file()
         self.cmc = CoinMarketFunctionality(bot,
                                            self.coin_market,
-                                           self.server_data)
-        self.alert = AlertFunctionality(bot,
-                                        self.coin_market,
-                                        self.config_data["alert_capacity"],
-                                        self.server_data)
-        self.subscriber = SubscriberFunctionality(bot,
-                                                  self.coin_market,
-                                                  self.config_data["subscriber_capacity"],
-                                                  self.server_data)
+                                           self.server_data,
+                                           self.history)
+        with profile.phase("load portfolios.json + backup"):
+            self.portfolio = PortfolioFunctionality(bot,
+                                                    self.coin_market,
+                                                    self.config_data.get("portfolio_capacity",
+                                                                         PORTFOLIO_CAPACITY),
+                                                    self.server_data)
+        with profile.phase("load alerts.json + backup"):
+            self.alert = AlertFunctionality(bot,
+                                            self.coin_market,
+                                            self.config_data["alert_capacity"],
+                                            self.server_data,
+                                            self.history,
+                                            self.portfolio,
+                                            self.stats)
+        with profile.phase("load subscribers.json + backup"):
+            self.subscriber = SubscriberFunctionality(bot,
+                                                      self.coin_market,
+                                                      self.config_data["subscriber_capacity"],
+                                                      self.server_data,
+                                                      self.stats)
         # self.cal = CalFunctionality(bot,
         #                             self.config_data,
         #                             self.server_data)
-        self.misc = MiscFunctionality(bot, self.server_data)
-        self._save_server_file(self.server_data, backup=True)
-        self.bot.loop.create_task(self._continuous_updates())
+        self.misc = MiscFunctionality(bot, self.server_data, self.stats)
+        with profile.phase("back up server_settings.json"):
+            self._save_server_file(self.server_data, backup=True)
+        with profile.phase("load market snapshot"):
+            self._load_market_snapshot()
+        metrics.add_collector(self._collect_metrics)
+        self.start_updates()
+
+    def _collect_metrics(self):
+        """
+        Copies the cache statistics of the modules into the metrics
+        """
+        search_stats = self.cmc.get_search_stats()
+        CACHE_REQUESTS.set_total(search_stats["requests"], cache="search")
+        CACHE_HITS.set_total(search_stats["requests"] - search_stats["computations"],
+                             cache="search")
+
+    def start_updates(self):
+        """
+        Starts the update loop unless one is already running
+        """
+        if self.update_task is not None and not self.update_task.done():
+            return
+        self.update_task = self.bot.loop.create_task(self._continuous_updates())
 
     def _check_server_file(self):
         """
         Checks to see if there's a valid server_settings.json file
         """
         try:
-            with open('server_settings.json') as settings:
-                return json.load(settings)
+            return self.server_file.load()
         except FileNotFoundError:
             self._save_server_file()
             return json.loads('{}')
@@ -72,11 +159,10 @@ class CoreFunctionality:
         """
         Saves server_settings.json file
         """
-        if backup:
-            server_settings_filename = "server_settings_backup.json"
-        else:
-            server_settings_filename = "server_settings.json"
-        with open(server_settings_filename, 'w') as outfile:
+        if not backup:
+            self.server_file.save(server_data)
+            return
+        with open(state_path("server_settings_backup.json"), 'w') as outfile:
             json.dump(server_data,
                       outfile,
                       indent=4)
@@ -87,31 +173,157 @@ class CoreFunctionality:
             self.alert.update(server_data=self.server_data)
             self.subscriber.update(server_data=self.server_data)
             self.misc.update(server_data=self.server_data)
+            self.portfolio.update(server_data=self.server_data)
             # self.cal.update(server_data=self.server_data)
         except Exception as e:
             print("Failed to update server data. See error.log.")
             logger.error("Exception: {}".format(str(e)))
 
-    async def _update_data(self, minute=0):
+    def _load_market_snapshot(self):
+        """
+        Restores the last market snapshot saved to disk so commands work
+        before the first refresh finishes
+        """
         try:
-            await self._update_market()
-            self._load_acronyms()
-            self.cmc.update(self.market_list,
-                            self.acronym_list,
-                            self.market_stats,
-                            top_five=self.top_five,
-                            top_five_gains=self.top_five_gains,
-                            top_five_losses=self.top_five_losses)
-            self.alert.update(self.market_list, self.acronym_list)
-            self.subscriber.update(self.market_list, self.acronym_list)
-            # self.cal.update(self.acronym_list)
-            await self._update_game_status()
-            await self.alert.alert_user()
-            if self.started:
-                await self.subscriber.display_live_data(minute)
+            with open(state_path(MARKET_SNAPSHOT_FILE), 'rb') as snapshot_file:
+                snapshot = pickle.load(snapshot_file)
+            self.market_list = snapshot["market_list"]
+            self.market_stats = snapshot["market_stats"]
+            self.acronym_list = snapshot["acronym_list"]
+            self.top_five = snapshot["top_five"]
+            self.top_five_gains = snapshot["top_five_gains"]
+            self.top_five_losses = snapshot["top_five_losses"]
+            self.snapshot_time = snapshot["timestamp"]
+            self.market_time = self.snapshot_time
+            self.coin_market.cross_rates.update(self.market_list)
+            self._push_market_data()
+            logger.info("Loaded market snapshot from {}."
+                        "".format(datetime.datetime.fromtimestamp(self.snapshot_time)))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.market_list = None
+            self.snapshot_time = None
+            self.market_time = None
+            print("Failed to load market snapshot. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
+
+    def _save_market_snapshot(self):
+        """
+        Saves the latest market data so a restart can serve it right away
+        """
+        try:
+            if self.market_time is None or self.market_time == self.snapshot_time:
+                return
+            self.snapshot_time = self.market_time
+            snapshot = {"timestamp": self.snapshot_time,
+                        "market_list": self.market_list,
+                        "market_stats": self.market_stats,
+                        "acronym_list": self.acronym_list,
+                        "top_five": self.top_five,
+                        "top_five_gains": self.top_five_gains,
+                        "top_five_losses": self.top_five_losses}
+            snapshot_path = state_path(MARKET_SNAPSHOT_FILE)
+            snapshot_tmp = snapshot_path + ".tmp"
+            with open(snapshot_tmp, 'wb') as outfile:
+                pickle.dump(snapshot, outfile, pickle.HIGHEST_PROTOCOL)
+            os.replace(snapshot_tmp, snapshot_path)
+            SNAPSHOT_BYTES.set(os.path.getsize(snapshot_path))
+        except Exception as e:
+            print("Failed to save market snapshot. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
+
+    def _push_market_data(self):
+        """
+        Hands the current market data to every module
+        """
+        self.cmc.update(self.market_list,
+                        self.acronym_list,
+                        self.market_stats,
+                        top_five=self.top_five,
+                        top_five_gains=self.top_five_gains,
+                        top_five_losses=self.top_five_losses)
+        self.alert.update(self.market_list, self.acronym_list)
+        self.subscriber.update(self.market_list, self.acronym_list)
+        self.portfolio.update(self.market_list, self.acronym_list)
+        # self.cal.update(self.acronym_list)
+
+    def _snapshot_is_fresh(self):
+        """
+        Checks if the snapshot loaded on startup is recent enough to skip
+        the initial refresh
+        """
+        if self.snapshot_time is None:
+            return False
+        max_age = self.config_data.get("warm_start_max_age", WARM_START_MAX_AGE)
+        return time.time() - self.snapshot_time < max_age
+
+    async def _update_data(self, minute=0, market=None):
+        """
+        Refreshes the market and runs everything that depends on it
+
+        @param minute - the minute the clock is at, None when the update
+                        is off schedule and live updates must not be sent
+        @param market - snapshot published by the market fetcher
+        """
+        trace = self.traces.start()
+        error = None
+        try:
+            refresh_start = time.time()
+            market_time = self.market_time
+            # these phases log their own errors and the cycle goes on
+            # with the previous market
+            with trace.span("market", fatal=False) as counts:
+                await self._update_market(market)
+                if self.market_time != market_time:
+                    counts["coins"] = len(self.market_list)
+            self.stats.last_refresh_duration = time.time() - refresh_start
+            with trace.span("acronyms"):
+                self._load_acronyms()
+            with trace.span("modules"):
+                self._push_market_data()
+            with trace.span("snapshot"):
+                self._save_market_snapshot()
+            with trace.span("presence"):
+                await self._update_game_status()
+            with trace.span("alerts", fatal=False) as counts:
+                counts["evaluated"], counts["fired"] = await self.alert.alert_user()
+            if self.started and minute is not None:
+                with trace.span("broadcast", fatal=False) as counts:
+                    counts["channels"] = await self.subscriber.display_live_data(minute)
+            if minute == 0 and self.archive is not None:
+                with trace.span("archive", fatal=False):
+                    await self._compact_archive()
         except Exception as e:
+            error = e
             print("Failed to update data. See error.log.")
             logger.error("Exception: {}".format(str(e)))
+        finally:
+            self.traces.finish(trace, error)
+
+    async def _compact_archive(self):
+        """
+        Downsamples old snapshots in the market archive
+
+        Compaction rewrites the whole archive, so it runs in a worker
+        thread to keep the bot responsive.
+        """
+        try:
+            days = self.config_data.get("archive_downsample_after_days",
+                                        ARCHIVE_DOWNSAMPLE_AFTER_DAYS)
+            hours = self.config_data.get("archive_downsample_hours",
+                                         ARCHIVE_DOWNSAMPLE_HOURS)
+            removed = await self.bot.loop.run_in_executor(None,
+                                                          self.archive.compact,
+                                                          time.time() - days*86400,
+                                                          hours*3600)
+            if removed:
+                logger.info("Removed {} snapshots from the market archive."
+                            "".format(removed))
+        except Exception as e:
+            print("Failed to compact market archive. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
+            raise
 
     async def _update_game_status(self):
         """
@@ -125,54 +337,111 @@ class CoreFunctionality:
             logger.error("Exception: {}".format(str(e)))
 
     async def _continuous_updates(self):
-        await self._update_data()
+        if self.shared_market is not None:
+            await self._follow_shared_market()
+            return
+        if self._snapshot_is_fresh():
+            logger.info("Market snapshot is recent, skipping initial refresh.")
+            await self._update_game_status()
+        else:
+            with profile.phase("first market fetch"):
+                await self._update_data()
         self.started = True
         print('CoinMarketDiscordBot is online.')
-        logger.info('Bot is online.')
+        logger.info("Bot is online. Market data ready {:.2f} seconds after "
+                    "startup.".format(profile.elapsed()))
         while True:
-            time = datetime.datetime.now()
-            if time.minute == 0:
-                minute = (time.hour * 60) + time.minute
+            now = self.clock()
+            if now.minute == 0:
+                minute = (now.hour * 60) + now.minute
                 await self._update_data(minute)
-                await asyncio.sleep(60)
+                await self.sleep(60)
             else:
-                await asyncio.sleep(20)
+                await self.sleep(20)
+
+    async def _follow_shared_market(self):
+        """
+        Updates from the snapshots published by the market fetcher
+        instead of fetching the market itself
+        """
+        while True:
+            try:
+                published = self.shared_market.read(self.shared_generation)
+            except Exception as e:
+                published = None
+                print("Failed to read the shared market. See error.log.")
+                logger.error("Exception: {}".format(str(e)))
+            if published is not None:
+                self.shared_generation, market = published
+                await self._update_data(market["minute"], market)
+                if not self.started:
+                    self.started = True
+                    print('CoinMarketDiscordBot is online.')
+                    logger.info("Bot is online. Market data ready {:.2f} seconds "
+                                "after startup.".format(profile.elapsed()))
+            self._check_shared_age()
+            await self.sleep(SHARED_POLL_INTERVAL)
+
+    def _check_shared_age(self):
+        """
+        Warns once when the market fetcher stopped publishing snapshots
+        """
+        try:
+            published = self.shared_market.published()
+        except Exception as e:
+            logger.error("Exception: {}".format(str(e)))
+            return
+        if published is None:
+            return
+        age = time.time() - published
+        SHARED_SNAPSHOT_AGE.set(age)
+        max_age = self.config_data.get("shared_snapshot_max_age", SHARED_MAX_AGE)
+        if age > max_age and not self.shared_stale:
+            logger.warning("The shared market snapshot is {:.0f} minutes old. "
+                           "Is market_fetcher.py running?".format(age / 60))
+        self.shared_stale = age > max_age
 
-    async def _update_market(self):
+    async def _update_market(self, market=None):
         """
         Loads all the cryptocurrencies that exist in the market
 
-        @return - list of crypto-currencies
+        @param market - snapshot published by the market fetcher, fetched
+                        from CoinMarketCap when not given
         """
         try:
-            retry_count = 0
-            market_stats = self.coin_market.fetch_coinmarket_stats()
-            currency_data = self.coin_market.fetch_currency_data()
-            while market_stats is None or currency_data is None:
-                if retry_count >= 10:
-                    msg = ("Max retry attempts reached. Please make "
-                           "sure you're able to access coinmarketcap "
-                           "through their website, check if the coinmarketapi "
-                           "is down, and check if "
-                           "anything is blocking you from requesting "
-                           "data.")
-                    raise CoreFunctionalityException(msg)
-                logger.warning("Retrying to get data..")
-                if market_stats is None:
-                    market_stats = self.coin_market.fetch_coinmarket_stats()
-                if currency_data is None:
-                    currency_data = self.coin_market.fetch_currency_data()
-                retry_count += 1
-                await asyncio.sleep(5)
+            if market is None:
+                market_stats, currency_data = await self.coin_market.fetch_market(self.sleep)
+            else:
+                market_stats = market["market_stats"]
+                currency_data = market["currency_data"]
             market_dict = {}
             for currency in currency_data['data']:
                 market_dict[currency['slug']] = currency
             await self._get_top_five(currency_data['data'])
+            SNAPSHOT_COINS.set(len(market_dict))
             self.market_stats = market_stats
             self.market_list = market_dict
+            self.coin_market.cross_rates.update(market_dict)
+            timestamp = time.time()
+            self.market_time = timestamp
+            self.history.append(market_dict, timestamp)
+            self._archive_market(market_dict, timestamp)
         except Exception as e:
             print("Failed to update market. See error.log.")
             logger.error("Exception: {}".format(str(e)))
+            raise
+
+    def _archive_market(self, market_dict, timestamp):
+        """
+        Appends the latest market snapshot to the on-disk archive
+        """
+        try:
+            if self.archive is None:
+                return
+            self.archive.append(market_dict, timestamp)
+        except Exception as e:
+            print("Failed to archive market. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
 
     async def _get_top_five(self, currency_data):
         """
@@ -290,14 +559,7 @@ class CoreFunctionality:
         Toggles the command mode on/off
         """
         try:
-            try:
-                user_roles = ctx.message.author.roles
-            except Exception as e:
-                await self._say_msg("Command must be used in a server.")
-                return
-            if CMB_ADMIN not in [role.name for role in user_roles]:
-                await self._say_msg("Admin role '{}' is required for "
-                                    "this command.".format(CMB_ADMIN))
+            if not await self._check_admin(ctx):
                 return
             channel = ctx.message.channel.id
             try:
@@ -305,17 +567,96 @@ class CoreFunctionality:
             except Exception as e:
                 await self._say_msg("Not a valid server to toggle mode.")
                 return
-            if server.id not in self.server_data:
-                self.server_data[server.id] = [mode]
-                await self._say_msg("Server set '{}'.".format(mode))
-            elif mode in self.server_data[server.id]:
-                self.server_data[server.id].remove(mode)
-                await self._say_msg("'{}' has been taken off.".format(mode))
-            elif mode not in self.server_data[server.id]:
-                self.server_data[server.id].append(mode)
-                await self._say_msg("Server set '{}'.".format(mode))
-            self._save_server_file(self.server_data)
-            self._update_server_data()
+            async with self.server_file.edit(self.server_data):
+                if server.id not in self.server_data:
+                    self.server_data[server.id] = [mode]
+                    await self._say_msg("Server set '{}'.".format(mode))
+                elif mode in self.server_data[server.id]:
+                    self.server_data[server.id].remove(mode)
+                    await self._say_msg("'{}' has been taken off.".format(mode))
+                elif mode not in self.server_data[server.id]:
+                    self.server_data[server.id].append(mode)
+                    await self._say_msg("Server set '{}'.".format(mode))
+                self._save_server_file(self.server_data)
+                self._update_server_data()
         except Exception as e:
             print("Failed to toggle {}. See error.log.".format(mode))
             logger.error("Exception: {}".format(str(e)))
+
+    async def _check_admin(self, ctx):
+        """
+        Checks that the user has the admin role, telling them otherwise
+
+        @param ctx - context of the command sent
+        @return - True if the user is an admin
+        """
+        try:
+            user_roles = ctx.message.author.roles
+        except Exception as e:
+            await self._say_msg("Command must be used in a server.")
+            return False
+        if CMB_ADMIN not in [role.name for role in user_roles]:
+            await self._say_msg("Admin role '{}' is required for "
+                                "this command.".format(CMB_ADMIN))
+            return False
+        return True
+
+    async def display_metrics(self, ctx):
+        """
+        Uploads the current metrics in the Prometheus text format
+
+        @param ctx - context of the command sent
+        """
+        try:
+            if not await self._check_admin(ctx):
+                return
+            dump = io.BytesIO(metrics.render().encode())
+            await self.bot.upload(dump, filename="metrics.txt")
+        except Exception as e:
+            print("Failed to display metrics. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
+
+    async def profile_bot(self, ctx, seconds):
+        """
+        Samples what the bot is doing for a while and uploads the
+        hottest functions and collapsed stacks
+
+        @param ctx - context of the command sent
+        @param seconds - how long to sample for
+        """
+        try:
+            if not await self._check_admin(ctx):
+                return
+            seconds = min(max(seconds, 1), MAX_DURATION)
+            if profiler.running:
+                await self._say_msg("A profile is already being taken.")
+                return
+            await self._say_msg("Profiling for {} seconds..".format(seconds))
+            stacks = await profiler.profile(seconds)
+            report = io.BytesIO(format_report(stacks, seconds).encode())
+            await self.bot.upload(report, filename="profile.txt")
+        except Exception as e:
+            print("Failed to profile the bot. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
+
+    async def display_update_traces(self, ctx, count):
+        """
+        Shows how long each phase of the last market updates took
+
+        @param ctx - context of the command sent
+        @param count - number of updates to show
+        """
+        try:
+            if not await self._check_admin(ctx):
+                return
+            report = self.traces.format(max(count, 1))
+            if not report:
+                await self._say_msg("No market update has finished yet.")
+            elif len(report) < MAX_INLINE_REPORT:
+                await self._say_msg("```{}```".format(report))
+            else:
+                await self.bot.upload(io.BytesIO(report.encode()),
+                                      filename="update_traces.txt")
+        except Exception as e:
+            print("Failed to display update traces. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
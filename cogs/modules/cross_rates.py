@@ -0,0 +1,178 @@
+from array import array
+from startup_profile import profile
+
+
+BITCOIN = "bitcoin"
+ETHEREUM = "ethereum"
+COIN_UNITS = {"BTC": BITCOIN, "ETH": ETHEREUM}
+
+
+class CrossRateException(Exception):
+    """Exception class for missing cross rates"""
+
+
+class CrossRates:
+    """
+    Derives coin prices in BTC, ETH and fiat from the USD quotes
+
+    The USD price of every coin is stored once per market update along
+    with one multiplier per unit, so any price lookup or conversion is a
+    dict lookup and a multiplication. Whole price columns for a unit are
+    built on demand and cached until the next update.
+    """
+
+    def __init__(self, fiats):
+        self.fiats = list(fiats)
+        self.converter = None
+        self.rows = {}
+        self.usd = array('d')
+        self.factors = {"USD": 1.0}
+        self.columns = {}
+        self.generation = 0
+
+    def _get_converter(self):
+        """
+        Returns the fiat converter, loading its rates on first use
+        """
+        if self.converter is None:
+            with profile.phase("load fiat rates"):
+                from currency_converter import CurrencyConverter
+                self.converter = CurrencyConverter()
+        return self.converter
+
+    def _load_fiat_factor(self, fiat):
+        """
+        Looks up and caches the USD to fiat rate
+        """
+        factor = float(self._get_converter().convert(1.0, "USD", fiat))
+        self.factors[fiat] = factor
+        return factor
+
+    def update(self, market_list):
+        """
+        Rebuilds the rates from the latest market data
+
+        @param market_list - dict of currency slug to listing data
+        """
+        rows = {}
+        usd = array('d')
+        for currency, data in market_list.items():
+            price = data['quote']['USD']['price']
+            if price is None:
+                continue
+            rows[currency] = len(usd)
+            usd.append(float(price))
+        if self.converter is None:
+            self.refresh_fiat()
+        factors = {unit: factor for unit, factor in self.factors.items()
+                   if unit not in COIN_UNITS}
+        for unit, currency in COIN_UNITS.items():
+            if currency in rows and usd[rows[currency]] > 0:
+                factors[unit] = 1.0/usd[rows[currency]]
+        self.rows = rows
+        self.usd = usd
+        self.factors = factors
+        self.columns = {}
+        self.generation += 1
+
+    def refresh_fiat(self):
+        """
+        Loads the USD to fiat rates for every supported fiat
+        """
+        for fiat in self.fiats:
+            if fiat == "USD":
+                continue
+            try:
+                self._load_fiat_factor(fiat)
+            except Exception:
+                self.factors.pop(fiat, None)
+
+    def unit_factor(self, unit):
+        """
+        Returns the multiplier that converts USD into the unit
+
+        @param unit - 'BTC', 'ETH' or a fiat currency (i.e. 'EUR', 'USD')
+        """
+        factor = self.factors.get(unit)
+        if factor is None:
+            if unit in COIN_UNITS:
+                raise CrossRateException("No {} price available.".format(unit))
+            factor = self._load_fiat_factor(unit)
+        return factor
+
+    def fiat_rate(self, fiat):
+        """
+        Returns the USD to fiat rate
+
+        @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
+        """
+        return self.unit_factor(fiat)
+
+    def usd_price(self, currency):
+        """
+        Returns the USD price of a coin
+
+        @param currency - slug of the cryptocurrency
+        """
+        row = self.rows.get(currency)
+        if row is None:
+            raise CrossRateException("No price available for: `{}`"
+                                     "".format(currency))
+        return self.usd[row]
+
+    def price(self, currency, unit="USD"):
+        """
+        Returns the price of a coin in the given unit
+
+        @param currency - slug of the cryptocurrency
+        @param unit - 'BTC', 'ETH' or a fiat currency (i.e. 'EUR', 'USD')
+        """
+        return self.usd_price(currency) * self.unit_factor(unit)
+
+    def column(self, unit):
+        """
+        Returns the prices of every coin in the given unit, ordered like
+        the rows of the rate table
+
+        @param unit - 'BTC', 'ETH' or a fiat currency (i.e. 'EUR', 'USD')
+        """
+        column = self.columns.get(unit)
+        if column is None:
+            factor = self.unit_factor(unit)
+            column = array('d', [price * factor for price in self.usd])
+            self.columns[unit] = column
+        return column
+
+    def value_in_usd(self, name):
+        """
+        Returns the USD value of one unit of a coin or fiat
+
+        @param name - coin slug, 'BTC', 'ETH' or fiat currency
+        """
+        if name in self.rows:
+            return self.usd[self.rows[name]]
+        return 1.0/self.unit_factor(name)
+
+    def convert(self, amount, source, target):
+        """
+        Converts an amount between any two coins or fiats
+
+        @param amount - amount of the source to convert
+        @param source - coin slug, 'BTC', 'ETH' or fiat currency to convert from
+        @param target - coin slug, 'BTC', 'ETH' or fiat currency to convert to
+        @return - converted amount
+        """
+        return amount * self.value_in_usd(source) / self.value_in_usd(target)
+
+    def convert_many(self, amount, source, targets):
+        """
+        Converts one amount into many coins and fiats at once
+
+        @param amount - amount of the source to convert
+        @param source - coin slug, 'BTC', 'ETH' or fiat currency to convert from
+        @param targets - list of coin slugs, 'BTC', 'ETH' or fiat currencies
+        @return - list of converted amounts in the order of targets
+        """
+        source_value = amount * self.value_in_usd(source)
+        rates = [self.value_in_usd(target) for target in targets]
+        return [source_value / rate for rate in rates]
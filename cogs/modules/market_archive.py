@@ -0,0 +1,422 @@
+from bot_logger import logger
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+
+INDEX_MAGIC = b'CMBARC01'
+INDEX_ENTRY = struct.Struct('<dQI')
+ID_SIZE = 4
+PRICE_SIZE = 8
+VOLUME_SIZE = 4
+MARKET_CAP_SIZE = 4
+RECORD_SIZE = ID_SIZE + PRICE_SIZE + VOLUME_SIZE + MARKET_CAP_SIZE
+NAN = float('nan')
+
+
+class MarketArchiveException(Exception):
+    """Exception class for the market archive"""
+
+
+class MarketArchive:
+    """
+    Append-only columnar archive of market snapshots
+
+    The archive lives in a directory with three files:
+
+    index.bin   - 8 byte magic followed by one fixed-width entry per
+                  snapshot: timestamp (float64), offset into records.bin
+                  (uint64) and number of coins (uint32)
+    records.bin - one columnar block per snapshot, sorted by CoinMarketCap
+                  id: ids (uint32 * n), price (float64 * n), volume 24h
+                  (float32 * n) and market cap (float32 * n)
+    coins.json  - CoinMarketCap id to slug/symbol lookup for offline tools
+
+    Everything is little-endian and missing values are stored as NaN.
+    Reads go through mmap so range queries only page in the blocks they
+    touch.
+
+    Compaction writes both files next to the old ones and creates
+    compact.commit once they're complete. The marker is removed after
+    both are swapped in, so an interrupted swap is finished when the
+    archive is opened again instead of pairing new records with old
+    offsets.
+    """
+
+    def __init__(self, directory, read_only=False):
+        """
+        @param directory - directory of the archive
+        @param read_only - open without creating, repairing or changing
+                           any file, for reading an archive the bot may
+                           be writing to
+        """
+        self.directory = directory
+        self.read_only = read_only
+        self.index_path = os.path.join(directory, "index.bin")
+        self.records_path = os.path.join(directory, "records.bin")
+        self.coins_path = os.path.join(directory, "coins.json")
+        self.marker_path = os.path.join(directory, "compact.commit")
+        self.lock = threading.Lock()
+        if read_only:
+            self._use_committed_files()
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self._finish_compaction()
+        self.timestamps = []
+        self.entries = []
+        self.coins = self._load_coins()
+        self._load_index()
+
+    def _finish_compaction(self):
+        """
+        Swaps in the files of a compaction that was committed but not
+        finished, or removes the files of one that wasn't committed
+        """
+        pending = [(path + ".tmp", path) for path in (self.records_path,
+                                                      self.index_path)]
+        if os.path.exists(self.marker_path):
+            for tmp, path in pending:
+                if os.path.exists(tmp):
+                    os.replace(tmp, path)
+            os.remove(self.marker_path)
+            logger.warning("Finished an interrupted archive compaction.")
+            return
+        for tmp, _ in pending:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _use_committed_files(self):
+        """
+        Reads the compacted files while the writer is swapping them in
+        """
+        if not os.path.exists(self.marker_path):
+            return
+        if os.path.exists(self.records_path + ".tmp"):
+            self.records_path += ".tmp"
+        if os.path.exists(self.index_path + ".tmp"):
+            self.index_path += ".tmp"
+
+    def _check_writable(self):
+        if self.read_only:
+            raise MarketArchiveException("Archive was opened read-only.")
+
+    def _load_coins(self):
+        """
+        Loads the id to slug/symbol lookup
+        """
+        try:
+            with open(self.coins_path) as coins:
+                return json.load(coins)
+        except FileNotFoundError:
+            return {}
+
+    def _save_coins(self):
+        """
+        Saves the id to slug/symbol lookup
+        """
+        with open(self.coins_path, 'w') as outfile:
+            json.dump(self.coins, outfile)
+
+    def _load_index(self):
+        """
+        Reads the snapshot index and drops any partially written block
+        """
+        if not os.path.exists(self.index_path):
+            if self.read_only:
+                raise MarketArchiveException("No market archive in {}"
+                                             "".format(self.directory))
+            with open(self.index_path, 'wb') as index:
+                index.write(INDEX_MAGIC)
+            open(self.records_path, 'ab').close()
+            return
+        with open(self.index_path, 'rb') as index:
+            data = index.read()
+        if data[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise MarketArchiveException("Invalid archive index: {}"
+                                         "".format(self.index_path))
+        body = data[len(INDEX_MAGIC):]
+        usable = len(body) - len(body) % INDEX_ENTRY.size
+        for timestamp, offset, count in INDEX_ENTRY.iter_unpack(body[:usable]):
+            self.timestamps.append(timestamp)
+            self.entries.append((timestamp, offset, count))
+        if self.read_only:
+            # blocks are written before their index entry, so every
+            # complete entry can be read as is
+            return
+        end = self._records_end()
+        if usable != len(body):
+            with open(self.index_path, 'r+b') as index:
+                index.truncate(len(INDEX_MAGIC) + usable)
+        if os.path.getsize(self.records_path) != end:
+            logger.warning("Truncating archive records to last complete "
+                           "snapshot.")
+            with open(self.records_path, 'r+b') as records:
+                records.truncate(end)
+
+    def _records_end(self):
+        """
+        Returns the end offset of the last indexed block
+        """
+        if not self.entries:
+            return 0
+        _, offset, count = self.entries[-1]
+        return offset + count * RECORD_SIZE
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, market_list, timestamp=None):
+        """
+        Appends a snapshot of the market to the archive
+
+        @param market_list - dict of currency slug to listing data
+        @param timestamp - unix time of the snapshot (defaults to now)
+        """
+        self._check_writable()
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            self._append(market_list, timestamp)
+
+    def _append(self, market_list, timestamp):
+        if self.timestamps and timestamp <= self.timestamps[-1]:
+            raise MarketArchiveException("Snapshots must be appended in "
+                                         "time order.")
+        rows = []
+        new_coins = False
+        for currency, data in market_list.items():
+            coin_id = str(data['id'])
+            if coin_id not in self.coins:
+                self.coins[coin_id] = [currency, data['symbol']]
+                new_coins = True
+            quote = data['quote']['USD']
+            rows.append((int(data['id']),
+                         _to_float(quote['price']),
+                         _to_float(quote['volume_24h']),
+                         _to_float(quote['market_cap'])))
+        rows.sort()
+        count = len(rows)
+        ids, prices, volumes, market_caps = zip(*rows) if rows else ((), (), (), ())
+        block = b''.join([struct.pack('<{}I'.format(count), *ids),
+                          struct.pack('<{}d'.format(count), *prices),
+                          struct.pack('<{}f'.format(count), *volumes),
+                          struct.pack('<{}f'.format(count), *market_caps)])
+        offset = self._records_end()
+        with open(self.records_path, 'ab') as records:
+            records.write(block)
+        with open(self.index_path, 'ab') as index:
+            index.write(INDEX_ENTRY.pack(timestamp, offset, count))
+        self.timestamps.append(timestamp)
+        self.entries.append((timestamp, offset, count))
+        if new_coins:
+            self._save_coins()
+
+    def _map_records(self):
+        """
+        Memory maps the records file read-only
+
+        @return - mmap object or None if the archive is empty
+        """
+        if self._records_end() == 0:
+            return None
+        with open(self.records_path, 'rb') as records:
+            return mmap.mmap(records.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _entry_range(self, start=None, end=None):
+        """
+        Returns the index entries with start <= timestamp <= end
+        """
+        low = 0 if start is None else bisect.bisect_left(self.timestamps, start)
+        high = (len(self.timestamps) if end is None
+                else bisect.bisect_right(self.timestamps, end))
+        return self.entries[low:high]
+
+    def get_range(self, coin_id, start=None, end=None):
+        """
+        Returns the archived values of one coin over a time range
+
+        @param coin_id - CoinMarketCap id of the coin
+        @param start - earliest unix time to include
+        @param end - latest unix time to include
+        @return - list of (timestamp, price, volume, market cap) tuples
+        """
+        coin_id = int(coin_id)
+        entries = self._entry_range(start, end)
+        if not entries:
+            return []
+        records = self._map_records()
+        result = []
+        try:
+            for timestamp, offset, count in entries:
+                position = _search_ids(records, offset, count, coin_id)
+                if position is None:
+                    continue
+                result.append((timestamp,) + _read_row(records, offset,
+                                                       count, position))
+        finally:
+            records.close()
+        return result
+
+    def read_snapshot(self, number):
+        """
+        Reads one full snapshot
+
+        @param number - position of the snapshot in the archive
+        @return - (timestamp, dict of coin id to (price, volume, market cap))
+        """
+        timestamp, offset, count = self.entries[number]
+        records = self._map_records()
+        try:
+            ids = struct.unpack_from('<{}I'.format(count), records, offset)
+            columns = _columns(records, offset, count)
+            return timestamp, dict(zip(ids, zip(*columns)))
+        finally:
+            records.close()
+
+    def compact(self, older_than, interval):
+        """
+        Downsamples old snapshots to at most one per interval
+
+        @param older_than - unix time before which snapshots are downsampled
+        @param interval - bucket size in seconds for downsampled snapshots
+        @return - number of snapshots removed
+        """
+        self._check_writable()
+        with self.lock:
+            return self._compact(older_than, interval)
+
+    def _compact(self, older_than, interval):
+        keep = []
+        last_bucket = None
+        for entry in self.entries:
+            timestamp = entry[0]
+            if timestamp < older_than:
+                bucket = int(timestamp // interval)
+                if bucket == last_bucket:
+                    continue
+                last_bucket = bucket
+            keep.append(entry)
+        removed = len(self.entries) - len(keep)
+        if not removed:
+            return 0
+        records = self._map_records()
+        index_tmp = self.index_path + ".tmp"
+        records_tmp = self.records_path + ".tmp"
+        new_entries = []
+        try:
+            with open(records_tmp, 'wb') as new_records, \
+                    open(index_tmp, 'wb') as new_index:
+                new_index.write(INDEX_MAGIC)
+                offset = 0
+                for timestamp, old_offset, count in keep:
+                    size = count * RECORD_SIZE
+                    new_records.write(records[old_offset:old_offset + size])
+                    new_index.write(INDEX_ENTRY.pack(timestamp, offset, count))
+                    new_entries.append((timestamp, offset, count))
+                    offset += size
+                new_records.flush()
+                os.fsync(new_records.fileno())
+                new_index.flush()
+                os.fsync(new_index.fileno())
+        finally:
+            records.close()
+        with open(self.marker_path, 'wb') as marker:
+            os.fsync(marker.fileno())
+        os.replace(records_tmp, self.records_path)
+        os.replace(index_tmp, self.index_path)
+        os.remove(self.marker_path)
+        self.entries = new_entries
+        self.timestamps = [entry[0] for entry in new_entries]
+        return removed
+
+
+def _search_ids(records, offset, count, coin_id):
+    """
+    Binary searches the sorted id column of a block
+    """
+    low = 0
+    high = count
+    while low < high:
+        middle = (low + high) // 2
+        value = struct.unpack_from('<I', records, offset + middle * ID_SIZE)[0]
+        if value < coin_id:
+            low = middle + 1
+        elif value > coin_id:
+            high = middle
+        else:
+            return middle
+    return None
+
+
+def _read_row(records, offset, count, position):
+    """
+    Reads price, volume and market cap of one row of a block
+    """
+    price_offset = offset + count * ID_SIZE
+    volume_offset = price_offset + count * PRICE_SIZE
+    market_cap_offset = volume_offset + count * VOLUME_SIZE
+    return (struct.unpack_from('<d', records, price_offset + position * PRICE_SIZE)[0],
+            struct.unpack_from('<f', records, volume_offset + position * VOLUME_SIZE)[0],
+            struct.unpack_from('<f', records, market_cap_offset + position * MARKET_CAP_SIZE)[0])
+
+
+def _columns(records, offset, count):
+    """
+    Reads the price, volume and market cap columns of a block
+    """
+    price_offset = offset + count * ID_SIZE
+    volume_offset = price_offset + count * PRICE_SIZE
+    market_cap_offset = volume_offset + count * VOLUME_SIZE
+    return (struct.unpack_from('<{}d'.format(count), records, price_offset),
+            struct.unpack_from('<{}f'.format(count), records, volume_offset),
+            struct.unpack_from('<{}f'.format(count), records, market_cap_offset))
+
+
+def _to_float(value):
+    """
+    Converts a listing value to float, mapping missing values to NaN
+    """
+    if value is None:
+        return NAN
+    return float(value)
+
+
+def main(argv):
+    """
+    Dumps the archived history of one coin as CSV for offline analysis:
+    python -m cogs.modules.market_archive <directory> <slug or id>
+    """
+    if len(argv) != 3:
+        print("Usage: python -m cogs.modules.market_archive <directory> "
+              "<slug or id>")
+        return 1
+    try:
+        archive = MarketArchive(argv[1], read_only=True)
+    except MarketArchiveException as e:
+        print(str(e))
+        return 1
+    coin = argv[2]
+    if not coin.isdigit():
+        matches = [coin_id for coin_id, (slug, symbol) in archive.coins.items()
+                   if coin in (slug, symbol)]
+        if not matches:
+            print("Unknown coin: {}".format(coin))
+            return 1
+        coin = matches[0]
+    print("timestamp,price,volume_24h,market_cap")
+    for timestamp, price, volume, market_cap in archive.get_range(coin):
+        print("{},{},{},{}".format(timestamp,
+                                   "" if math.isnan(price) else price,
+                                   "" if math.isnan(volume) else volume,
+                                   "" if math.isnan(market_cap) else market_cap))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
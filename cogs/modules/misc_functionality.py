@@ -1,6 +1,5 @@
 from bot_logger import logger
 import discord
-import json
 import time
 
 
@@ -12,9 +11,10 @@ MISC_DISABLED = "MISC_DISABLED"
 class MiscFunctionality:
     """Handles all Misc command functionality"""
 
-    def __init__(self, bot, server_data):
+    def __init__(self, bot, server_data, stats):
         self.bot = bot
         self.server_data = server_data
+        self.stats = stats
         self.start_time = time.time()
 
     def _check_permission(self, ctx):
@@ -104,16 +104,8 @@ class MiscFunctionality:
         try:
             if not self._check_permission(ctx):
                 return
-            alert_count = 0
-            channel_count = 0
-            member_count = 0
+            stats = self.stats
             username = await self.bot.get_user_info(str(133108920511234048))
-            with open('subscribers.json') as subscribers:
-                subscriber_list = json.load(subscribers)
-            with open('alerts.json') as alerts:
-                alert_list = json.load(alerts)
-                for user in alert_list:
-                    alert_count += len(alert_list[user])
             uptime = time.time() - self.start_time
             hours = int(uptime // 3600)
             minutes = int((uptime % 3600) // 60)
@@ -121,9 +113,10 @@ class MiscFunctionality:
             uptime = "{} hours, {} minutes, {} seconds".format(hours,
                                                                minutes,
                                                                seconds)
-            for server in self.bot.servers:
-                channel_count += len(server.channels)
-                member_count += server.member_count
+            if stats.last_refresh_duration is None:
+                last_refresh = "Not yet"
+            else:
+                last_refresh = "{:.2f} seconds".format(stats.last_refresh_duration)
             em = discord.Embed(colour=0xFFFFFF)
             em.set_author(name=self.bot.user,
                           icon_url=self.bot.user.avatar_url)
@@ -132,20 +125,29 @@ class MiscFunctionality:
                          value=str(username),
                          inline=False)
             em.add_field(name="Servers",
-                         value=str(len(self.bot.servers)),
+                         value=str(stats.servers),
                          inline=False)
             em.add_field(name="Channels",
-                         value=str(channel_count),
+                         value=str(stats.channels),
                          inline=True)
             em.add_field(name="Members",
-                         value=str(member_count),
+                         value=str(stats.members),
                          inline=True)
             em.add_field(name="Subscribers",
-                         value=str(len(subscriber_list)),
+                         value=str(stats.subscribers),
                          inline=True)
             em.add_field(name="Alerts",
-                         value=str(alert_count),
+                         value=str(stats.alerts),
                          inline=True)
+            em.add_field(name="Alerts Fired Today",
+                         value=str(stats.get_alerts_fired_today()),
+                         inline=True)
+            em.add_field(name="Live Updates Sent",
+                         value=str(stats.broadcasts),
+                         inline=True)
+            em.add_field(name="Last Market Refresh",
+                         value=last_refresh,
+                         inline=False)
             em.add_field(name="Uptime",
                          value=uptime,
                          inline=False)
@@ -0,0 +1,122 @@
+from collections import deque
+import time
+
+
+# refreshes don't land on the exact same second every hour, so a snapshot
+# taken slightly more than one window ago still counts as inside it
+MOVE_WINDOW_GRACE = 300
+
+
+class SlidingWindowExtrema:
+    """
+    Tracks the minimum and maximum price over a sliding time window
+
+    Both extremes are kept in monotonic deques so pushing a price and
+    expiring old ones is O(1) amortized regardless of the window length.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.min_deque = deque()
+        self.max_deque = deque()
+
+    def push(self, timestamp, price):
+        """
+        Adds a price to the window and expires prices that fell out of it
+
+        @param timestamp - unix time of the price
+        @param price - price of the coin
+        """
+        min_deque = self.min_deque
+        max_deque = self.max_deque
+        while min_deque and min_deque[-1][1] >= price:
+            min_deque.pop()
+        min_deque.append((timestamp, price))
+        while max_deque and max_deque[-1][1] <= price:
+            max_deque.pop()
+        max_deque.append((timestamp, price))
+        cutoff = timestamp - self.window - MOVE_WINDOW_GRACE
+        while min_deque[0][0] < cutoff:
+            min_deque.popleft()
+        while max_deque[0][0] < cutoff:
+            max_deque.popleft()
+
+    def percent_move(self):
+        """
+        Returns the largest percent move from a window extreme to the
+        latest price
+
+        @return - percent move or None if there is no price yet
+        """
+        if not self.min_deque:
+            return None
+        latest = self.min_deque[-1][1]
+        low = self.min_deque[0][1]
+        high = self.max_deque[0][1]
+        rise = (latest - low)/low*100 if low > 0 else 0.0
+        drop = (high - latest)/high*100 if high > 0 else 0.0
+        return max(rise, drop)
+
+
+class MoveTracker:
+    """Maintains sliding windows for watched coins"""
+
+    def __init__(self, history):
+        self.history = history
+        self.windows = {}
+
+    def _seed(self, currency, window):
+        """
+        Creates a window for the coin filled from the recorded history
+        """
+        extrema = SlidingWindowExtrema(window)
+        for snapshot in self.history.get_since(currency,
+                                               window + MOVE_WINDOW_GRACE):
+            extrema.push(snapshot[0], snapshot[1])
+        self.windows[(currency, window)] = extrema
+        return extrema
+
+    def watch(self, currency, window):
+        """
+        Starts tracking a coin over the given window
+
+        @param currency - slug of the cryptocurrency
+        @param window - length of the window in seconds
+        """
+        if (currency, window) not in self.windows:
+            self._seed(currency, window)
+
+    def update(self, market_list, watched, timestamp=None):
+        """
+        Pushes the latest prices into the windows of watched coins
+
+        @param market_list - dict of currency slug to listing data
+        @param watched - set of (currency, window) pairs to track
+        @param timestamp - unix time of the prices (defaults to now)
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        for key in list(self.windows):
+            if key not in watched:
+                self.windows.pop(key)
+        for key in watched:
+            currency, window = key
+            if key not in self.windows:
+                self._seed(currency, window)
+            elif currency in market_list:
+                price = market_list[currency]['quote']['USD']['price']
+                if price is not None:
+                    self.windows[key].push(timestamp, float(price))
+
+    def get_move(self, currency, window):
+        """
+        Returns the largest percent move of a coin within the window
+
+        @param currency - slug of the cryptocurrency
+        @param window - length of the window in seconds
+        @return - percent move or None if nothing was recorded
+        """
+        extrema = self.windows.get((currency, window))
+        if extrema is None:
+            extrema = self._seed(currency, window)
+        return extrema.percent_move()
@@ -0,0 +1,404 @@
+from array import array
+from bot_logger import logger
+from cogs.modules.coin_market import CurrencyException, FiatException
+from discord.errors import Forbidden
+from sharding import SharedFile, state_path
+import discord
+import json
+
+
+CMB_ADMIN = "CMB ADMIN"
+ADMIN_ONLY = "ADMIN_ONLY"
+PORTFOLIO_DISABLED = "PORTFOLIO_DISABLED"
+
+
+class UserPortfolio:
+    """
+    Compact holdings of one user
+
+    Lots are aggregated per coin into parallel arrays so valuing the
+    portfolio never walks the individual lots.
+    """
+
+    __slots__ = ('currencies', 'amounts', 'costs', 'value', 'cost_basis')
+
+    def __init__(self, lots, prices):
+        positions = {}
+        self.currencies = []
+        self.amounts = array('d')
+        self.costs = array('d')
+        for lot in lots.values():
+            currency = lot["currency"]
+            if currency not in positions:
+                positions[currency] = len(self.currencies)
+                self.currencies.append(currency)
+                self.amounts.append(0.0)
+                self.costs.append(0.0)
+            position = positions[currency]
+            self.amounts[position] += float(lot["amount"])
+            self.costs[position] += float(lot["amount"])*float(lot["cost"])
+        self.cost_basis = sum(self.costs)
+        self.value = sum(amount*prices.get(currency, 0.0)
+                         for currency, amount in zip(self.currencies,
+                                                     self.amounts))
+
+
+class PortfolioFunctionality:
+    """Handles Portfolio command functionality"""
+
+    def __init__(self, bot, coin_market, portfolio_capacity, server_data):
+        self.bot = bot
+        self.server_data = server_data
+        self.coin_market = coin_market
+        self.portfolio_capacity = int(portfolio_capacity)
+        self.market_list = ""
+        self.acronym_list = ""
+        self.prices = {}
+        self.portfolios = {}
+        self.holders = {}
+        self.portfolio_file = SharedFile('portfolios.json', self._rebuild_portfolios)
+        self.portfolio_data = self._check_portfolio_file()
+        self._save_portfolio_file(self.portfolio_data, backup=True)
+        self._rebuild_portfolios()
+
+    def update(self, market_list=None, acronym_list=None, server_data=None):
+        """
+        Updates utilities with new coin market and server data
+        """
+        if server_data:
+            self.server_data = server_data
+        if market_list:
+            self.market_list = market_list
+            if not self.refresh():
+                self._revalue(market_list)
+        if acronym_list:
+            self.acronym_list = acronym_list
+
+    def _check_permission(self, ctx):
+        """
+        Checks if user contains the correct permissions to use these
+        commands
+        """
+        try:
+            user_roles = ctx.message.author.roles
+            server_id = ctx.message.server.id
+            if server_id not in self.server_data:
+                return True
+            elif (ADMIN_ONLY in self.server_data[server_id]
+                  or PORTFOLIO_DISABLED in self.server_data[server_id]):
+                if CMB_ADMIN not in [role.name for role in user_roles]:
+                    return False
+            return True
+        except Exception:
+            return True
+
+    def _check_portfolio_file(self):
+        """
+        Checks to see if there's a valid portfolios.json file
+        """
+        try:
+            return self.portfolio_file.load()
+        except FileNotFoundError:
+            self._save_portfolio_file()
+            return json.loads('{}')
+        except Exception as e:
+            print("An error has occured. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
+
+    def _save_portfolio_file(self, portfolio_data={}, backup=False):
+        """
+        Saves portfolios.json file
+        """
+        if not backup:
+            self.portfolio_file.save(portfolio_data)
+            return
+        with open(state_path("portfolios_backup.json"), 'w') as outfile:
+            json.dump(portfolio_data,
+                      outfile,
+                      indent=4)
+
+    def refresh(self):
+        """
+        Picks up the lots other shards changed
+
+        @return - True if the portfolios were rebuilt
+        """
+        return self.portfolio_file.refresh(self.portfolio_data)
+
+    def _rebuild_portfolios(self):
+        """
+        Rebuilds the holdings of every user from their lots
+        """
+        self.prices = {}
+        self.portfolios = {}
+        self.holders = {}
+        for user in self.portfolio_data:
+            self._rebuild_portfolio(user)
+
+    def _rebuild_portfolio(self, user):
+        """
+        Rebuilds the compact holdings of a user from their lots
+
+        @param user - id of the user
+        """
+        old_portfolio = self.portfolios.pop(user, None)
+        if old_portfolio is not None:
+            for currency in old_portfolio.currencies:
+                holders = self.holders[currency]
+                holders.pop(user)
+                if not holders:
+                    # nobody revalues it anymore, so the price would go stale
+                    self.holders.pop(currency)
+                    self.prices.pop(currency, None)
+        lots = self.portfolio_data.get(user)
+        if not lots:
+            return
+        for lot in lots.values():
+            self._seed_price(lot["currency"])
+        portfolio = UserPortfolio(lots, self.prices)
+        self.portfolios[user] = portfolio
+        for position, currency in enumerate(portfolio.currencies):
+            if currency not in self.holders:
+                self.holders[currency] = {}
+            self.holders[currency][user] = position
+
+    def _seed_price(self, currency):
+        """
+        Records the current price of a coin nobody holds yet so new
+        holdings are valued right away
+        """
+        if currency in self.prices or currency in self.holders:
+            return
+        if not self.market_list or currency not in self.market_list:
+            return
+        price = self.market_list[currency]['quote']['USD']['price']
+        if price is not None:
+            self.prices[currency] = float(price)
+
+    def _revalue(self, market_list):
+        """
+        Applies price changes to the portfolios holding the changed coins
+
+        @param market_list - dict of currency slug to listing data
+        """
+        prices = self.prices
+        portfolios = self.portfolios
+        for currency, holders in self.holders.items():
+            if currency not in market_list:
+                continue
+            price = market_list[currency]['quote']['USD']['price']
+            if price is None:
+                continue
+            price = float(price)
+            delta = price - prices.get(currency, 0.0)
+            if delta == 0.0:
+                continue
+            prices[currency] = price
+            for user, position in holders.items():
+                portfolio = portfolios[user]
+                portfolio.value += portfolio.amounts[position]*delta
+
+    def get_totals(self, user):
+        """
+        Returns the precomputed value and cost basis of a user's portfolio
+
+        @param user - id of the user
+        @return - (value, cost basis) in USD or None if the user has no
+                  holdings
+        """
+        portfolio = self.portfolios.get(user)
+        if portfolio is None:
+            return None
+        return portfolio.value, portfolio.cost_basis
+
+    def iter_totals(self, users):
+        """
+        Yields the totals of the users that have a portfolio
+
+        @param users - ids of the users to look up
+        @return - generator of (user, (value, cost basis))
+        """
+        portfolios = self.portfolios
+        if len(users) > len(portfolios):
+            users = [user for user in portfolios if user in users]
+        for user in users:
+            portfolio = portfolios.get(user)
+            if portfolio is not None:
+                yield user, (portfolio.value, portfolio.cost_basis)
+
+    async def _say_msg(self, msg=None, channel=None, emb=None):
+        """
+        Bot will say msg if given correct permissions
+
+        @param msg - msg to say
+        @param channel - channel to send msg to
+        @param emb - embedded msg to say
+        """
+        try:
+            if channel:
+                if emb:
+                    await self.bot.send_message(channel, embed=emb)
+                else:
+                    await self.bot.send_message(channel, msg)
+            else:
+                if emb:
+                    await self.bot.say(embed=emb)
+                else:
+                    await self.bot.say(msg)
+        except Exception:
+            pass
+
+    async def add_lot(self, ctx, currency, amount, cost, fiat):
+        """
+        Adds a lot of coins to the user's portfolio
+
+        @param ctx - context of the command sent
+        @param currency - cryptocurrency that was bought
+        @param amount - amount of coins bought
+        @param cost - price paid per coin
+        @param fiat - fiat currency the cost was paid in (i.e. 'EUR', 'USD')
+        """
+        try:
+            if not self._check_permission(ctx):
+                return
+            ucase_fiat = self.coin_market.fiat_check(fiat)
+            if currency.upper() in self.acronym_list:
+                currency = self.acronym_list[currency.upper()]
+                if "Duplicate" in currency:
+                    await self._say_msg(currency)
+                    return
+            if currency not in self.market_list:
+                raise CurrencyException("Currency is invalid: ``{}``".format(currency))
+            if amount <= 0 or cost < 0:
+                await self._say_msg("Amount must be greater than 0 and cost "
+                                    "can't be negative.")
+                return
+            user_id = ctx.message.author.id
+            async with self.portfolio_file.edit(self.portfolio_data):
+                if user_id not in self.portfolio_data:
+                    self.portfolio_data[user_id] = {}
+                lot_list = self.portfolio_data[user_id]
+                if len(lot_list) >= self.portfolio_capacity:
+                    await self._say_msg("Unable to add lot, portfolio capacity of "
+                                        "**{}** has been reached."
+                                        "".format(self.portfolio_capacity))
+                    return
+                lot_num = None
+                for i in range(1, len(lot_list) + 2):
+                    if str(i) not in lot_list:
+                        lot_num = str(i)
+                        break
+                usd_cost = cost/self.coin_market.cross_rates.fiat_rate(ucase_fiat)
+                lot_list[lot_num] = {"currency": currency,
+                                     "amount": amount,
+                                     "cost": usd_cost}
+                self._rebuild_portfolio(user_id)
+                self._save_portfolio_file(self.portfolio_data)
+                await self._say_msg("Added lot **{}**: **{}** {} at **{}** each."
+                                    "".format(lot_num,
+                                              amount,
+                                              currency.title(),
+                                              self.coin_market.format_price(usd_cost,
+                                                                            ucase_fiat)))
+        except Forbidden:
+            pass
+        except CurrencyException as e:
+            logger.error("CurrencyException: {}".format(str(e)))
+            await self._say_msg(str(e))
+        except FiatException as e:
+            logger.error("FiatException: {}".format(str(e)))
+            await self._say_msg(str(e))
+        except Exception as e:
+            print("Failed to add lot. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
+
+    async def remove_lot(self, ctx, lot_num):
+        """
+        Removes a lot from the user's portfolio
+
+        @param ctx - context of the command sent
+        @param lot_num - number of the lot to remove
+        """
+        try:
+            if not self._check_permission(ctx):
+                return
+            user_id = ctx.message.author.id
+            async with self.portfolio_file.edit(self.portfolio_data):
+                lot_list = self.portfolio_data.get(user_id, {})
+                if lot_num not in lot_list:
+                    await self._say_msg("The number you've entered does not exist "
+                                        "in your portfolio. Use `$portfolio` to "
+                                        "see your lots.")
+                    return
+                lot = lot_list.pop(lot_num)
+                if not lot_list:
+                    self.portfolio_data.pop(user_id)
+                self._rebuild_portfolio(user_id)
+                self._save_portfolio_file(self.portfolio_data)
+                await self._say_msg("Lot **{}** (**{}** {}) was successfully removed."
+                                    "".format(lot_num,
+                                              lot["amount"],
+                                              lot["currency"].title()))
+        except Forbidden:
+            pass
+        except Exception as e:
+            print("Failed to remove lot. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
+
+    async def display_portfolio(self, ctx, fiat):
+        """
+        Displays the user's lots along with the current value and
+        profit/loss of the portfolio
+
+        @param ctx - context of the command sent
+        @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
+        """
+        try:
+            if not self._check_permission(ctx):
+                return
+            ucase_fiat = self.coin_market.fiat_check(fiat)
+            self.refresh()
+            user_id = ctx.message.author.id
+            totals = self.get_totals(user_id)
+            if totals is None:
+                em = discord.Embed(title="Portfolio",
+                                   description="You don't have any lots. "
+                                               "Add one with `$padd`.",
+                                   colour=0xD14836)
+                await self._say_msg(emb=em)
+                return
+            value, cost_basis = totals
+            profit = value - cost_basis
+            lot_list = self.portfolio_data[user_id]
+            msg = ""
+            for lot_num in sorted(lot_list, key=int):
+                lot = lot_list[lot_num]
+                msg += ("[**{}**] **{}** {} at **{}** each\n"
+                        "".format(lot_num,
+                                  lot["amount"],
+                                  lot["currency"].title(),
+                                  self.coin_market.format_price(lot["cost"],
+                                                                ucase_fiat)))
+            msg += ("\nValue: **{}**\n"
+                    "Cost: **{}**\n"
+                    "Profit: **{}**".format(self.coin_market.format_price(value,
+                                                                          ucase_fiat),
+                                            self.coin_market.format_price(cost_basis,
+                                                                          ucase_fiat),
+                                            self.coin_market.format_price(profit,
+                                                                          ucase_fiat)))
+            if cost_basis > 0:
+                msg += " (**{:.2f}%**)".format(profit/cost_basis*100)
+            color = 0xD14836 if profit < 0 else 0x00FF00
+            em = discord.Embed(title="Portfolio",
+                               description=msg,
+                               colour=color)
+            await self._say_msg(emb=em)
+        except Forbidden:
+            pass
+        except FiatException as e:
+            logger.error("FiatException: {}".format(str(e)))
+            await self._say_msg(str(e))
+        except Exception as e:
+            print("Failed to display portfolio. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
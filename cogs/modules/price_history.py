@@ -0,0 +1,205 @@
+from array import array
+from bot_logger import logger
+import math
+import time
+
+
+DEFAULT_RETENTION = 168
+MAX_HISTORY_COINS = 5500
+NAN = float('nan')
+
+
+class PriceHistoryException(Exception):
+    """Exception class for price history"""
+
+
+class PriceHistory:
+    """
+    Fixed-memory store of recent market snapshots
+
+    Every coin gets a row of `retention` slots in preallocated typed
+    arrays (price as float64, volume and market cap as float32). All rows
+    share one circular write position, so appending a snapshot costs O(1)
+    per coin and reading a coin's window only touches that coin's row.
+    """
+
+    def __init__(self, retention=DEFAULT_RETENTION, max_coins=MAX_HISTORY_COINS):
+        if retention < 2:
+            raise PriceHistoryException("Retention must be at least 2 snapshots.")
+        self.retention = int(retention)
+        self.max_coins = int(max_coins)
+        size = self.retention * self.max_coins
+        self.timestamps = array('d', [0.0]) * self.retention
+        self.price = array('d', [NAN]) * size
+        self.volume = array('f', [NAN]) * size
+        self.market_cap = array('f', [NAN]) * size
+        self.rows = {}
+        self.last_seen = {}
+        self.free_rows = list(range(self.max_coins - 1, -1, -1))
+        self.head = 0
+        self.count = 0
+        self.generation = 0
+
+    def _get_row(self, currency):
+        """
+        Returns the row of a currency, allocating one if it's new
+
+        @param currency - slug of the cryptocurrency
+        @return - row number or None if the store is full
+        """
+        row = self.rows.get(currency)
+        if row is None:
+            if not self.free_rows:
+                return None
+            row = self.free_rows.pop()
+            self.rows[currency] = row
+        return row
+
+    def _release_stale_rows(self):
+        """
+        Frees rows of currencies missing for a full retention window
+        """
+        cutoff = self.generation - self.retention
+        stale = [currency for currency, seen in self.last_seen.items()
+                 if seen <= cutoff]
+        for currency in stale:
+            row = self.rows.pop(currency)
+            self.last_seen.pop(currency)
+            self.free_rows.append(row)
+
+    def append(self, market_list, timestamp=None):
+        """
+        Records the latest snapshot of the market
+
+        @param market_list - dict of currency slug to listing data
+        @param timestamp - unix time of the snapshot (defaults to now)
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        slot = self.head
+        retention = self.retention
+        price = self.price
+        volume = self.volume
+        market_cap = self.market_cap
+        self.generation += 1
+        dropped = 0
+        for currency, data in market_list.items():
+            row = self._get_row(currency)
+            if row is None:
+                dropped += 1
+                continue
+            quote = data['quote']['USD']
+            index = row * retention + slot
+            price[index] = _to_float(quote['price'])
+            volume[index] = _to_float(quote['volume_24h'])
+            market_cap[index] = _to_float(quote['market_cap'])
+            self.last_seen[currency] = self.generation
+        for currency, row in self.rows.items():
+            if self.last_seen[currency] != self.generation:
+                index = row * retention + slot
+                price[index] = NAN
+                volume[index] = NAN
+                market_cap[index] = NAN
+        if dropped:
+            logger.warning("Price history is full, dropped {} currencies."
+                           "".format(dropped))
+        self.timestamps[slot] = timestamp
+        self.head = (slot + 1) % retention
+        self.count = min(self.count + 1, retention)
+        self._release_stale_rows()
+
+    def get_range(self, currency, window=None):
+        """
+        Returns the most recent snapshots recorded for a currency
+
+        @param currency - slug of the cryptocurrency
+        @param window - number of snapshots to read (defaults to all)
+        @return - list of (timestamp, price, volume, market cap) tuples,
+                  oldest first
+        """
+        row = self.rows.get(currency)
+        if row is None:
+            return []
+        if window is None or window > self.count:
+            window = self.count
+        base = row * self.retention
+        result = []
+        for i in range(window, 0, -1):
+            slot = (self.head - i) % self.retention
+            index = base + slot
+            price = self.price[index]
+            if math.isnan(price):
+                continue
+            result.append((self.timestamps[slot],
+                           price,
+                           self.volume[index],
+                           self.market_cap[index]))
+        return result
+
+    def get_since(self, currency, seconds, now=None):
+        """
+        Returns the snapshots of a currency recorded in the last n seconds
+
+        @param currency - slug of the cryptocurrency
+        @param seconds - length of the window in seconds
+        @param now - unix time the window ends at (defaults to now)
+        @return - list of (timestamp, price, volume, market cap) tuples,
+                  oldest first
+        """
+        if now is None:
+            now = time.time()
+        cutoff = now - seconds
+        window = 0
+        while window < self.count:
+            slot = (self.head - window - 1) % self.retention
+            if self.timestamps[slot] < cutoff:
+                break
+            window += 1
+        return self.get_range(currency, window)
+
+    def memory_usage(self):
+        """
+        Returns the number of bytes held by the preallocated buffers
+        """
+        return estimate_memory(self.retention, self.max_coins)
+
+    def memory_report(self, coin_count=5000):
+        """
+        Returns a summary of the memory budget of the history store
+
+        @param coin_count - number of coins to estimate the budget for
+        @return - formatted report
+        """
+        budget = estimate_memory(self.retention, coin_count)
+        allocated = self.memory_usage()
+        return ("Price history: {} snapshots per coin, {:,.1f} KiB for {:,} "
+                "coins ({:,.1f} KiB allocated for {:,} rows)"
+                "".format(self.retention,
+                          budget / 1024,
+                          coin_count,
+                          allocated / 1024,
+                          self.max_coins))
+
+
+def estimate_memory(retention, coin_count):
+    """
+    Estimates the bytes needed to keep a history of the given size
+
+    @param retention - number of snapshots kept per coin
+    @param coin_count - number of coins tracked
+    @return - size in bytes
+    """
+    per_slot = (array('d').itemsize
+                + array('f').itemsize
+                + array('f').itemsize)
+    return (retention * coin_count * per_slot
+            + retention * array('d').itemsize)
+
+
+def _to_float(value):
+    """
+    Converts a listing value to float, mapping missing values to NaN
+    """
+    if value is None:
+        return NAN
+    return float(value)
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+import asyncio
+
+
+MAX_RESULTS = 256
+
+
+class SingleFlight:
+    """
+    Shares one computation between identical requests
+
+    Requests with the same key against the same market generation wait on
+    the computation already in flight, or reuse its result if it has
+    finished, instead of doing the work again. Results are dropped as soon
+    as the generation changes, so a refresh is never hidden.
+    """
+
+    def __init__(self, max_results=MAX_RESULTS):
+        self.max_results = max_results
+        self.generation = None
+        self.in_flight = {}
+        self.results = OrderedDict()
+        self.requests = 0
+        self.computations = 0
+
+    async def run(self, key, generation, compute):
+        """
+        Returns the result for the key, computing it at most once per
+        generation
+
+        @param key - hashable description of the request
+        @param generation - generation of the data the result depends on
+        @param compute - function returning the result (or a coroutine)
+        @return - result of compute
+        """
+        self.requests += 1
+        if generation != self.generation:
+            self.generation = generation
+            self.results.clear()
+        key = (generation, key)
+        if key in self.results:
+            self.results.move_to_end(key)
+            return self.results[key]
+        future = self.in_flight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.Future()
+        self.in_flight[key] = future
+        self.computations += 1
+        try:
+            result = compute()
+            if asyncio.iscoroutine(result):
+                result = await result
+            future.set_result(result)
+        except Exception as e:
+            future.set_exception(e)
+            # mark the exception as retrieved in case nobody was waiting
+            future.exception()
+            raise
+        finally:
+            self.in_flight.pop(key, None)
+            if not future.done():
+                future.cancel()
+        if key[0] == self.generation:
+            self.results[key] = result
+            if len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+        return result
+
+    def stats(self):
+        """
+        Returns how many requests shared a computation
+
+        @return - dict with requests, computations and the coalescing ratio
+        """
+        if self.requests:
+            ratio = 1 - self.computations/self.requests
+        else:
+            ratio = 0.0
+        return {"requests": self.requests,
+                "computations": self.computations,
+                "coalescing_ratio": ratio}
@@ -0,0 +1,81 @@
+import datetime
+
+
+class StatsRegistry:
+    """
+    Running totals shown by $info
+
+    The modules that change alerts, subscribers or servers update the
+    counters as they go, so reading them never touches the disk or walks
+    the server list.
+    """
+
+    def __init__(self):
+        self.servers = 0
+        self.channels = 0
+        self.members = 0
+        self.alerts = 0
+        self.subscribers = 0
+        self.alerts_fired = 0
+        self.alerts_fired_today = 0
+        self.fired_day = datetime.date.today()
+        self.broadcasts = 0
+        self.last_refresh_duration = None
+
+    def rebuild_servers(self, servers):
+        """
+        Recounts servers, channels and members from scratch
+
+        @param servers - servers the bot is in
+        """
+        self.servers = 0
+        self.channels = 0
+        self.members = 0
+        for server in servers:
+            self.add_server(server)
+
+    def add_server(self, server):
+        self.servers += 1
+        self.channels += len(server.channels)
+        self.members += server.member_count or 0
+
+    def remove_server(self, server):
+        self.servers = max(self.servers - 1, 0)
+        self.channels = max(self.channels - len(server.channels), 0)
+        self.members = max(self.members - (server.member_count or 0), 0)
+
+    def add_channel(self, channel):
+        if getattr(channel, "server", None) is not None:
+            self.channels += 1
+
+    def remove_channel(self, channel):
+        if getattr(channel, "server", None) is not None:
+            self.channels = max(self.channels - 1, 0)
+
+    def add_member(self):
+        self.members += 1
+
+    def remove_member(self):
+        self.members = max(self.members - 1, 0)
+
+    def record_alerts_fired(self, count=1):
+        """
+        Counts alerts that were triggered, resetting the daily count at
+        midnight
+
+        @param count - number of alerts triggered
+        """
+        today = datetime.date.today()
+        if today != self.fired_day:
+            self.fired_day = today
+            self.alerts_fired_today = 0
+        self.alerts_fired += count
+        self.alerts_fired_today += count
+
+    def get_alerts_fired_today(self):
+        """
+        Returns the alerts triggered since midnight
+        """
+        if datetime.date.today() != self.fired_day:
+            return 0
+        return self.alerts_fired_today
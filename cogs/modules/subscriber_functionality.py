@@ -1,9 +1,12 @@
 from bot_logger import logger
+from bot_metrics import BROADCAST_SECONDS, BROADCASTS
 from cogs.modules.coin_market import CoinMarketException, CurrencyException, FiatException
 from collections import defaultdict
 from discord.errors import Forbidden
+from sharding import SharedFile, state_path
 import discord
 import json
+import time
 
 
 CMB_ADMIN = "CMB ADMIN"
@@ -14,8 +17,9 @@ SUBSCRIBER_DISABLED = "SUBSCRIBER_DISABLED"
 class SubscriberFunctionality:
     """Handles Subscriber command Functionality"""
 
-    def __init__(self, bot, coin_market, sub_capacity, server_data):
+    def __init__(self, bot, coin_market, sub_capacity, server_data, stats):
         self.bot = bot
+        self.stats = stats
         self.server_data = server_data
         self.coin_market = coin_market
         self.sub_capacity = int(sub_capacity)
@@ -24,8 +28,13 @@ class SubscriberFunctionality:
         self.cache_data = {}
         self.cache_channel = {}
         self.supported_rates = ["default", "24h", "12h", "6h", "3h", "2h"]
+        self.subscriber_file = SharedFile('subscribers.json', self._count_subscribers)
         self.subscriber_data = self._check_subscriber_file()
         self._save_subscriber_file(self.subscriber_data, backup=True)
+        self._count_subscribers()
+
+    def _count_subscribers(self):
+        self.stats.subscribers = len(self.subscriber_data)
 
     def update(self, market_list=None, acronym_list=None, server_data=None):
         """
@@ -62,8 +71,7 @@ class SubscriberFunctionality:
         Checks to see if there's a valid subscribers.json file
         """
         try:
-            with open('subscribers.json') as subscribers:
-                return json.load(subscribers)
+            return self.subscriber_file.load()
         except FileNotFoundError:
             self._save_subscriber_file()
             return json.loads('{}')
@@ -75,11 +83,10 @@ class SubscriberFunctionality:
         """
         Saves subscribers.json file
         """
-        if backup:
-            subscriber_filename = "subscribers_backup.json"
-        else:
-            subscriber_filename = "subscribers.json"
-        with open(subscriber_filename, 'w') as outfile:
+        if not backup:
+            self.subscriber_file.save(subscriber_data)
+            return
+        with open(state_path("subscribers_backup.json"), 'w') as outfile:
             json.dump(subscriber_data,
                       outfile,
                       indent=4)
@@ -172,9 +179,13 @@ class SubscriberFunctionality:
         Obtains and displays live updates of coin stats in n-second intervals.
 
         @param minute - the minute the clock is at
+        @return - number of channels posted to
         """
+        posted = 0
         try:
-            self._check_invalid_sub_currencies()
+            broadcast_start = time.perf_counter()
+            async with self.subscriber_file.edit(self.subscriber_data):
+                self._check_invalid_sub_currencies()
             subscriber_list = self.subscriber_data.copy()
             for channel in subscriber_list:
                 first_post = True
@@ -183,6 +194,9 @@ class SubscriberFunctionality:
                     self.cache_channel[channel] = channel_obj
                 else:
                     channel_obj = self.cache_channel[channel]
+                if channel_obj is None:
+                    # served by another shard or no longer reachable
+                    continue
                 channel_settings = subscriber_list[channel]
                 result = await self._get_live_data(channel_obj,
                                                    channel_settings,
@@ -193,6 +207,9 @@ class SubscriberFunctionality:
                 else:
                     data = None
                 if data:
+                    self.stats.broadcasts += 1
+                    BROADCASTS.inc()
+                    posted += 1
                     for msg in data:
                         if first_post:
                             em = discord.Embed(title="Live Currency Update",
@@ -204,18 +221,24 @@ class SubscriberFunctionality:
                                                colour=0xFF9900)
                         await self._say_msg(channel=channel_obj,
                                             emb=em)
+            BROADCAST_SECONDS.observe(time.perf_counter() - broadcast_start)
         except CurrencyException as e:
             print("An error has occured. See error.log.")
             logger.error("CurrencyException: {}".format(str(e)))
+            raise
         except FiatException as e:
             logger.error("FiatException: {}".format(str(e)))
             await self._say_msg(e)
+            raise
         except CoinMarketException as e:
             print("An error has occured. See error.log.")
             logger.error("CoinMarketException: {}".format(str(e)))
+            raise
         except Exception as e:
             print("An error has occured. See error.log.")
             logger.error("Exception: {}".format(str(e)))
+            raise
+        return posted
 
     async def add_subscriber(self, ctx, fiat):
         """
@@ -237,24 +260,26 @@ class SubscriberFunctionality:
                                     " Please make sure this channel is within a "
                                     "valid server.")
                 return
-            if channel not in subscriber_list:
-                if len(self.subscriber_data) >= self.sub_capacity:
-                    await self._say_msg("Subscriber capacity met. Contact the "
-                                        "owner of this bot to reserve a "
-                                        "channel.")
-                    return
-                subscriber_list[channel] = {}
-                channel_settings = subscriber_list[channel]
-                channel_settings["interval"] = "5"
-                channel_settings["purge"] = False
-                channel_settings["fiat"] = ucase_fiat
-                channel_settings["currencies"] = []
-                self._save_subscriber_file(self.subscriber_data)
-                await self._say_msg("Channel has succcesfully subscribed. Now "
-                                    "add some currencies with `$addc` to begin "
-                                    "receiving updates.")
-            else:
-                await self._say_msg("Channel is already subscribed.")
+            async with self.subscriber_file.edit(self.subscriber_data):
+                if channel not in subscriber_list:
+                    if len(self.subscriber_data) >= self.sub_capacity:
+                        await self._say_msg("Subscriber capacity met. Contact the "
+                                            "owner of this bot to reserve a "
+                                            "channel.")
+                        return
+                    subscriber_list[channel] = {}
+                    channel_settings = subscriber_list[channel]
+                    channel_settings["interval"] = "5"
+                    channel_settings["purge"] = False
+                    channel_settings["fiat"] = ucase_fiat
+                    channel_settings["currencies"] = []
+                    self._save_subscriber_file(self.subscriber_data)
+                    self.stats.subscribers = len(self.subscriber_data)
+                    await self._say_msg("Channel has succcesfully subscribed. Now "
+                                        "add some currencies with `$addc` to begin "
+                                        "receiving updates.")
+                else:
+                    await self._say_msg("Channel is already subscribed.")
         except Exception as e:
             print("An error has occured. See error.log.")
             logger.error("Exception: {}".format(str(e)))
@@ -270,12 +295,14 @@ class SubscriberFunctionality:
                 return
             channel = ctx.message.channel.id
             subscriber_list = self.subscriber_data
-            if channel in subscriber_list:
-                subscriber_list.pop(channel)
-                self._save_subscriber_file(self.subscriber_data)
-                await self._say_msg("Channel has unsubscribed.")
-            else:
-                await self._say_msg("Channel was never subscribed.")
+            async with self.subscriber_file.edit(self.subscriber_data):
+                if channel in subscriber_list:
+                    subscriber_list.pop(channel)
+                    self._save_subscriber_file(self.subscriber_data)
+                    self.stats.subscribers = len(self.subscriber_data)
+                    await self._say_msg("Channel has unsubscribed.")
+                else:
+                    await self._say_msg("Channel was never subscribed.")
         except Forbidden:
             pass
         except Exception as e:
@@ -292,18 +319,19 @@ class SubscriberFunctionality:
             channel = ctx.message.channel.id
             subscriber_list = self.subscriber_data
             self.bot.get_channel(channel).server  # validate channel
-            if channel not in subscriber_list:
-                await self._say_msg("Channel was never subscribed.")
-                return
-            channel_settings = subscriber_list[channel]
-            channel_settings["purge"] = not channel_settings["purge"]
-            self._save_subscriber_file(self.subscriber_data)
-            if channel_settings["purge"]:
-                await self._say_msg("Purge mode on. Bot will now purge messages upon"
-                                    " live updates. Please make sure your bot has "
-                                    "the right permissions to remove messages.")
-            else:
-                await self._say_msg("Purge mode off.")
+            async with self.subscriber_file.edit(self.subscriber_data):
+                if channel not in subscriber_list:
+                    await self._say_msg("Channel was never subscribed.")
+                    return
+                channel_settings = subscriber_list[channel]
+                channel_settings["purge"] = not channel_settings["purge"]
+                self._save_subscriber_file(self.subscriber_data)
+                if channel_settings["purge"]:
+                    await self._say_msg("Purge mode on. Bot will now purge messages upon"
+                                        " live updates. Please make sure your bot has "
+                                        "the right permissions to remove messages.")
+                else:
+                    await self._say_msg("Purge mode off.")
         except Exception as e:
             await self._say_msg("Failed to set purge mode. Please make sure this"
                                 " channel is within a valid server.")
@@ -365,16 +393,17 @@ class SubscriberFunctionality:
                 raise CurrencyException("Currency is invalid: ``{}``".format(currency))
             channel = ctx.message.channel.id
             subscriber_list = self.subscriber_data
-            if channel in subscriber_list:
-                channel_settings = subscriber_list[channel]
-                if currency in channel_settings["currencies"]:
-                    await self._say_msg("``{}`` is already added.".format(currency.title()))
-                    return
-                channel_settings["currencies"].append(currency)
-                self._save_subscriber_file(self.subscriber_data)
-                await self._say_msg("``{}`` was successfully added.".format(currency.title()))
-            else:
-                await self._say_msg("The channel needs to be subscribed first.")
+            async with self.subscriber_file.edit(self.subscriber_data):
+                if channel in subscriber_list:
+                    channel_settings = subscriber_list[channel]
+                    if currency in channel_settings["currencies"]:
+                        await self._say_msg("``{}`` is already added.".format(currency.title()))
+                        return
+                    channel_settings["currencies"].append(currency)
+                    self._save_subscriber_file(self.subscriber_data)
+                    await self._say_msg("``{}`` was successfully added.".format(currency.title()))
+                else:
+                    await self._say_msg("The channel needs to be subscribed first.")
         except Forbidden:
             pass
         except CurrencyException as e:
@@ -404,18 +433,19 @@ class SubscriberFunctionality:
                     return
             channel = ctx.message.channel.id
             subscriber_list = self.subscriber_data
-            if channel in subscriber_list:
-                channel_settings = subscriber_list[channel]
-                if currency in channel_settings["currencies"]:
-                    channel_settings["currencies"].remove(currency)
-                    self._save_subscriber_file(self.subscriber_data)
-                    await self._say_msg("``{}`` was successfully removed."
-                                        "".format(currency.title()))
+            async with self.subscriber_file.edit(self.subscriber_data):
+                if channel in subscriber_list:
+                    channel_settings = subscriber_list[channel]
+                    if currency in channel_settings["currencies"]:
+                        channel_settings["currencies"].remove(currency)
+                        self._save_subscriber_file(self.subscriber_data)
+                        await self._say_msg("``{}`` was successfully removed."
+                                            "".format(currency.title()))
+                    else:
+                        await self._say_msg("``{}`` was never added or is invalid."
+                                            "".format(currency.title()))
                 else:
-                    await self._say_msg("``{}`` was never added or is invalid."
-                                        "".format(currency.title()))
-            else:
-                await self._say_msg("The channel needs to be subscribed first.")
+                    await self._say_msg("The channel needs to be subscribed first.")
         except Forbidden:
             pass
         except CurrencyException as e:
@@ -448,24 +478,25 @@ class SubscriberFunctionality:
                                     "**24h** - every 24 hours\n")
                 return
             channel = ctx.message.channel.id
-            if channel in self.subscriber_data:
-                # Probably going to re-do this in the future
-                if rate == "24h":
-                    self.subscriber_data[channel]["interval"] = "0"
-                elif rate == "12h":
-                    self.subscriber_data[channel]["interval"] = "720"
-                elif rate == "6h":
-                    self.subscriber_data[channel]["interval"] = "360"
-                elif rate == "3h":
-                    self.subscriber_data[channel]["interval"] = "180"
-                elif rate == "2h":
-                    self.subscriber_data[channel]["interval"] = "120"
+            async with self.subscriber_file.edit(self.subscriber_data):
+                if channel in self.subscriber_data:
+                    # Probably going to re-do this in the future
+                    if rate == "24h":
+                        self.subscriber_data[channel]["interval"] = "0"
+                    elif rate == "12h":
+                        self.subscriber_data[channel]["interval"] = "720"
+                    elif rate == "6h":
+                        self.subscriber_data[channel]["interval"] = "360"
+                    elif rate == "3h":
+                        self.subscriber_data[channel]["interval"] = "180"
+                    elif rate == "2h":
+                        self.subscriber_data[channel]["interval"] = "120"
+                    else:
+                        self.subscriber_data[channel]["interval"] = "60"
+                    self._save_subscriber_file(self.subscriber_data)
+                    await self._say_msg("Interval is set to **{}**".format(rate))
                 else:
-                    self.subscriber_data[channel]["interval"] = "60"
-                self._save_subscriber_file(self.subscriber_data)
-                await self._say_msg("Interval is set to **{}**".format(rate))
-            else:
-                await self._say_msg("Channel must be subscribed first.")
+                    await self._say_msg("Channel must be subscribed first.")
         except Exception as e:
             print("Unable to set live update interval. See error.log.")
             logger.error("Exception: {}".format(str(e)))
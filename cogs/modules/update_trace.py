@@ -0,0 +1,124 @@
+from bot_metrics import UPDATE_SECONDS
+from collections import deque
+from contextlib import contextmanager
+import datetime
+import time
+
+
+DEFAULT_TRACE_COUNT = 48
+
+
+class Span:
+    """One phase of an update cycle"""
+
+    def __init__(self, name, offset):
+        self.name = name
+        self.offset = offset
+        self.duration = None
+        self.counts = {}
+        self.error = None
+
+
+class UpdateTrace:
+    """Timings and item counts of every phase of one update cycle"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.start_counter = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self.error = None
+
+    @contextmanager
+    def span(self, name, fatal=True):
+        """
+        Times the body of the with block as a phase of the cycle
+
+        @param name - name of the phase
+        @param fatal - False to record an error and carry on with the cycle
+        @return - dict the phase's item counts can be stored in
+        """
+        started = time.perf_counter()
+        span = Span(name, started - self.start_counter)
+        self.spans.append(span)
+        try:
+            yield span.counts
+        except Exception as e:
+            span.error = "{}: {}".format(type(e).__name__, e)
+            if fatal:
+                raise
+        finally:
+            span.duration = time.perf_counter() - started
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start_counter
+
+    def format(self):
+        """
+        Returns the trace as a few lines of text
+        """
+        started = datetime.datetime.fromtimestamp(self.started)
+        lines = ["Update at {} took {:.2f}s".format(started.strftime("%m/%d %H:%M:%S"),
+                                                    self.duration or 0)]
+        for span in self.spans:
+            line = "  {:<18} {:>7.3f}s".format(span.name, span.duration or 0)
+            if span.counts:
+                line += "  " + " ".join("{}={}".format(key, value)
+                                        for key, value in sorted(span.counts.items()))
+            if span.error:
+                line += "  failed: {}".format(span.error)
+            lines.append(line)
+        if self.error:
+            lines.append("  failed: {}".format(self.error))
+        return "\n".join(lines)
+
+
+class UpdateTraces:
+    """
+    Ring of the traces of the last update cycles
+
+    Every finished cycle also feeds its phase timings into the update
+    histogram of the metrics.
+    """
+
+    def __init__(self, count=DEFAULT_TRACE_COUNT):
+        self.traces = deque(maxlen=count)
+
+    def start(self):
+        """
+        Starts tracing a new update cycle
+
+        @return - the trace of the cycle
+        """
+        return UpdateTrace()
+
+    def finish(self, trace, error=None):
+        """
+        Stores a finished cycle
+
+        @param trace - trace returned by start
+        @param error - exception that ended the cycle early, if any
+        """
+        trace.finish()
+        if error is not None and not any(span.error for span in trace.spans):
+            trace.error = "{}: {}".format(type(error).__name__, error)
+        for span in trace.spans:
+            UPDATE_SECONDS.observe(span.duration, phase=span.name)
+        UPDATE_SECONDS.observe(trace.duration, phase="total")
+        self.traces.append(trace)
+
+    def get_latest(self, count):
+        """
+        Returns the most recent traces, newest first
+
+        @param count - number of traces
+        """
+        return list(self.traces)[::-1][:count]
+
+    def format(self, count):
+        """
+        Returns the most recent traces as text, newest first
+
+        @param count - number of traces
+        """
+        return "\n\n".join(trace.format() for trace in self.get_latest(count))
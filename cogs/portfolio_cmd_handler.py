@@ -0,0 +1,54 @@
+from discord.ext import commands
+
+
+class PortfolioCommands:
+    """Handles commands for tracking crypto portfolios"""
+
+    def __init__(self, cmd_function):
+        self.cmd_function = cmd_function
+
+    @commands.command(name='padd', pass_context=True)
+    async def padd(self, ctx, currency: str, amount: float, cost: float, fiat='USD'):
+        """
+        Adds a lot of bought coins to your portfolio
+        An example for this command would be:
+        "$padd bitcoin 0.5 9000"
+
+        @param currency - cryptocurrency that was bought
+        @param amount - amount of coins bought
+        @param cost - price paid per coin
+        @param fiat - fiat currency the cost was paid in (i.e. 'EUR', 'USD')
+        """
+        await self.cmd_function.portfolio.add_lot(ctx, currency, amount, cost, fiat)
+
+    @commands.command(name='prem', pass_context=True)
+    async def prem(self, ctx, lot_num: str):
+        """
+        Removes a lot from your portfolio
+        Use $portfolio to see what lot numbers you can remove first.
+        An example for this command would be:
+        "$prem 2"
+
+        @param lot_num - number of the lot to remove
+        """
+        await self.cmd_function.portfolio.remove_lot(ctx, lot_num)
+
+    @commands.command(name='portfolio', pass_context=True)
+    async def portfolio(self, ctx, fiat='USD'):
+        """
+        Displays your portfolio with its current value and profit
+        An example for this command would be:
+        "$portfolio"
+
+        @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
+        """
+        await self.cmd_function.portfolio.display_portfolio(ctx, fiat)
+
+    @commands.command(name='pf', pass_context=True, hidden=True)
+    async def pf(self, ctx, fiat='USD'):
+        """
+        Shortcut for $portfolio command.
+
+        @param fiat - desired fiat currency (i.e. 'EUR', 'USD')
+        """
+        await self.cmd_function.portfolio.display_portfolio(ctx, fiat)
@@ -0,0 +1,114 @@
+class HelpCache:
+    """
+    Keeps rendered help for every command so mistyped commands don't
+    render it again
+
+    Entries are keyed by command and prefix. The cache only has to be
+    cleared when the cogs are (re)loaded, because commands never change
+    otherwise.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.usage = {}
+        self.pages = {}
+        self.requests = 0
+        self.hits = 0
+
+    def invalidate(self):
+        """
+        Drops all rendered help
+        """
+        self.usage.clear()
+        self.pages.clear()
+
+    def build(self, prefix):
+        """
+        Renders the usage hint of every command for a prefix
+
+        @param prefix - command prefix to render the hints with
+        """
+        for command in set(self.bot.commands.values()):
+            self.usage[(command.qualified_name, prefix)] = _render_usage(command, prefix)
+
+    def get_usage(self, command, prefix):
+        """
+        Returns a short usage hint for a command
+
+        @param command - command to describe
+        @param prefix - command prefix the user types
+        @return - one message worth of usage text
+        """
+        key = (command.qualified_name, prefix)
+        usage = self.usage.get(key)
+        self.requests += 1
+        if usage is None:
+            usage = _render_usage(command, prefix)
+            self.usage[key] = usage
+        else:
+            self.hits += 1
+        return usage
+
+    def get_pages(self, ctx, command):
+        """
+        Returns the full help pages of a command
+
+        @param ctx - context of the command sent
+        @param command - command to describe
+        @return - list of help pages
+        """
+        key = (command.qualified_name, ctx.prefix)
+        pages = self.pages.get(key)
+        self.requests += 1
+        if pages is None:
+            pages = self.bot.formatter.format_help_for(ctx, command)
+            self.pages[key] = pages
+        else:
+            self.hits += 1
+        return pages
+
+
+def _render_usage(command, prefix):
+    usage = "`{}`\n".format(get_command_signature(command, prefix))
+    if command.short_doc:
+        usage += "{}\n".format(command.short_doc)
+    usage += ("Type `{}help {}` for more details."
+              "".format(prefix, command.qualified_name))
+    return usage
+
+
+def get_command_signature(command, prefix):
+    """
+    Builds the signature of a command the same way the help formatter
+    does
+
+    @param command - command to describe
+    @param prefix - command prefix the user types
+    @return - signature such as "$search [args...]"
+    """
+    parent = command.full_parent_name
+    if command.aliases:
+        aliases = '|'.join(command.aliases)
+        if parent:
+            result = ['{}{} [{}|{}]'.format(prefix, parent, command.name, aliases)]
+        else:
+            result = ['{}[{}|{}]'.format(prefix, command.name, aliases)]
+    elif parent:
+        result = ['{}{} {}'.format(prefix, parent, command.name)]
+    else:
+        result = [prefix + command.name]
+    for name, param in command.clean_params.items():
+        if param.default is not param.empty:
+            if isinstance(param.default, str):
+                should_print = param.default
+            else:
+                should_print = param.default is not None
+            if should_print:
+                result.append('[{}={}]'.format(name, param.default))
+            else:
+                result.append('[{}]'.format(name))
+        elif param.kind == param.VAR_POSITIONAL:
+            result.append('[{}...]'.format(name))
+        else:
+            result.append('<{}>'.format(name))
+    return ' '.join(result)
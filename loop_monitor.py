@@ -0,0 +1,148 @@
+from bot_logger import logger
+from bot_metrics import LOOP_LAG_QUANTILES, LOOP_LAG_SECONDS, LOOP_STALLS, metrics
+from collections import deque
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+
+HEARTBEAT_INTERVAL = 0.1
+LAG_THRESHOLD = 0.25
+LAG_WINDOW = 3000
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LoopMonitor:
+    """
+    Measures how late the event loop runs its callbacks
+
+    A task on the loop wakes up every interval and records how much
+    later than asked it woke up. A watchdog thread checks the last
+    wake up and, once the loop looks stuck, samples the stack of the
+    loop's thread so the warning logged afterwards says what was running.
+    """
+
+    def __init__(self, loop, interval=HEARTBEAT_INTERVAL,
+                 threshold=LAG_THRESHOLD, window=LAG_WINDOW):
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        self.lags = deque(maxlen=window)
+        self.task = None
+        self.thread = None
+        self.stopped = threading.Event()
+        self.loop_thread_id = None
+        self.last_beat = None
+        self.stall_stack = None
+        self.max_lag = 0.0
+        self.stalls = 0
+
+    def start(self):
+        """
+        Starts the heartbeat and the watchdog unless they're running
+        """
+        if not self.threshold:
+            return
+        if self.task is not None and not self.task.done():
+            return
+        self.stopped.clear()
+        self.task = self.loop.create_task(self._heartbeat())
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._watch,
+                                           name="loop-watchdog",
+                                           daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        Stops the heartbeat and the watchdog
+        """
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+
+    async def _heartbeat(self):
+        """
+        Wakes up every interval and records how late it was
+        """
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(now - self.last_beat - self.interval, 0.0)
+            self.last_beat = now
+            self._record(lag)
+
+    def _record(self, lag):
+        """
+        Stores a lag measurement and warns about a stall
+
+        @param lag - seconds the heartbeat woke up late
+        """
+        self.lags.append(lag)
+        LOOP_LAG_SECONDS.observe(lag)
+        if lag > self.max_lag:
+            self.max_lag = lag
+        stack, self.stall_stack = self.stall_stack, None
+        if lag < self.threshold:
+            return
+        self.stalls += 1
+        LOOP_STALLS.inc()
+        logger.warning("Event loop was blocked for {:.3f} seconds. "
+                       "Running at the time:\n{}"
+                       "".format(lag, stack or "(no stack sampled)"))
+
+    def _watch(self):
+        """
+        Samples the loop thread's stack while the heartbeat is overdue
+        """
+        check_every = self.threshold / 4
+        sample_after = self.interval + self.threshold / 2
+        sampled_beat = None
+        while not self.stopped.wait(check_every):
+            last_beat = self.last_beat
+            if last_beat is None or last_beat == sampled_beat:
+                continue
+            if time.perf_counter() - last_beat < sample_after:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            self.stall_stack = "".join(traceback.format_stack(frame))
+            sampled_beat = last_beat
+
+    def get_percentiles(self):
+        """
+        Returns lag percentiles over the recent window
+
+        @return - dict of quantile to lag in seconds
+        """
+        lags = sorted(self.lags)
+        if not lags:
+            return {}
+        return {quantile: lags[min(int(quantile * len(lags)), len(lags) - 1)]
+                for quantile in QUANTILES}
+
+    def collect_metrics(self):
+        """
+        Copies the recent lag percentiles into the metrics
+        """
+        for quantile, lag in self.get_percentiles().items():
+            LOOP_LAG_QUANTILES.set(lag, quantile=str(quantile))
+
+
+def create_monitor(loop, interval=HEARTBEAT_INTERVAL, threshold=LAG_THRESHOLD):
+    """
+    Creates a monitor whose percentiles show up in the metrics
+
+    @param loop - event loop to watch
+    @param interval - seconds between heartbeats
+    @param threshold - lag in seconds that gets logged, 0 disables the monitor
+    @return - the monitor
+    """
+    monitor = LoopMonitor(loop, interval, threshold)
+    metrics.add_collector(monitor.collect_metrics)
+    return monitor
@@ -0,0 +1,74 @@
+from bot_logger import logger
+from cogs.modules.coin_market import CoinMarket
+from shared_snapshot import (SHARED_SNAPSHOT_FILE, SHARED_SNAPSHOT_SIZE,
+                             SharedSnapshotWriter)
+import asyncio
+import datetime
+import json
+import time
+
+
+class MarketFetcher:
+    """
+    Fetches the market for every shard of the bot
+
+    Only this process talks to CoinMarketCap. Each snapshot is published
+    to a memory-mapped file the shards read, so the API cost stays the
+    same however many shards run.
+    """
+
+    def __init__(self, config_data):
+        self.coin_market = CoinMarket(config_data["cmc_api_key"],
+                                      config_data.get("cmc_api_url"))
+        self.writer = SharedSnapshotWriter(config_data.get("shared_snapshot_file",
+                                                           SHARED_SNAPSHOT_FILE),
+                                           config_data.get("shared_snapshot_size",
+                                                           SHARED_SNAPSHOT_SIZE))
+
+    async def _publish(self, minute):
+        """
+        Fetches the market and hands it to the shards
+
+        @param minute - the minute the clock is at, None when off schedule
+        """
+        try:
+            market_stats, currency_data = await self.coin_market.fetch_market()
+            generation = self.writer.publish({"minute": minute,
+                                              "timestamp": time.time(),
+                                              "market_stats": market_stats,
+                                              "currency_data": currency_data})
+            logger.info("Published market snapshot {}.".format(generation))
+        except Exception as e:
+            print("Failed to publish market. See error.log.")
+            logger.error("Exception: {}".format(str(e)))
+
+    async def run(self):
+        """
+        Publishes the market right away and then every hour
+        """
+        await self._publish(None)
+        print("Market fetcher is running.")
+        while True:
+            now = datetime.datetime.now()
+            if now.minute == 0:
+                await self._publish(now.hour * 60)
+                await asyncio.sleep(60)
+            else:
+                await asyncio.sleep(20)
+
+
+def main():
+    with open('config.json') as config:
+        config_data = json.load(config)
+    fetcher = MarketFetcher(config_data)
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(fetcher.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fetcher.writer.close()
+
+
+if __name__ == '__main__':
+    main()
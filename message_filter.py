@@ -0,0 +1,83 @@
+IGNORE = 0
+COMMAND = 1
+MENTION = 2
+
+
+class MessageFilter:
+    """
+    Decides as cheaply as possible whether a message is meant for the bot
+
+    Every prefix in use starts with one of a handful of characters, so
+    most chat is rejected by checking the first character against a set
+    without splitting or copying the message. Only messages that pass
+    look up the server's prefix.
+    """
+
+    def __init__(self, default_prefix, prefixes):
+        self.default_prefix = default_prefix
+        self.prefixes = prefixes
+        self.mention = None
+        self.first_chars = frozenset()
+        self.prefilter = True
+        self._rebuild()
+
+    def _rebuild(self):
+        """
+        Recomputes the set of characters a bot message can start with
+        """
+        prefixes = list(self.prefixes.values()) + [self.default_prefix]
+        # an empty prefix matches everything, so nothing can be skipped
+        self.prefilter = all(prefixes)
+        first_chars = set(prefix[:1] for prefix in prefixes)
+        if self.mention:
+            first_chars.add(self.mention[:1])
+        self.first_chars = frozenset(first_chars)
+
+    def set_bot_user(self, user_id):
+        """
+        Sets the id used to recognize mentions of the bot
+
+        @param user_id - id of the bot's user
+        """
+        self.mention = "<@{}>".format(user_id)
+        self._rebuild()
+
+    def set_prefix(self, server_id, prefix):
+        """
+        Sets the command prefix of a server
+
+        @param server_id - id of the server
+        @param prefix - new prefix for the server
+        """
+        self.prefixes[server_id] = prefix
+        self._rebuild()
+
+    def classify(self, content, server_id=None):
+        """
+        Classifies a message
+
+        @param content - content of the message
+        @param server_id - id of the server or None for direct messages
+        @return - (IGNORE, None), (MENTION, None) or (COMMAND, prefix)
+        """
+        if self.prefilter and content[:1] not in self.first_chars:
+            return IGNORE, None
+        if self.mention is not None and content.startswith(self.mention):
+            return MENTION, None
+        if server_id is None:
+            prefix = self.default_prefix
+        else:
+            prefix = self.prefixes.get(server_id, self.default_prefix)
+        if content.startswith(prefix):
+            return COMMAND, prefix
+        return IGNORE, None
+
+    def get_prefix(self, server_id=None):
+        """
+        Returns the command prefix used in a server
+
+        @param server_id - id of the server or None for direct messages
+        """
+        if server_id is None:
+            return self.default_prefix
+        return self.prefixes.get(server_id, self.default_prefix)
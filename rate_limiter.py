@@ -0,0 +1,146 @@
+import time
+
+
+USER_RATE = 0.5
+USER_BURST = 10
+GUILD_RATE = 5.0
+GUILD_BURST = 60
+SWEEP_BATCH = 32
+# commands that do work per coin or target they're given
+PER_ARGUMENT_COMMANDS = {"s", "search", "conv"}
+COMMAND_COSTS = {"history": 2, "portfolio": 2, "pf": 2}
+
+
+class TokenBuckets:
+    """
+    Token buckets for many keys, one float per key
+
+    Each key only stores the time at which its bucket will be full again
+    (the generic cell rate algorithm), so checking and spending tokens is
+    one dict lookup and a little arithmetic. A bucket that has refilled
+    holds no information and is dropped, either when it's next used or by
+    a sweep that checks a few keys on every call, which keeps memory
+    proportional to the keys active within the last burst/rate seconds.
+    """
+
+    def __init__(self, rate, burst, sweep_batch=SWEEP_BATCH):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.sweep_batch = sweep_batch
+        self.full_at = {}
+        self.sweep_keys = []
+        self.rejected = 0
+
+    def check(self, key, cost, now):
+        """
+        Works out whether the key can spend the tokens without spending
+        them
+
+        @param key - id the bucket belongs to
+        @param cost - tokens the call needs
+        @param now - current monotonic time
+        @return - the bucket's new full time if allowed, otherwise None
+        """
+        full_at = self.full_at.get(key, now)
+        if full_at < now:
+            full_at = now
+        full_at += cost/self.rate
+        if full_at - now > self.burst/self.rate:
+            return None
+        return full_at
+
+    def spend(self, key, full_at, now):
+        """
+        Stores the result of a successful check
+        """
+        self.full_at[key] = full_at
+        self._sweep(now)
+
+    def _sweep(self, now):
+        """
+        Drops a few buckets that have refilled completely
+        """
+        sweep_keys = self.sweep_keys
+        if not sweep_keys:
+            if len(self.full_at) <= self.sweep_batch:
+                return
+            self.sweep_keys = sweep_keys = list(self.full_at)
+        full_at = self.full_at
+        for _ in range(min(self.sweep_batch, len(sweep_keys))):
+            key = sweep_keys.pop()
+            if full_at.get(key, now) <= now:
+                full_at.pop(key, None)
+
+    def __len__(self):
+        return len(self.full_at)
+
+
+class CommandRateLimiter:
+    """Limits how fast commands are accepted per user and per server"""
+
+    def __init__(self, user_rate=USER_RATE, user_burst=USER_BURST,
+                 guild_rate=GUILD_RATE, guild_burst=GUILD_BURST):
+        self.users = TokenBuckets(user_rate, user_burst)
+        self.guilds = TokenBuckets(guild_rate, guild_burst)
+        self.allowed = 0
+        self.rejected_commands = {}
+
+    def allow(self, command, user_id, guild_id=None, cost=1, now=None):
+        """
+        Spends tokens for a command if both the user and the server have
+        enough left
+
+        @param command - name of the command, used for the rejection counts
+        @param user_id - id of the user who sent the command
+        @param guild_id - id of the server or None for direct messages
+        @param cost - tokens the command costs
+        @param now - current monotonic time (defaults to now)
+        @return - True if the command may run
+        """
+        if now is None:
+            now = time.monotonic()
+        cost = min(cost, self.users.burst, self.guilds.burst)
+        user_full_at = self.users.check(user_id, cost, now)
+        if user_full_at is None:
+            self.users.rejected += 1
+            self._count_rejection(command)
+            return False
+        if guild_id is not None:
+            guild_full_at = self.guilds.check(guild_id, cost, now)
+            if guild_full_at is None:
+                self.guilds.rejected += 1
+                self._count_rejection(command)
+                return False
+            self.guilds.spend(guild_id, guild_full_at, now)
+        self.users.spend(user_id, user_full_at, now)
+        self.allowed += 1
+        return True
+
+    def _count_rejection(self, command):
+        self.rejected_commands[command] = self.rejected_commands.get(command, 0) + 1
+
+    def stats(self):
+        """
+        Returns counters of allowed and rejected commands
+
+        @return - dict of counters
+        """
+        return {"allowed": self.allowed,
+                "rejected_user": self.users.rejected,
+                "rejected_guild": self.guilds.rejected,
+                "rejected_by_command": dict(self.rejected_commands),
+                "user_buckets": len(self.users),
+                "guild_buckets": len(self.guilds)}
+
+
+def command_cost(command, args):
+    """
+    Returns how many tokens a command costs
+
+    @param command - name of the command
+    @param args - arguments given to the command
+    @return - token cost
+    """
+    if command in PER_ARGUMENT_COMMANDS:
+        return max(1, len([arg for arg in args if arg]))
+    return COMMAND_COSTS.get(command, 1)
@@ -0,0 +1,109 @@
+from collections import Counter
+import asyncio
+import os
+import sys
+import threading
+
+
+SAMPLE_INTERVAL = 0.005
+MAX_DURATION = 120
+TOP_FUNCTIONS = 40
+
+
+class ProfilerBusyException(Exception):
+    """Exception raised when a profile is already being taken"""
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the event loop's thread from a background thread
+
+    The bot is never traced, only looked at every interval, so profiling
+    costs the same whatever the bot is doing and can be done while it
+    serves real traffic.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.running = False
+
+    async def profile(self, seconds):
+        """
+        Samples the event loop's thread for a while
+
+        @param seconds - how long to sample for
+        @return - Counter of collapsed stacks
+        """
+        if self.running:
+            raise ProfilerBusyException("A profile is already being taken.")
+        self.running = True
+        stacks = Counter()
+        stopped = threading.Event()
+        thread = threading.Thread(target=self._sample,
+                                  args=(threading.get_ident(), stacks, stopped),
+                                  name="sampling-profiler",
+                                  daemon=True)
+        try:
+            thread.start()
+            await asyncio.sleep(min(seconds, MAX_DURATION))
+        finally:
+            stopped.set()
+            thread.join()
+            self.running = False
+        return stacks
+
+    def _sample(self, thread_id, stacks, stopped):
+        """
+        Records the stack of a thread every interval until stopped
+
+        @param thread_id - id of the thread to sample
+        @param stacks - Counter the collapsed stacks are added to
+        @param stopped - event that ends sampling
+        """
+        while not stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append("{}:{}".format(os.path.basename(code.co_filename),
+                                            code.co_name))
+                frame = frame.f_back
+            stacks[";".join(reversed(names))] += 1
+
+
+def format_report(stacks, seconds, top=TOP_FUNCTIONS):
+    """
+    Summarizes a profile as top functions followed by collapsed stacks
+
+    The collapsed stacks can be fed as is to flamegraph.pl or speedscope.
+
+    @param stacks - Counter of collapsed stacks
+    @param seconds - how long was sampled
+    @param top - number of functions listed
+    @return - report text
+    """
+    total = sum(stacks.values())
+    own = Counter()
+    inclusive = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for name in set(frames):
+            inclusive[name] += count
+    lines = ["{} samples over {} seconds".format(total, seconds), ""]
+    if total:
+        lines.append("{:>7} {:>7}  function".format("self%", "total%"))
+        for name, count in own.most_common(top):
+            lines.append("{:>6.1f}% {:>6.1f}%  {}".format(count * 100 / total,
+                                                          inclusive[name] * 100 / total,
+                                                          name))
+        lines.append("")
+    lines.append("# collapsed stacks")
+    for stack, count in stacks.most_common():
+        lines.append("{} {}".format(stack, count))
+    return "\n".join(lines) + "\n"
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,95 @@
+from bot_logger import logger
+import asyncio
+
+
+DEFAULT_INTERVAL = 300
+REQUEST_TIMEOUT = 10
+
+
+class ServerCountReporter:
+    """
+    Reports the bot's server count to a bot listing site in the background
+
+    Count changes only record the latest value. A single task posts it
+    without blocking the event loop, at most once per interval, so a burst
+    of joins or leaves ends up as one request.
+    """
+
+    def __init__(self, loop, url, auth_token, interval=DEFAULT_INTERVAL,
+                 shard_id=None, shard_count=None):
+        self.loop = loop
+        self.url = url
+        self.auth_token = auth_token
+        self.interval = interval
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.session = None
+        self.task = None
+        self.pending = None
+        self.last_posted = None
+        self.last_post_time = None
+        self.posts = 0
+        self.failures = 0
+
+    def update(self, server_count):
+        """
+        Records a new server count and makes sure it will be posted
+
+        @param server_count - number of servers the bot is in
+        """
+        if not self.auth_token:
+            return
+        self.pending = server_count
+        if self.task is None or self.task.done():
+            self.task = self.loop.create_task(self._report())
+
+    async def _report(self):
+        """
+        Posts the latest count until the site is up to date
+        """
+        while self.pending != self.last_posted:
+            if self.last_post_time is not None:
+                wait = self.last_post_time + self.interval - self.loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            server_count = self.pending
+            self.last_post_time = self.loop.time()
+            try:
+                await asyncio.wait_for(self._post(server_count),
+                                       REQUEST_TIMEOUT)
+                self.last_posted = server_count
+                self.posts += 1
+            except Exception as e:
+                # the next count change tries again, still at most once
+                # per interval
+                self.failures += 1
+                logger.warning("Failed to report server count: {}".format(str(e)))
+                return
+
+    async def _post(self, server_count):
+        """
+        Sends the server count to the listing site
+        """
+        if self.session is None:
+            import aiohttp
+            self.session = aiohttp.ClientSession(loop=self.loop)
+        header = {'Authorization': '{}'.format(self.auth_token)}
+        payload = {'server_count': server_count}
+        if self.shard_count is not None:
+            payload['shard_id'] = self.shard_id
+            payload['shard_count'] = self.shard_count
+        async with self.session.post(self.url,
+                                     headers=header,
+                                     data=payload) as response:
+            if response.status >= 400:
+                raise Exception("HTTP {}".format(response.status))
+
+    async def close(self):
+        """
+        Stops reporting and closes the HTTP session
+        """
+        if self.task is not None:
+            self.task.cancel()
+        if self.session is not None:
+            self.session.close()
+            self.session = None
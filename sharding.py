@@ -0,0 +1,218 @@
+import asyncio
+import json
+import os
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+SHARD_ID = "--shard-id"
+SHARD_COUNT = "--shard-count"
+SHARD_DIRECTORY = "shards"
+LOCK_RETRY_DELAY = 0.01
+shard_id = None
+shard_count = None
+
+
+class ShardingException(Exception):
+    """Exception class for invalid shard options"""
+
+
+def parse_shard_args(argv):
+    """
+    Reads the shard options from the command line
+
+    @param argv - command line arguments
+    @return - (shard id, shard count), both None when not sharded
+    """
+    options = {}
+    for option in (SHARD_ID, SHARD_COUNT):
+        if option in argv:
+            index = argv.index(option)
+            try:
+                options[option] = int(argv[index + 1])
+            except (IndexError, ValueError):
+                raise ShardingException("{} needs a number.".format(option))
+    if not options:
+        return None, None
+    if len(options) != 2:
+        raise ShardingException("{} and {} must be given together."
+                                "".format(SHARD_ID, SHARD_COUNT))
+    if not 0 <= options[SHARD_ID] < options[SHARD_COUNT]:
+        raise ShardingException("{} must be between 0 and {} - 1."
+                                "".format(SHARD_ID, SHARD_COUNT))
+    return options[SHARD_ID], options[SHARD_COUNT]
+
+
+def configure(new_shard_id, new_shard_count):
+    """
+    Sets which shard this process is
+
+    @param new_shard_id - id of the shard or None when not sharded
+    @param new_shard_count - number of shards or None when not sharded
+    """
+    global shard_id, shard_count
+    if new_shard_count is not None and fcntl is None:
+        raise ShardingException("Sharding needs file locks, which this "
+                                "system doesn't support.")
+    shard_id = new_shard_id
+    shard_count = new_shard_count
+    if is_sharded():
+        os.makedirs(os.path.dirname(state_path("")), exist_ok=True)
+
+
+def is_sharded():
+    return shard_count is not None
+
+
+def is_primary():
+    """
+    Returns whether this process does the work shared by every shard,
+    such as archiving the market
+    """
+    return not shard_id
+
+
+def owns_server(server_id):
+    """
+    Returns whether Discord sends the events of a server to this shard
+
+    @param server_id - id of the server
+    """
+    if not is_sharded():
+        return True
+    return (int(server_id) >> 22) % shard_count == shard_id
+
+
+def state_path(filename):
+    """
+    Returns where a file only this process uses is kept, such as its log
+    or backups of the state it loaded
+
+    @param filename - name of the file
+    @return - path of the file for this shard
+    """
+    if not is_sharded():
+        return filename
+    return os.path.join(SHARD_DIRECTORY, str(shard_id), filename)
+
+
+class SharedFile:
+    """
+    JSON file of state that every shard reads and writes
+
+    Without sharding this just loads and saves the file. With sharding,
+    edit() holds a lock on the file and first picks up what other shards
+    saved, so shards never overwrite each other's changes. Data is always
+    replaced in place, so every module holding it sees the new contents.
+    """
+
+    def __init__(self, filename, on_refresh=None):
+        """
+        @param filename - path of the file
+        @param on_refresh - called after the data was replaced by what
+                            another shard saved
+        """
+        self.filename = filename
+        self.on_refresh = on_refresh
+        self.version = None
+
+    def _remember(self, stat):
+        self.version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def load(self):
+        """
+        Reads the file
+
+        @return - contents of the file
+        """
+        with open(self.filename) as infile:
+            self._remember(os.fstat(infile.fileno()))
+            return json.load(infile)
+
+    def save(self, data):
+        """
+        Replaces the file with new contents in one step, so readers never
+        see it half written
+
+        @param data - contents to save
+        """
+        tmp_filename = "{}.{}.tmp".format(self.filename, os.getpid())
+        with open(tmp_filename, 'w') as outfile:
+            json.dump(data,
+                      outfile,
+                      indent=4)
+        os.replace(tmp_filename, self.filename)
+        self._remember(os.stat(self.filename))
+
+    def refresh(self, data):
+        """
+        Replaces data with the contents of the file if another shard
+        saved it since it was last read
+
+        @param data - dict loaded from the file
+        @return - True if data was replaced
+        """
+        if not is_sharded():
+            return False
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return False
+        if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self.version:
+            return False
+        contents = self.load()
+        data.clear()
+        data.update(contents)
+        if self.on_refresh is not None:
+            self.on_refresh()
+        return True
+
+    def edit(self, data):
+        """
+        Locks the file for a change to data
+
+        async with shared_file.edit(data):
+            ...change data...
+            shared_file.save(data)
+
+        @param data - dict loaded from the file
+        """
+        return _SharedFileEdit(self, data)
+
+
+class _SharedFileEdit:
+    """Holds the lock of a SharedFile while data is being changed"""
+
+    def __init__(self, shared_file, data):
+        self.shared_file = shared_file
+        self.data = data
+        self.lock_file = None
+
+    async def __aenter__(self):
+        if not is_sharded():
+            return self.data
+        self.lock_file = open(self.shared_file.filename + ".lock", 'a')
+        try:
+            while True:
+                try:
+                    fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    # another shard or command is changing the file
+                    await asyncio.sleep(LOCK_RETRY_DELAY)
+            self.shared_file.refresh(self.data)
+        except BaseException:
+            # closing the file releases the lock
+            self.lock_file.close()
+            self.lock_file = None
+            raise
+        return self.data
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+        return False
@@ -0,0 +1,221 @@
+from bot_logger import logger
+import mmap
+import os
+import pickle
+import struct
+import time
+
+
+SHARED_SNAPSHOT_FILE = "market_shared.mmap"
+SHARED_SNAPSHOT_SIZE = 64 * 1024 * 1024
+MAGIC = b"CMBSNAP1"
+# magic, header sequence, generation, active buffer, buffer capacity, publish time
+HEADER = struct.Struct("<8sQQIQd")
+# buffer sequence, payload length
+BUFFER_HEADER = struct.Struct("<QQ")
+DATA_OFFSET = mmap.PAGESIZE
+READ_ATTEMPTS = 5
+
+
+class SharedSnapshotException(Exception):
+    """Exception class for the shared market snapshot"""
+
+
+def _buffer_offset(index, capacity):
+    return DATA_OFFSET + index * (BUFFER_HEADER.size + capacity)
+
+
+class SharedSnapshotWriter:
+    """
+    Publishes market snapshots into a memory-mapped file for the shards
+
+    The file holds two buffers. A snapshot is written into the one readers
+    aren't using and the header then points them at it, so readers never
+    wait for the writer. Every buffer and the header carry a sequence
+    number that is odd while they're being written, which lets a reader
+    notice it was overtaken and read again.
+
+    The buffers only grow. Restarting with a larger capacity moves the
+    current snapshot into the first buffer, whose position doesn't depend
+    on the capacity, before the header switches to the new layout.
+    """
+
+    def __init__(self, path=SHARED_SNAPSHOT_FILE, capacity=SHARED_SNAPSHOT_SIZE):
+        self.path = path
+        old_capacity = None
+        published = 0.0
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            header = os.read(fd, HEADER.size)
+            if len(header) == HEADER.size and header[:len(MAGIC)] == MAGIC:
+                # keep counting so shards notice the next snapshot
+                (_, self.seq, self.generation, self.active,
+                 old_capacity, published) = HEADER.unpack(header)
+                capacity = max(capacity, old_capacity)
+            else:
+                self.seq = self.generation = self.active = 0
+            self.capacity = capacity
+            size = _buffer_offset(2, capacity)
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        if not self.generation:
+            self._write_header(0.0)
+        elif capacity != old_capacity:
+            self._grow(old_capacity, published)
+
+    def _grow(self, old_capacity, published):
+        """
+        Switches an existing file to the larger buffers
+
+        @param old_capacity - buffer capacity the file was written with
+        @param published - publish time of the current snapshot
+        """
+        # an odd header keeps readers off the old layout while it's rewritten
+        self.seq += 1
+        HEADER.pack_into(self.map, 0, MAGIC, self.seq, self.generation,
+                         self.active, old_capacity, published)
+        if self.active:
+            old_offset = _buffer_offset(1, old_capacity)
+            length = BUFFER_HEADER.unpack_from(self.map, old_offset)[1]
+            start = old_offset + BUFFER_HEADER.size
+            self._write_buffer(0, self.map[start:start + length])
+            self.active = 0
+        # the second buffer now starts inside what used to be data
+        BUFFER_HEADER.pack_into(self.map, _buffer_offset(1, self.capacity), 0, 0)
+        self.seq += 1
+        HEADER.pack_into(self.map, 0, MAGIC, self.seq, self.generation,
+                         self.active, self.capacity, published)
+        logger.info("Grew the shared market snapshot buffers from {} to {} "
+                    "bytes.".format(old_capacity, self.capacity))
+
+    def _write_header(self, published):
+        self.seq += 1
+        HEADER.pack_into(self.map, 0, MAGIC, self.seq, self.generation,
+                         self.active, self.capacity, published)
+        self.seq += 1
+        HEADER.pack_into(self.map, 0, MAGIC, self.seq, self.generation,
+                         self.active, self.capacity, published)
+
+    def publish(self, snapshot):
+        """
+        Makes a snapshot the one the shards read
+
+        @param snapshot - picklable market data
+        @return - generation of the snapshot
+        """
+        payload = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.capacity:
+            raise SharedSnapshotException("Snapshot of {} bytes doesn't fit in "
+                                          "{} bytes.".format(len(payload), self.capacity))
+        target = 1 - self.active if self.generation else 0
+        self._write_buffer(target, payload)
+        self.generation += 1
+        self.active = target
+        self._write_header(time.time())
+        return self.generation
+
+    def _write_buffer(self, index, payload):
+        offset = _buffer_offset(index, self.capacity)
+        seq = BUFFER_HEADER.unpack_from(self.map, offset)[0]
+        if seq % 2:
+            seq += 1
+        BUFFER_HEADER.pack_into(self.map, offset, seq + 1, len(payload))
+        start = offset + BUFFER_HEADER.size
+        self.map[start:start + len(payload)] = payload
+        BUFFER_HEADER.pack_into(self.map, offset, seq + 2, len(payload))
+
+    def close(self):
+        self.map.close()
+
+
+class SharedSnapshotReader:
+    """
+    Reads the snapshots published by SharedSnapshotWriter
+
+    Checking for a new snapshot only reads the header from the mapping.
+    Snapshots are unpickled straight from the shared pages, without
+    reading the file or copying the payload first.
+    """
+
+    def __init__(self, path=SHARED_SNAPSHOT_FILE):
+        self.path = path
+        self.map = None
+
+    def _open(self):
+        try:
+            with open(self.path, 'rb') as snapshot_file:
+                self.map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # the fetcher hasn't created the file yet
+            self.map = None
+
+    def read(self, since=None):
+        """
+        Returns the latest snapshot if it's newer than a generation
+
+        @param since - generation already read, None for any
+        @return - (generation, snapshot) or None if there's nothing new
+        """
+        if self.map is None:
+            self._open()
+            if self.map is None:
+                return None
+        for _ in range(READ_ATTEMPTS):
+            magic, seq, generation, active, capacity, _ = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC or not generation or generation == since:
+                return None
+            if seq % 2:
+                time.sleep(0)
+                continue
+            if _buffer_offset(2, capacity) > len(self.map):
+                # the writer grew the file since it was mapped
+                self.close()
+                self._open()
+                if self.map is None:
+                    return None
+                continue
+            offset = _buffer_offset(active, capacity)
+            buffer_seq, length = BUFFER_HEADER.unpack_from(self.map, offset)
+            if buffer_seq % 2:
+                continue
+            start = offset + BUFFER_HEADER.size
+            try:
+                with memoryview(self.map) as view:
+                    with view[start:start + length] as payload:
+                        snapshot = pickle.loads(payload)
+            except Exception:
+                snapshot = None
+            if (BUFFER_HEADER.unpack_from(self.map, offset)[0] == buffer_seq
+                    and HEADER.unpack_from(self.map, 0)[1] == seq
+                    and snapshot is not None):
+                return generation, snapshot
+        logger.warning("Gave up reading the shared market snapshot after "
+                       "{} attempts.".format(READ_ATTEMPTS))
+        return None
+
+    def published(self):
+        """
+        Returns when the latest snapshot was published
+
+        @return - publish time as a timestamp, None if there's no snapshot
+        """
+        if self.map is None:
+            self._open()
+            if self.map is None:
+                return None
+        for _ in range(READ_ATTEMPTS):
+            magic, seq, generation, _, _, published = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC or not generation:
+                return None
+            if seq % 2 == 0 and HEADER.unpack_from(self.map, 0)[1] == seq:
+                return published
+            time.sleep(0)
+        return None
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
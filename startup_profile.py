@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+import importlib
+import time
+
+
+class StartupProfile:
+    """
+    Records how long each import and startup phase of the bot takes
+
+    Phases are timed even when profiling isn't requested so time-to-ready
+    can always be logged; the breakdown is only printed in
+    --startup-profile mode.
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Times the body of the with block as one phase
+
+        @param name - name of the phase
+        """
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.time() - started))
+
+    def time_import(self, module_name):
+        """
+        Imports a module and records how long it took
+
+        Modules already pulled in by an earlier import show up as ~0s.
+
+        @param module_name - dotted name of the module
+        """
+        with self.phase("import {}".format(module_name)):
+            importlib.import_module(module_name)
+
+    def elapsed(self):
+        """
+        Returns the seconds since the process started loading the bot
+        """
+        return time.time() - self.start_time
+
+    def report(self):
+        """
+        Returns the recorded phases as a table
+
+        @return - formatted report
+        """
+        width = max([len(name) for name, _ in self.phases] + [5])
+        lines = ["{:<{}}  {:>9}".format("Phase", width, "Seconds")]
+        for name, duration in self.phases:
+            lines.append("{:<{}}  {:>9.4f}".format(name, width, duration))
+        lines.append("{:<{}}  {:>9.4f}".format("Total", width, self.elapsed()))
+        return "\n".join(lines)
+
+
+profile = StartupProfile()